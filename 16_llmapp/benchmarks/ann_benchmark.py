@@ -0,0 +1,96 @@
+"""
+全件検索（FlatIndex）と近似最近傍探索（IVFIndex）の検索時間と再現率を、ベクトル数を変えて比較します。
+エンベディングに似せて、多数の中心の周りに集まった合成のベクトル（長さ1）を使い、APIを呼ばずにローカルで実行します。
+再現率（recall@k）は、全件検索の上位k件のうちIVFの上位k件に含まれた割合です。
+nprobe（検索するリストの数）を変えて、再現率と検索時間の関係を表示します。
+
+1Mベクトルの場合、1536次元では6GBのメモリが必要なため、既定では128次元で測ります
+（検索時間は次元数にほぼ比例します）。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/ann_benchmark.py --sizes 10000,100000,1000000 --nprobe 4,8,16,32,64,128
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from common.flat_index import top_k
+from common.ivf_index import train_ivf, search_ivf, default_nlist
+
+# ベクトルを作成する単位（メモリの使用量を抑えるため）
+BATCH_SIZE = 100000
+
+def make_vectors(count, dimensions, centers, noise=0.6, seed=0):
+    """
+    中心（長さ約1）の周りに集まった、長さ1のfloat32のベクトルを作成します。
+    noise は中心からのずれの長さの目安です。
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.empty((count, dimensions), dtype=np.float32)
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        batch = centers[rng.integers(len(centers), size=size)]
+        batch = batch + noise / np.sqrt(dimensions) * rng.standard_normal((size, dimensions))
+        vectors[start:start + size] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
+    return vectors
+
+def percentiles(durations):
+    durations = sorted(durations)
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    return statistics.median(durations) * 1000, p99 * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="ベクトル数（カンマ区切り）")
+    parser.add_argument("--dimensions", type=int, default=128, help="次元数")
+    parser.add_argument("--queries", type=int, default=200, help="検索する質問の数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k のk")
+    parser.add_argument("--nlist", type=int, default=0, help="IVFのリストの数（0の場合はベクトル数から決める）")
+    parser.add_argument("--nprobe", default="4,8,16,32,64,128", help="検索するリストの数（カンマ区切り）")
+    parser.add_argument("--noise", type=float, default=2.0, help="ベクトルの中心からのずれ（大きいほど近似が難しい）")
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        rng = np.random.default_rng(size)
+        # 話題の数はベクトル数とともに増えるものとする
+        centers = rng.standard_normal((max(10, int(np.sqrt(size))), args.dimensions)) / np.sqrt(args.dimensions)
+        vectors = make_vectors(size, args.dimensions, centers, args.noise)
+        queries = make_vectors(args.queries, args.dimensions, centers, args.noise, seed=1)
+
+        started = time.perf_counter()
+        index = train_ivf(vectors, args.nlist or None)
+        build_seconds = time.perf_counter() - started
+        nlist = len(index[0])
+        print(f"ベクトル数: {size} / 次元数: {args.dimensions} / nlist: {nlist}"
+              f"（既定値 {default_nlist(size)}） / IVFの学習: {build_seconds:.1f}秒")
+
+        # 全件検索（正解）
+        expected = []
+        durations = []
+        for query in queries:
+            started = time.perf_counter()
+            expected.append(set(top_k(vectors @ query, args.k)))
+            durations.append(time.perf_counter() - started)
+        p50, p99 = percentiles(durations)
+        print(f"  全件検索: p50={p50:.2f}ms p99={p99:.2f}ms")
+
+        for nprobe in [int(n) for n in args.nprobe.split(",") if int(n) <= nlist]:
+            durations = []
+            found = 0
+            for query, answer in zip(queries, expected):
+                started = time.perf_counter()
+                rows, _ = search_ivf(vectors, *index, query, args.k, nprobe)
+                durations.append(time.perf_counter() - started)
+                found += len(answer & set(rows.tolist()))
+            p50, p99 = percentiles(durations)
+            print(f"  IVF nprobe={nprobe}: recall@{args.k}={found / (args.k * len(queries)):.3f} "
+                  f"p50={p50:.2f}ms p99={p99:.2f}ms")
+        del vectors
+
+if __name__ == '__main__':
+    main()
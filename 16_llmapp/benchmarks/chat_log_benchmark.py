@@ -0,0 +1,79 @@
+"""
+保存した履歴の一覧表示と読み込みの時間を、以前の形式（chat_logs/<thread_id>.json をスレッド毎に保存）と
+SQLiteのストア（ChatLogStore）で、保存したスレッドの数を変えて比較します。
+APIを呼ばずに、合成の会話を使ってローカルで実行します。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/chat_log_benchmark.py --threads 100,1000,10000 --turns 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage, AIMessage, messages_from_dict, messages_to_dict
+from original.chat_log import ChatLogStore
+
+# 時間を測る回数
+REPEAT = 20
+
+def conversation(thread, turns):
+    messages = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"スレッド{thread}の質問{turn}：有給休暇は何日取得できますか？"))
+        messages.append(AIMessage(content=f"回答{turn}：" + "就業規則に基づき、勤続年数に応じて付与されます。" * 5))
+    return messages
+
+def median_ms(run):
+    durations = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", default="100,1000,10000", help="保存したスレッドの数（カンマ区切り）")
+    parser.add_argument("--turns", type=int, default=10, help="スレッド1つあたりの往復の数")
+    args = parser.parse_args()
+
+    for count in [int(n) for n in args.threads.split(",")]:
+        directory = tempfile.mkdtemp(prefix="chat_log_benchmark-")
+        try:
+            store = ChatLogStore(os.path.join(directory, "chat_logs.db"))
+            for thread in range(count):
+                messages = conversation(thread, args.turns)
+                with open(os.path.join(directory, f"thread-{thread}.json"), "w", encoding="utf-8") as f:
+                    json.dump(messages_to_dict(messages), f, ensure_ascii=False, indent=2)
+                store.save(f"thread-{thread}", messages)
+            target = f"thread-{count // 2}"
+
+            def list_json():
+                return [f.replace(".json", "") for f in os.listdir(directory) if f.endswith(".json")]
+
+            def load_json():
+                with open(os.path.join(directory, f"{target}.json"), "r", encoding="utf-8") as f:
+                    return messages_from_dict(json.load(f))
+
+            print(f"スレッド数: {count}")
+            print(f"  一覧（JSON, listdir）: {median_ms(list_json):.2f}ms")
+            print(f"  一覧（SQLite, 1ページ＋件数）: {median_ms(lambda: (store.list_threads(), store.count_threads())):.2f}ms")
+            print(f"  読み込み（JSON）: {median_ms(load_json):.2f}ms")
+            print(f"  読み込み（SQLite）: {median_ms(lambda: store.load(target)):.2f}ms")
+            # 1往復増えた後の保存（JSONはファイル全体を書き直し、SQLiteは増えた分だけを追記）
+            longer = conversation(count // 2, args.turns + 1)
+            started = time.perf_counter()
+            store.save(target, longer)
+            print(f"  1往復増えた後の保存（SQLite）: {(time.perf_counter() - started) * 1000:.2f}ms")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+これまでのテキスト分割（CharacterTextSplitterの既定の設定）と、
+日本語の文と見出しを考慮したテキスト分割（JapaneseTextSplitter）を比較します。
+就業規則に似た合成データ（PDFのように一定の文字数で折り返したページ）を使い、APIを呼ばずにローカルで実行します。
+チャンクの数とトークン数の分布、分割にかかった時間に加えて、
+各条の様式名を質問したときに、その条の本文が途中で切れずに含まれるチャンクがk件以内に入った割合（BM25で検索）を表示します。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/chunking_benchmark.py --articles 300 --queries 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+from common.chunker import JapaneseTextSplitter, DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS
+from common.hybrid import BM25Index
+
+TOPICS = ["年次有給休暇", "賃金の支払", "時間外労働", "休職", "退職", "懲戒", "育児休業", "通勤手当", "出張旅費", "安全衛生"]
+SENTENCES = [
+    "従業員は、所定の様式により事前に所属長へ届け出なければならない。",
+    "会社は、必要に応じて本条の取扱いを変更することができる。",
+    "前項の規定にかかわらず、業務上やむを得ない場合はこの限りでない。",
+    "詳細は別に定める細則による。",
+]
+# PDFの1行の文字数と、1ページの条の数
+LINE_LENGTH = 35
+ARTICLES_PER_PAGE = 6
+
+def wrap(text):
+    return [text[start:start + LINE_LENGTH] for start in range(0, len(text), LINE_LENGTH)]
+
+def make_pages(count, seed=0):
+    """
+    章・条の見出しと本文からなる合成の就業規則を、PDFのページのように作成します。
+    各条の本文（答え）も返します。
+    """
+    rng = random.Random(seed)
+    pages = []
+    answers = {}
+    lines = []
+    for number in range(1, count + 1):
+        if number % 30 == 1:
+            lines.append(f"第{number // 30 + 1}章 {rng.choice(TOPICS)}")
+        topic = rng.choice(TOPICS)
+        answer = f"{topic}の申請は、様式{rng.choice('ABC')}-{number}により{rng.randint(1, 30)}日前までに行う。"
+        body = "".join(rng.sample(SENTENCES, rng.randint(1, 4)))
+        lines.append(f"第{number}条（{topic}）")
+        lines.extend(wrap(body + answer))
+        answers[number] = answer
+        if number % ARTICLES_PER_PAGE == 0 or number == count:
+            pages.append(Document(page_content="\n".join(lines), metadata={"source": "rules.pdf", "page": len(pages)}))
+            lines = []
+    return pages, answers
+
+def report(name, chunks, seconds, encoding):
+    tokens = sorted(len(encoding.encode(chunk.page_content)) for chunk in chunks)
+    p90 = tokens[min(len(tokens) - 1, int(len(tokens) * 0.9))]
+    print(f"{name}: チャンク数={len(chunks)} トークン数 min={tokens[0]} p50={statistics.median(tokens):.0f} "
+          f"p90={p90} max={tokens[-1]} / 分割時間={seconds * 1000:.1f}ms")
+
+def hit_rate(chunks, answers, numbers, k, encoding):
+    """
+    答えの本文がそのまま含まれるチャンクがk件以内に入った割合と、k件のチャンクの平均トークン数を返します。
+    """
+    index = BM25Index()
+    index.add([str(i) for i in range(len(chunks))], chunks)
+    hits = 0
+    context_tokens = []
+    for number in numbers:
+        # 答えに含まれる様式名で質問する
+        form = answers[number].split("様式")[1].split("により")[0]
+        results = [document for document, _ in index.search(f"様式{form}はいつまでに提出しますか？", k)]
+        hits += any(answers[number] in document.page_content.replace("\n", "") for document in results)
+        context_tokens.append(sum(len(encoding.encode(document.page_content)) for document in results))
+    return hits / len(numbers), statistics.mean(context_tokens)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=300, help="条の数")
+    parser.add_argument("--queries", type=int, default=200, help="検索する質問の数")
+    parser.add_argument("--k", type=int, default=4, help="返すチャンクの数")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="チャンクのトークン数の上限")
+    parser.add_argument("--overlap-tokens", type=int, default=DEFAULT_OVERLAP_TOKENS, help="チャンクの重なりのトークン数")
+    parser.add_argument("--model", default="gpt-4o-mini", help="トークン数を数えるモデル")
+    args = parser.parse_args()
+
+    encoding = tiktoken.encoding_for_model(args.model)
+    pages, answers = make_pages(args.articles)
+    print(f"ページ数: {len(pages)} / 条の数: {args.articles}")
+
+    splitters = {
+        "CharacterTextSplitter（これまでの既定）": CharacterTextSplitter.from_tiktoken_encoder(encoding.name),
+        "JapaneseTextSplitter": JapaneseTextSplitter(
+            encoding, chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens),
+    }
+    rng = random.Random(1)
+    numbers = [rng.randint(1, args.articles) for _ in range(args.queries)]
+    for name, splitter in splitters.items():
+        started = time.perf_counter()
+        chunks = splitter.split_documents(pages)
+        seconds = time.perf_counter() - started
+        report(name, chunks, seconds, encoding)
+        rate, context_tokens = hit_rate(chunks, answers, numbers, args.k, encoding)
+        print(f"  k={args.k}件以内に条の本文がそのまま含まれた割合: {rate:.0%} / "
+              f"LLMに渡すトークン数の平均: {context_tokens:.0f}")
+
+if __name__ == '__main__':
+    main()
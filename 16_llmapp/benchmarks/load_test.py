@@ -0,0 +1,97 @@
+"""
+同期版（Flask）と非同期版（ASGI）のアプリケーションに同時にリクエストを送り、スループットを比較します。
+ローカルの偽OpenAIサーバー（応答に遅延を入れる）を使うため、APIキーや課金は不要です。
+同期版はワーカーのスレッド数（--workers）までしか同時に処理できず、
+非同期版はモデルの応答を待つ間にも他のリクエストを処理できることを確認します。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/load_test.py --requests 200 --concurrency 50 --workers 8 --latency 0.5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.fake_openai import FakeOpenAIServer
+
+def report(name, durations, elapsed):
+    """
+    リクエスト数・スループット・レイテンシー（p50/p99）を表示します。
+    """
+    durations = sorted(durations)
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    print(f"{name}: {len(durations)}件 {elapsed:.2f}秒 "
+          f"{len(durations) / elapsed:.1f}件/秒 "
+          f"p50={statistics.median(durations) * 1000:.0f}ms p99={p99 * 1000:.0f}ms")
+
+def run_sync(flask_app, requests, workers):
+    """
+    Flaskアプリケーションに、ワーカー数のスレッドからリクエストを送ります。
+    """
+    def send(i):
+        started = time.perf_counter()
+        # ユーザー毎にセッション（thread_id）を分けるため、リクエスト毎にクライアントを作る
+        response = flask_app.test_client().post('/', data={'user_message': f"質問{i}"})
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        durations = list(executor.map(send, range(requests)))
+    return durations, time.perf_counter() - started
+
+async def run_async(asgi_app, requests, concurrency):
+    """
+    ASGIアプリケーションに、1つのイベントループから同時にリクエストを送ります。
+    """
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=asgi_app)
+
+    async def send(i):
+        async with semaphore:
+            started = time.perf_counter()
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                response = await client.post('/', data={'user_message': f"質問{i}"})
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    durations = await asyncio.gather(*(send(i) for i in range(requests)))
+    return durations, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="送るリクエストの数")
+    parser.add_argument("--concurrency", type=int, default=50, help="非同期版で同時に送るリクエストの数")
+    parser.add_argument("--workers", type=int, default=8, help="同期版のワーカーのスレッド数")
+    parser.add_argument("--latency", type=float, default=0.5, help="偽OpenAIサーバーの応答遅延（秒）")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        # アプリケーションを読み込む前に、接続先を偽OpenAIサーバーにする
+        os.environ['API_KEY'] = "test"
+        os.environ['OPENAI_BASE_URL'] = server.base_url
+        os.environ['WARMUP_ON_STARTUP'] = "0"
+        # PDFのインデックスやWeb検索を使わず、モデルの呼び出しだけを測る
+        os.environ['TOOLSET'] = "none"
+
+        from chatbot.app import create_app as create_flask_app
+        from chatbot.asgi import create_app as create_asgi_app
+
+        print(f"偽OpenAIサーバーの遅延: {args.latency}秒 / リクエスト数: {args.requests}")
+        durations, elapsed = run_sync(create_flask_app(warm=False), args.requests, args.workers)
+        report(f"同期（Flask, {args.workers}スレッド）", durations, elapsed)
+
+        durations, elapsed = asyncio.run(run_async(create_asgi_app(warm=False), args.requests, args.concurrency))
+        report(f"非同期（ASGI, 同時{args.concurrency}件）", durations, elapsed)
+        print(f"偽OpenAIサーバーが受けたチャットのリクエスト: {server.chat_requests}件")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+PDFをすべて読み込んでから分割する場合（DirectoryLoader + PyPDFLoader と同じ、1プロセスで順に解析）と、
+プロセスプールで並列に解析してページ毎に分割する場合（iter_pdf_pages）の、解析時間とメモリ使用量を比較します。
+合成のPDF（英数字のテキストのページ）を作成し、APIを呼ばずにローカルで実行します。
+メモリ使用量は、このプロセスでPythonが確保したメモリの最大値（tracemalloc）です
+（並列の場合、各ワーカーが保持するのは1タスク分のページだけです）。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/pdf_loading_benchmark.py --files 8 --pages 100 --workers 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pypdf
+from pypdf.generic import DictionaryObject, NameObject, DecodedStreamObject
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from common.pdf_loader import iter_pdf_pages
+from common.ingest import list_pdf_files
+
+# 1ページあたりの行数
+LINES_PER_PAGE = 50
+
+def write_pdf(path, pages):
+    """
+    pages の各要素（行のリスト）を1ページにしたPDFを作成します。
+    """
+    writer = pypdf.PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for lines in pages:
+        page = writer.add_blank_page(595, 842)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        content = DecodedStreamObject()
+        content.set_data(("BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET").encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    writer.write(path)
+
+def measure(name, run):
+    # tracemalloc は解析を遅くするため、時間とメモリは別々に測る
+    started = time.perf_counter()
+    chunks = run()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: {seconds:.2f}秒 / チャンク数={chunks} / メモリの最大={peak / 1024 / 1024:.1f}MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8, help="PDFの数")
+    parser.add_argument("--pages", type=int, default=100, help="PDF1つあたりのページ数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="解析するプロセスの数")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="pdf_loading_benchmark-")
+    try:
+        for n in range(args.files):
+            pages = [[f"Article {n}-{page}-{line}: employees shall follow the rules described in this section."
+                      for line in range(LINES_PER_PAGE)] for page in range(args.pages)]
+            write_pdf(os.path.join(directory, f"rules-{n}.pdf"), pages)
+        files = list_pdf_files(directory)
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        print(f"PDF: {args.files}ファイル x {args.pages}ページ / CPU数: {os.cpu_count()}")
+
+        def load_all():
+            # すべてのページを読み込んでから分割する
+            pages = [page for path in files.values() for page in PyPDFLoader(path).load()]
+            return len(splitter.split_documents(pages))
+
+        def stream(workers):
+            # 解析できたページから順に分割し、チャンクは保持しない（エンベディングに渡したものとする）
+            return sum(len(splitter.split_documents(pages)) for _, pages, _ in iter_pdf_pages(files, workers))
+
+        measure("すべて読み込んでから分割（1プロセス）", load_all)
+        measure("ページ毎に分割（1プロセス）", lambda: stream(1))
+        measure(f"ページ毎に分割（{args.workers}プロセス）", lambda: stream(args.workers))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+ベクトル検索だけの場合と、ハイブリッド検索（BM25 + ベクトル、RRFで融合）の検索時間を比較します。
+就業規則に似た合成データ（条番号付きのチャンク）を使い、APIを呼ばずにローカルで実行します。
+エンベディングは決定的な偽のベクトルのため、質問のエンベディングにかかる時間（両方で同じ）は含みません。
+参考として、条番号を含む質問で該当する条がk件以内に入った割合も表示します。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/retrieval_benchmark.py --chunks 5000 --queries 200
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from common.hybrid import BM25Index, HybridRetriever
+
+TOPICS = ["年次有給休暇", "賃金の支払", "時間外労働", "休職", "退職", "懲戒", "育児休業", "通勤手当", "出張旅費", "安全衛生"]
+SENTENCES = [
+    "従業員は、所定の様式により事前に所属長へ届け出なければならない。",
+    "会社は、必要に応じて本条の取扱いを変更することができる。",
+    "前項の規定にかかわらず、業務上やむを得ない場合はこの限りでない。",
+    "詳細は別に定める細則による。",
+]
+
+def make_corpus(count, seed=0):
+    """
+    条番号・見出し・本文からなる合成のチャンクを作成します。
+    """
+    rng = random.Random(seed)
+    documents = []
+    for number in range(1, count + 1):
+        topic = rng.choice(TOPICS)
+        body = "".join(rng.sample(SENTENCES, 2))
+        text = f"第{number}条（{topic}）{topic}について定める。{body}様式{rng.choice('ABC')}-{number % 50}を用いる。"
+        documents.append(Document(id=f"article-{number}", page_content=text, metadata={"article": number}))
+    return documents
+
+def measure(search, queries):
+    durations = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def report(name, durations):
+    durations = sorted(durations)
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    print(f"{name}: p50={statistics.median(durations) * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+
+def hit_rate(search, queries, answers):
+    hits = sum(answer in [d.id for d in search(query)] for query, answer in zip(queries, answers))
+    return hits / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="チャンクの数")
+    parser.add_argument("--queries", type=int, default=200, help="検索する質問の数")
+    parser.add_argument("--k", type=int, default=4, help="返すチャンクの数")
+    parser.add_argument("--dimensions", type=int, default=1536, help="エンベディングの次元数")
+    args = parser.parse_args()
+
+    documents = make_corpus(args.chunks)
+    ids = [d.id for d in documents]
+
+    # 同じチャンクからベクトルストアとキーワード検索のインデックスを作成
+    started = time.perf_counter()
+    db = Chroma(collection_name=f"benchmark-{uuid.uuid4().hex}",
+                embedding_function=DeterministicFakeEmbedding(size=args.dimensions))
+    for start in range(0, len(documents), 1000):
+        db.add_documents(documents[start:start + 1000], ids=ids[start:start + 1000])
+    vector_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    keyword_index = BM25Index()
+    keyword_index.add(ids, documents)
+    keyword_seconds = time.perf_counter() - started
+    print(f"チャンク数: {args.chunks} / 構築時間: ベクトル {vector_seconds:.1f}秒, BM25 {keyword_seconds:.2f}秒")
+
+    rng = random.Random(1)
+    numbers = [rng.randint(1, args.chunks) for _ in range(args.queries)]
+    queries = [f"第{number}条には何が書かれていますか？" for number in numbers]
+    answers = [f"article-{number}" for number in numbers]
+
+    hybrid = HybridRetriever(vectorstore=db, keyword_index=keyword_index, k=args.k)
+    searches = {
+        "ベクトル検索のみ": lambda query: db.similarity_search(query, k=args.k),
+        "BM25のみ": lambda query: [d for d, _ in keyword_index.search(query, args.k)],
+        "ハイブリッド（RRF）": hybrid.invoke,
+    }
+    for name, search in searches.items():
+        search(queries[0])  # ウォームアップ
+        report(name, measure(search, queries))
+
+    print(f"条番号の質問でk={args.k}件以内に該当の条が入った割合（偽エンベディングのため参考値）:")
+    for name, search in searches.items():
+        print(f"  {name}: {hit_rate(search, queries, answers):.0%}")
+
+if __name__ == '__main__':
+    main()
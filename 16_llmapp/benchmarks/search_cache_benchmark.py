@@ -0,0 +1,73 @@
+"""
+Web検索ツールの呼び出しにかかる時間を、キャッシュなしとキャッシュあり（CachedSearchTool）で比較します。
+Web検索の代わりに、指定した待ち時間で結果を返すローカルの検索（LocalSearchTool）を使い、APIを呼ばずに実行します。
+質問は少数の質問から偏りをつけて選び（同じ話題の検索が数分の間に繰り返される状況）、
+表記の揺れ（文末の記号・全角と半角）も加えます。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/search_cache_benchmark.py --requests 200 --queries 20 --latency 0.3
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.search_cache import SearchResultStore, CachedSearchTool, LocalSearchTool
+
+# 表記の揺れ
+VARIANTS = ["{}", "{}？", "{}。", " {} ", "{}?"]
+
+def make_requests(count, queries, seed=0):
+    """
+    質問の一覧を作ります。前の方の質問ほど多く選ばれます（Zipf分布に近い偏り）。
+    """
+    rng = random.Random(seed)
+    topics = [f"東京駅のイベント{n}" for n in range(queries)]
+    weights = [1 / (n + 1) for n in range(queries)]
+    return [rng.choice(VARIANTS).format(rng.choices(topics, weights)[0]) for _ in range(count)]
+
+def run(tool, requests):
+    durations = []
+    for query in requests:
+        started = time.perf_counter()
+        tool.invoke({"query": query})
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def report(name, durations):
+    durations = sorted(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    print(f"{name}: 合計={sum(durations):.1f}秒 p50={statistics.median(durations) * 1000:.1f}ms "
+          f"p95={p95 * 1000:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="検索の回数")
+    parser.add_argument("--queries", type=int, default=20, help="異なる質問の数")
+    parser.add_argument("--latency", type=float, default=0.3, help="Web検索1回の待ち時間（秒）")
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests, args.queries)
+    print(f"検索の回数: {args.requests} / 異なる質問の数: {args.queries} / 待ち時間: {args.latency}秒")
+
+    report("キャッシュなし", run(LocalSearchTool(latency=args.latency), requests))
+
+    directory = tempfile.mkdtemp(prefix="search_cache_benchmark-")
+    try:
+        local = LocalSearchTool(latency=args.latency)
+        store = SearchResultStore(os.path.join(directory, "search_cache.db"))
+        tool = CachedSearchTool(name=local.name, description=local.description, args_schema=local.args_schema,
+                                tool=local, store=store, scope="local:2")
+        report("キャッシュあり", run(tool, requests))
+        print(f"  Web検索の回数: {local.calls} / キャッシュの利用: {tool.hits}回")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+モジュールの読み込み（import）にかかる時間とメモリ使用量（最大RSS）を、新しいプロセスで測ります。
+graph.py は重い依存（OpenAI・Chroma・tiktoken・PDFの読み込み・Web検索など）を使うときに読み込むため、
+import だけではこれらを読み込まないことも確認します。
+--max-seconds / --max-rss-mb を超えた場合や、重い依存が読み込まれた場合は終了コード1を返すため、
+CIなどで起動時間の悪化を検出できます。
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/startup_benchmark.py --repeat 5 --max-seconds 2.0 --max-rss-mb 200
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# 16_llmappディレクトリ
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 測るモジュール
+MODULES = ["chatbot.graph", "original.graph", "chatbot.app", "original.app"]
+
+# import だけでは読み込まないはずの重い依存
+HEAVY_MODULES = ["chromadb", "langchain_chroma", "openai", "langchain_openai", "tiktoken",
+                 "pypdf", "langchain_community", "numpy", "langgraph.checkpoint.sqlite"]
+
+# 新しいプロセスで実行する計測用のコード
+MEASURE = """
+import sys, time, json, resource
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_mb, "heavy": heavy}}))
+"""
+
+def measure(module):
+    """
+    新しいプロセスで module を import し、時間・最大RSS・読み込まれた重い依存を返します。
+    """
+    # APIキーは使わないため、ダミーの値を設定する。ウォームアップ（グラフの作成）もしない
+    env = {**os.environ, "API_KEY": os.environ.get("API_KEY", "dummy"), "WARMUP_ON_STARTUP": "0"}
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=APP_DIRECTORY, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="1つのモジュールを測る回数（中央値を表示）")
+    parser.add_argument("--modules", default=",".join(MODULES), help="測るモジュール（カンマ区切り）")
+    parser.add_argument("--max-seconds", type=float, default=0, help="import時間の上限（秒）。0の場合は確認しない")
+    parser.add_argument("--max-rss-mb", type=float, default=0, help="最大RSSの上限（MB）。0の場合は確認しない")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules.split(","):
+        results = [measure(module) for _ in range(args.repeat)]
+        seconds = statistics.median(result["seconds"] for result in results)
+        rss_mb = statistics.median(result["rss_mb"] for result in results)
+        heavy = sorted({name for result in results for name in result["heavy"]})
+        print(f"{module}: import={seconds * 1000:.0f}ms 最大RSS={rss_mb:.0f}MB"
+              f" 重い依存={', '.join(heavy) if heavy else 'なし'}")
+        if heavy or (args.max_seconds and seconds > args.max_seconds) or (args.max_rss_mb and rss_mb > args.max_rss_mb):
+            print(f"  上限を超えたか、重い依存が読み込まれています: {module}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
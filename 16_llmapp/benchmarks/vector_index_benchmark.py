@@ -0,0 +1,114 @@
+"""
+ワーカー毎にChromaを開く場合と、書き出した読み取り専用のインデックス（FlatIndex）をmmapで開く場合の、
+ワーカー1つあたりの起動時間とメモリ使用量を比較します。
+合成のチャンクで永続化したChromaを作成して書き出し、複数のワーカープロセスを同時に起動して、
+それぞれがインデックスを開いて1回検索するまでの時間と、その時点のRSS・PSSを表示します。
+PSSは共有しているページをプロセス数で割った値で、mmapしたベクトルがワーカー間で共有されていることが分かります。
+（RSS・PSSはLinuxの /proc から読み取ります）
+
+使い方（16_llmappディレクトリで実行）:
+    python benchmarks/vector_index_benchmark.py --chunks 10000 --workers 4
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from common.flat_index import FlatIndex, export_flat_index
+
+def memory_usage():
+    """
+    このプロセスのRSS・共有していないメモリ（RssAnon）・PSSをMB単位で返します。
+    """
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon"):
+                values[name] = int(value.split()[0]) / 1024
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                values["Pss"] = int(line.split()[1]) / 1024
+    return values
+
+def worker(backend, directory, dimensions, queue, done):
+    """
+    インデックスを開いて1回検索し、かかった時間とメモリ使用量を報告します。
+    全ワーカーの報告が終わるまで終了せずに待ちます（同時に動いている状態のPSSを測るため）。
+    """
+    query = np.random.default_rng(0).standard_normal(dimensions).tolist()
+    embeddings = DeterministicFakeEmbedding(size=dimensions)
+    started = time.perf_counter()
+    if backend == "chroma":
+        db = Chroma(persist_directory=directory, embedding_function=embeddings)
+    else:
+        db = FlatIndex(directory, embeddings)
+    db.similarity_search_by_vector(query, k=4)
+    seconds = time.perf_counter() - started
+    queue.put({"seconds": seconds, **memory_usage()})
+    done.wait()
+
+def run_workers(backend, directory, dimensions, count):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    done = context.Event()
+    processes = [context.Process(target=worker, args=(backend, directory, dimensions, queue, done))
+                 for _ in range(count)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return results
+
+def report(name, results):
+    def median(key):
+        return statistics.median(result[key] for result in results)
+    print(f"{name}: 起動+初回検索 p50={median('seconds') * 1000:.0f}ms "
+          f"max={max(result['seconds'] for result in results) * 1000:.0f}ms / "
+          f"ワーカー1つあたり RSS={median('VmRSS'):.0f}MB 共有していないメモリ={median('RssAnon'):.0f}MB "
+          f"PSS={median('Pss'):.0f}MB / PSSの合計={sum(result['Pss'] for result in results):.0f}MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="チャンクの数")
+    parser.add_argument("--dimensions", type=int, default=1536, help="エンベディングの次元数")
+    parser.add_argument("--workers", type=int, default=4, help="同時に起動するワーカーの数")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="vector_index_benchmark-")
+    try:
+        started = time.perf_counter()
+        db = Chroma(persist_directory=directory, embedding_function=DeterministicFakeEmbedding(size=args.dimensions))
+        for start in range(0, args.chunks, 1000):
+            numbers = range(start, min(start + 1000, args.chunks))
+            db.add_documents([Document(page_content=f"第{n}条 合成のチャンク{n}") for n in numbers],
+                             ids=[f"chunk-{n}" for n in numbers])
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        export_flat_index(db, directory, "benchmark")
+        export_seconds = time.perf_counter() - started
+        del db
+        print(f"チャンク数: {args.chunks} / 次元数: {args.dimensions} / ワーカー数: {args.workers}")
+        print(f"Chromaの構築: {build_seconds:.1f}秒 / 書き出し: {export_seconds:.1f}秒")
+
+        report("Chroma", run_workers("chroma", directory, args.dimensions, args.workers))
+        report("FlatIndex（mmap）", run_workers("flat", directory, args.dimensions, args.workers))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -4,14 +4,15 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import uuid
-from flask import Flask, render_template, request, make_response, session 
-from chatbot.graph import get_bot_response, get_messages_list, memory
+import json
+from flask import Flask, Blueprint, Response, render_template, request, make_response, session, jsonify, stream_with_context
+from common.metrics import metrics, configure_trace_log, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from chatbot.graph import get_bot_response, stream_bot_response, get_messages_list, get_messages_since, memory, warm_up, startup_state
 
-# Flaskアプリケーションのセットアップ
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # セッション用の秘密鍵
+# ルートをまとめるBlueprint
+bp = Blueprint('chatbot', __name__)
 
-@app.route('/', methods=['GET', 'POST'])
+@bp.route('/', methods=['GET', 'POST'])
 def index():
 
     # セッションからthread_idを取得、なければ新しく生成してセッションに保存
@@ -20,15 +21,15 @@ def index():
 
     # GETリクエスト時は初期メッセージ表示
     if request.method == 'GET':
-        # メモリをクリア
-        memory.storage.clear()
+        # このユーザーのスレッドだけをメモリから削除
+        memory.delete_thread(session['thread_id'])
         # 対話履歴を初期化
         response = make_response(render_template('index.html', messages=[]))
         return response
 
     # ユーザーからのメッセージを取得
     user_message = request.form['user_message']
-    
+
     # ボットのレスポンスを取得（メモリに保持）
     get_bot_response(user_message, memory, session['thread_id'])
 
@@ -38,16 +39,101 @@ def index():
     # レスポンスを返す
     return make_response(render_template('index.html', messages=messages))
 
-@app.route('/clear', methods=['POST'])
+@bp.route('/stream', methods=['POST'])
+def stream():
+    """
+    ボットの応答をServer-Sent Events（SSE）でトークン毎に返します。
+    """
+    # セッションからthread_idを取得、なければ新しく生成してセッションに保存
+    if 'thread_id' not in session:
+        session['thread_id'] = str(uuid.uuid4())
+    thread_id = session['thread_id']
+
+    # ユーザーからのメッセージを取得
+    user_message = request.form['user_message']
+
+    def generate():
+        try:
+            for token in stream_bot_response(user_message, memory, thread_id):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    # バッファリングせずに逐次送信する
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@bp.route('/messages')
+def messages():
+    """
+    メッセージID（after）より後に追加されたメッセージだけをJSONで返します。
+    """
+    thread_id = session.get('thread_id')
+    if thread_id is None:
+        return jsonify({'messages': [], 'cursor': None, 'reset': False})
+    return jsonify(get_messages_since(memory, thread_id, request.args.get('after')))
+
+@bp.route('/clear', methods=['POST'])
 def clear():
     # セッションからthread_idを削除
-    session.pop('thread_id', None)
+    thread_id = session.pop('thread_id', None)
 
-    # メモリをクリア
-    memory.storage.clear()
+    # このユーザーのスレッドだけをメモリから削除
+    if thread_id is not None:
+        memory.delete_thread(thread_id)
     # 対話履歴を初期化
     response = make_response(render_template('index.html', messages=[]))
     return response
 
+@bp.route('/metrics')
+def metrics_endpoint():
+    # ノード・ツールの実行時間、トークン数、往復回数をPrometheusのテキスト形式で返す
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/ready')
+def ready():
+    # 起動時の準備が完了していればリクエストを受け付けられる
+    status = 200 if startup_state['ready'] else 503
+    return jsonify(startup_state), status
+
+# ===== アプリケーションの作成 =====
+def create_app(warm=None):
+    """
+    Flaskアプリケーションを作成します。
+    リクエストを受け付ける前に、グラフ・Retriever・トークナイザーを準備します。
+    環境変数 WARMUP_ON_STARTUP=0 で準備を省略できます（ツール類からの読み込み用）。
+    """
+    if warm is None:
+        warm = os.environ.get('WARMUP_ON_STARTUP', '1') != '0'
+
+    # Flaskアプリケーションのセットアップ
+    app = Flask(__name__)
+    app.secret_key = 'your_secret_key'  # セッション用の秘密鍵
+    app.register_blueprint(bp)
+
+    # リクエスト毎のトレースの書き出し先（環境変数 TRACE_LOG）
+    configure_trace_log()
+
+    # 起動時にグラフを準備（最初のユーザーを待たせない）
+    if warm:
+        warm_up(memory)
+    return app
+
+# アプリケーションは読み込み時には作らない（テストの収集などで準備やネットワークへの接続が走らないようにする）
+# 起動方法（16_llmappディレクトリで実行）:
+#   python chatbot/app.py
+#   flask --app "chatbot.app:create_app()" run
+#   gunicorn "chatbot.app:create_app()"
+# 以前の `flask --app chatbot.app run` や `gunicorn chatbot.app:app` も、初めて app を参照したときに作成して動く
+def __getattr__(name):
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # デバッグの自動再読み込みでは、ファイルを監視する親プロセスでは準備せず、アプリを動かす子プロセスだけで準備する
+    reloader_parent = os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    create_app(warm=False if reloader_parent else None).run(debug=True)
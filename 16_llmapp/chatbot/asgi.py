@@ -0,0 +1,156 @@
+# 非同期版のチャットボット（ASGIアプリケーション）
+# モデルやツールの応答を待つ間もワーカーを占有しないため、同時に多くのリクエストを処理できます。
+# 起動方法（16_llmappディレクトリで実行）:
+#   uvicorn chatbot.asgi:create_app --factory --port 5000
+#   uvicorn chatbot.asgi:app --port 5000（初めて app を参照したときに作成する）
+
+# VS Codeのデバッグ実行で `from chatbot.graph` でエラーを出さない対策
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uuid
+import json
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Route, Mount
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from common.metrics import metrics, configure_trace_log, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from chatbot.graph import aget_bot_response, astream_bot_response, get_messages_list, get_messages_since, memory, warm_up, startup_state
+
+# 実行中のスクリプトが存在するディレクトリ
+current_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Flask版と同じテンプレートを使う
+templates = Jinja2Templates(directory=f'{current_directory}/templates')
+# テンプレート内の url_for('static', filename=...) をFlaskと同じように解決する
+templates.env.globals['url_for'] = lambda endpoint, filename: f'/static/{filename}'
+
+def get_thread_id(request):
+    """
+    セッションからthread_idを取得し、なければ新しく生成してセッションに保存します。
+    """
+    if 'thread_id' not in request.session:
+        request.session['thread_id'] = str(uuid.uuid4())  # ユーザー毎にユニークなIDを生成
+    return request.session['thread_id']
+
+async def index(request):
+    thread_id = get_thread_id(request)
+
+    # GETリクエスト時は初期メッセージ表示
+    if request.method == 'GET':
+        # このユーザーのスレッドだけをメモリから削除
+        await memory.adelete_thread(thread_id)
+        return templates.TemplateResponse(request, 'index.html', {'messages': []})
+
+    # ユーザーからのメッセージを取得
+    form = await request.form()
+    user_message = form['user_message']
+
+    # ボットのレスポンスを取得（メモリに保持）
+    await aget_bot_response(user_message, memory, thread_id)
+
+    # メモリからメッセージの取得
+    messages = await run_in_threadpool(get_messages_list, memory, thread_id)
+
+    # レスポンスを返す
+    return templates.TemplateResponse(request, 'index.html', {'messages': messages})
+
+async def stream(request):
+    """
+    ボットの応答をServer-Sent Events（SSE）でトークン毎に返します。
+    """
+    thread_id = get_thread_id(request)
+
+    # ユーザーからのメッセージを取得
+    form = await request.form()
+    user_message = form['user_message']
+
+    async def generate():
+        try:
+            async for token in astream_bot_response(user_message, memory, thread_id):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    # バッファリングせずに逐次送信する
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=headers)
+
+async def messages(request):
+    """
+    メッセージID（after）より後に追加されたメッセージだけをJSONで返します。
+    """
+    thread_id = request.session.get('thread_id')
+    if thread_id is None:
+        return JSONResponse({'messages': [], 'cursor': None, 'reset': False})
+    after = request.query_params.get('after')
+    return JSONResponse(await run_in_threadpool(get_messages_since, memory, thread_id, after))
+
+async def clear(request):
+    # セッションからthread_idを削除
+    thread_id = request.session.pop('thread_id', None)
+
+    # このユーザーのスレッドだけをメモリから削除
+    if thread_id is not None:
+        await memory.adelete_thread(thread_id)
+    # 対話履歴を初期化
+    return templates.TemplateResponse(request, 'index.html', {'messages': []})
+
+async def metrics_endpoint(request):
+    # ノード・ツールの実行時間、トークン数、往復回数をPrometheusのテキスト形式で返す
+    return Response(metrics.render(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+async def ready(request):
+    # 起動時の準備が完了していればリクエストを受け付けられる
+    status = 200 if startup_state['ready'] else 503
+    return JSONResponse(startup_state, status_code=status)
+
+# ===== アプリケーションの作成 =====
+def create_app(warm=None):
+    """
+    ASGIアプリケーションを作成します。
+    起動時（lifespan）にグラフ・Retriever・トークナイザーを準備します。
+    環境変数 WARMUP_ON_STARTUP=0 で準備を省略できます。
+    """
+    if warm is None:
+        warm = os.environ.get('WARMUP_ON_STARTUP', '1') != '0'
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # 起動時にグラフを準備（最初のユーザーを待たせない）
+        if warm:
+            await run_in_threadpool(warm_up, memory)
+        yield
+
+    routes = [
+        Route('/', index, methods=['GET', 'POST']),
+        Route('/stream', stream, methods=['POST']),
+        Route('/messages', messages),
+        Route('/clear', clear, methods=['POST']),
+        Route('/ready', ready),
+        Route('/metrics', metrics_endpoint),
+        Mount('/static', StaticFiles(directory=f'{current_directory}/static'), name='static'),
+    ]
+    # リクエスト毎のトレースの書き出し先（環境変数 TRACE_LOG）
+    configure_trace_log()
+    middleware = [Middleware(SessionMiddleware, secret_key='your_secret_key')]  # セッション用の秘密鍵
+    return Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+# アプリケーションは読み込み時には作らない（Flask版の app.py と同じ）
+def __getattr__(name):
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(create_app(), port=5000)
@@ -1,61 +1,202 @@
 import os
+import time
+import asyncio
+from functools import partial
 from dotenv import load_dotenv
-import tiktoken
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain.tools.retriever import create_retriever_tool
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.graph import StateGraph
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langgraph.prebuilt import tools_condition
 from typing import Annotated
 from typing_extensions import TypedDict
+from common.embedding_cache import CachedEmbeddings
+from common.embedding_pipeline import embed_and_store
+from common.checkpoint import create_memory
+from common.context import ContextManager, get_encoding, DEFAULT_MAX_CONTEXT_TOKENS
+from common.tool_executor import create_tool_node
+from common.hybrid import BM25Index, HybridRetriever, KEYWORD_INDEX_FILENAME, retriever_settings
+from common.retrieval_cache import create_cached_retriever
+from common.metrics import RequestTracer
+from common.graph_registry import GraphRegistry, DEFAULT_MAX_GRAPHS
+from common.router import TurnRouter
+from common.chunker import JapaneseTextSplitter
+
+# 重い依存（OpenAI・Chroma・tiktoken・PDFの読み込み・Web検索など）は、使う関数の中で読み込む
+# （グラフやインデックスを作らない利用、例えばテストの収集や get_messages_list だけを使うツールの起動を速くする）
 
 # 環境変数を読み込む
 load_dotenv(".env")
 os.environ['OPENAI_API_KEY'] = os.environ['API_KEY']
 
-# 使用するモデル名
-MODEL_NAME = "gpt-4o-mini" 
+# 既定のモデル名（環境変数 MODEL_NAME で変更できる。get_graph() でほかのモデルも指定できる）
+MODEL_NAME = os.environ.get("MODEL_NAME", "gpt-4o-mini")
+
+# ツールセット: 名前 → 使うツールの名前
+TOOLSETS = {
+    "default": ("retrieve_company_rules", "tavily_search_results_json"),
+    "rules": ("retrieve_company_rules",),
+    "web": ("tavily_search_results_json",),
+    "none": (),
+}
+# 既定のツールセット（環境変数 TOOLSET で変更できる）
+TOOLSET = os.environ.get("TOOLSET", "default")
+
+# ツール毎の制限時間（秒）。間に合わなかったツールは結果なしとしてモデルに返す
+TOOL_TIMEOUTS = {"retrieve_company_rules": 10, "tavily_search_results_json": 15}
+
+# ベクトル検索の方式（環境変数 VECTOR_INDEX で選択）
+VECTOR_INDEX_TYPES = ("chroma", "flat", "ivf")
 
-# MemorySaverインスタンスの作成
-memory = MemorySaver()
+# チェックポインター（メモリ）の作成（環境変数 CHECKPOINT_DB があればSQLiteに保存）
+memory = create_memory()
 
-# グラフを保持する変数の初期化
-graph = None
+# 起動時の準備（ウォームアップ）の状態
+startup_state = {"ready": False, "error": None, "seconds": None}
 
 # ===== Stateクラスの定義 =====
 # Stateクラス: メッセージのリストを保持する辞書型
 class State(TypedDict):
     messages: Annotated[list, add_messages]
+    # 窓から外れた古い会話の要約と、要約済みのメッセージ数（要約を有効にした場合のみ）
+    summary: str
+    summarized_count: int
 
 # ===== インデックスの構築 =====
-def create_index(persist_directory, embedding_model):
+def create_text_splitter():
+    """
+    チャンクに分割する設定（文と見出しの区切りを保ち、トークン数の上限までまとめる）を作成します。
+    """
+    import tiktoken
+
+    return JapaneseTextSplitter(tiktoken.encoding_for_model(MODEL_NAME))
+
+def create_index(persist_directory, embedding_model, keyword_index=None, ingest_embedding_model=None):
+    """
+    インデックスを開き（なければ新規作成）、PDFの差分を取り込みます。
+    チャンクのエンベディングには ingest_embedding_model（省略時は embedding_model）を使います。
+    """
+    from common.ingest import open_vectorstore, sync_index
+    from common.pdf_loader import DEFAULT_MAX_WORKERS as DEFAULT_PARSE_WORKERS
+
     # 実行中のスクリプトのパスを取得
     current_script_path = os.path.abspath(__file__)
     # 実行中のスクリプトが存在するディレクトリを取得
     current_directory = os.path.dirname(current_script_path)
 
-    # テキストファイルを読込
-    loader = DirectoryLoader(f'{current_directory}/data/pdf', glob="./*.pdf",   loader_cls=PyPDFLoader)
-    documents = loader.load()
+    # チャンクに分割する設定
+    text_splitter = create_text_splitter()
+    encoding = text_splitter.encoding
 
-    # チャンクに分割
-    encoding_name = tiktoken.encoding_for_model(MODEL_NAME).name
-    text_splitter = CharacterTextSplitter.from_tiktoken_encoder(encoding_name)
-    texts = text_splitter.split_documents(documents)
+    # すべてのPDFの未登録のチャンクをトークン数で束ね、並列にエンベディングしてバッチ毎に書き込む
+    add_documents = partial(
+        embed_and_store,
+        embedding_model=ingest_embedding_model or embedding_model,
+        count_tokens=lambda text: len(encoding.encode(text)),
+    )
 
-    # 新規にIndexを構築
-    db = Chroma.from_documents(texts, embedding_model, persist_directory=persist_directory)
+    # Indexを開き（なければ新規作成）、追加・変更・削除されたPDFだけを反映
+    # keyword_index を渡した場合は、同じチャンクでキーワード検索のインデックスも更新する
+    # PDFは環境変数 PDF_PARSE_WORKERS 個（既定はCPU数）のプロセスで並列に解析する
+    # Chromaを開けない（壊れている）場合だけ作り直す
+    db = open_vectorstore(persist_directory, embedding_model)
+    sync_index(db, f'{current_directory}/data/pdf', text_splitter, persist_directory,
+               add_documents=add_documents, keyword_index=keyword_index,
+               max_workers=int(os.environ.get("PDF_PARSE_WORKERS", DEFAULT_PARSE_WORKERS)))
     return db
 
-def define_tools():
+def open_exported_index(persist_directory, embedding_model, index_type):
+    """
+    書き出し済みの読み取り専用インデックス（flat: 全件検索, ivf: 近似最近傍探索）をmmapで開きます。
+    IVFで検索するリストの数は環境変数 IVF_NPROBE で変更できます。
+    """
+    from common.flat_index import FlatIndex
+    from common.ivf_index import IVFIndex, DEFAULT_NPROBE
+
+    if index_type == "ivf":
+        return IVFIndex(persist_directory, embedding_model,
+                        nprobe=int(os.environ.get("IVF_NPROBE", DEFAULT_NPROBE)))
+    return FlatIndex(persist_directory, embedding_model)
+
+def load_exported_index(persist_directory, embedding_model, index_type):
+    """
+    書き出し済みのインデックスが最新のPDFと一致していれば、開いて返します。
+    書き出していない、またはPDFや分割方法が変わっている場合は None を返します。
+    """
+    from common.flat_index import FlatIndex
+    from common.ingest import load_manifest, index_version, is_up_to_date
+
+    # 実行中のスクリプトのパスを取得
+    current_script_path = os.path.abspath(__file__)
+    # 実行中のスクリプトが存在するディレクトリを取得
+    current_directory = os.path.dirname(current_script_path)
+
+    if not FlatIndex.exists(persist_directory):
+        return None
+    manifest = load_manifest(persist_directory)
+    if not is_up_to_date(f'{current_directory}/data/pdf', manifest, create_text_splitter()):
+        return None
+    try:
+        db = open_exported_index(persist_directory, embedding_model, index_type)
+    except FileNotFoundError:
+        # IVFのリストがまだ書き出されていない
+        return None
+    return db if db.index_version == index_version(manifest) else None
+
+def export_index(db, persist_directory, index_type):
+    """
+    Chromaのインデックスを読み取り専用の形式で書き出します。
+    IVFのリストの数は環境変数 IVF_NLIST で変更できます（未指定の場合はチャンク数から決める）。
+    """
+    from common.flat_index import export_flat_index
+    from common.ivf_index import export_ivf_index
+
+    export_flat_index(db, persist_directory, current_index_version())
+    if index_type == "ivf":
+        export_ivf_index(persist_directory, nlist=int(os.environ.get("IVF_NLIST", 0)) or None)
+
+# ===== エンベディングモデルの作成 =====
+def create_embedding_model(max_retries=None):
+    """
+    エンベディングモデルを作成します。
+    計算済みのベクトルはディスク上のキャッシュから再利用します。
+    max_retries を指定すると、OpenAIのクライアント自身のリトライ回数を変えます。
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    # 実行中のスクリプトのパスを取得
+    current_script_path = os.path.abspath(__file__)
+    # 実行中のスクリプトが存在するディレクトリを取得
+    current_directory = os.path.dirname(current_script_path)
+
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small",
+                         **({} if max_retries is None else {"max_retries": max_retries})),
+        f'{current_directory}/embedding_cache.db',
+    )
+
+def current_index_version():
+    """
+    取り込み済みのPDFから求めたインデックスのバージョンを返します（マニフェストが変わるまで再利用）。
+    """
+    from common.ingest import cached_index_version
+
+    # 実行中のスクリプトのパスを取得
+    current_script_path = os.path.abspath(__file__)
+    # 実行中のスクリプトが存在するディレクトリを取得
+    current_directory = os.path.dirname(current_script_path)
+
+    return cached_index_version(f'{current_directory}/chroma_db')
+
+def define_tools(embedding_model=None):
+    """
+    社内規程を検索するツールとWeb検索のツールを作成します。
+    エンベディングモデルを渡さない場合は作成します。
+    """
+    from langchain.tools.retriever import create_retriever_tool
+    from common.search_cache import create_search_tool
+    from common.ingest import index_lock
+
     # 実行中のスクリプトのパスを取得
     current_script_path = os.path.abspath(__file__)
     # 実行中のスクリプトが存在するディレクトリを取得
@@ -64,22 +205,48 @@ def define_tools():
     # インデックスの保存先
     persist_directory = f'{current_directory}/chroma_db'
     # エンベディングモデル
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-
-    if os.path.exists(persist_directory):
-        try:
-            # ストレージから復元
-            db = Chroma(persist_directory=persist_directory, embedding_function=embedding_model)
-            print("既存のインデックスを復元しました。")
-        except Exception as e:
-            print(f"インデックスの復元に失敗しました: {e}")
-            db = create_index(persist_directory, embedding_model)
-    else:
-        print(f"インデックスを新規作成します。")
-        db = create_index(persist_directory, embedding_model)
+    if embedding_model is None:
+        embedding_model = create_embedding_model()
+
+    # キーワード検索（BM25）のインデックスの保存先
+    keyword_index_path = f'{persist_directory}/{KEYWORD_INDEX_FILENAME}'
+
+    # 環境変数 VECTOR_INDEX が flat / ivf の場合は、書き出した読み取り専用のインデックスをmmapで開く
+    # （Chromaを開かないため、ワーカーが多くても起動が速く、ベクトルはワーカー間で共有される）
+    # flat は全件との比較、ivf は近いリストだけを比較する近似最近傍探索（チャンクが数万件を超える場合）
+    index_type = os.environ.get("VECTOR_INDEX", "chroma")
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"VECTOR_INDEX は {VECTOR_INDEX_TYPES} のいずれかを指定してください: {index_type}")
+    use_exported_index = index_type != "chroma"
+    db = load_exported_index(persist_directory, embedding_model, index_type) if use_exported_index else None
+
+    keyword_index = None
+    if db is None:
+        # 取り込み・書き出しは1つのワーカーだけが行い、ほかのワーカーは終わるのを待ってから書き出したものを開く
+        with index_lock(persist_directory):
+            if use_exported_index:
+                db = load_exported_index(persist_directory, embedding_model, index_type)
+            if db is None:
+                # ストレージから復元し、PDFの差分を取り込む（キーワード検索のインデックスも同時に更新）
+                # エンベディングやネットワークのエラーはそのまま送出し、保存済みのインデックスを残す（次回の起動で続きから取り込む）
+                keyword_index = BM25Index(keyword_index_path)
+                # 取り込みでは embed_and_store がリトライするため、クライアント自身のリトライは重ねない
+                db = create_index(persist_directory, embedding_model, keyword_index,
+                                  ingest_embedding_model=create_embedding_model(max_retries=0))
 
-    # Retrieverの作成
-    retriever = db.as_retriever()
+                if use_exported_index:
+                    # 取り込んだインデックスを書き出し、mmapで開き直す（ほかのワーカーはこのファイルを開く）
+                    export_index(db, persist_directory, index_type)
+                    db = open_exported_index(persist_directory, embedding_model, index_type)
+    if keyword_index is None:
+        # ほかのワーカーが更新した場合も含め、保存済みのキーワード検索のインデックスを開く
+        keyword_index = BM25Index(keyword_index_path)
+
+    # Retrieverの作成（ベクトル検索とキーワード検索の結果を融合）
+    # 返す件数・MMR・類似度の下限は環境変数 RETRIEVER_* で変更できる
+    retriever = HybridRetriever(vectorstore=db, keyword_index=keyword_index, **retriever_settings())
+    # 同じ質問の検索結果は、インデックスのバージョンが変わるまで再利用する
+    retriever = create_cached_retriever(retriever, current_index_version)
 
     retriever_tool = create_retriever_tool(
         retriever,
@@ -87,70 +254,317 @@ def define_tools():
         "Search and return company rules",
     )
 
-    # Web検索ツール
-    tavily_tool = TavilySearchResults(max_results=2)
+    # Web検索ツール（同じ質問の検索結果は、一定時間ワーカー間で共有して再利用する）
+    # 環境変数 SEARCH_BACKEND=local で、APIを呼ばないローカルの検索に切り替えられる
+    tavily_tool = create_search_tool(f'{current_directory}/search_cache.db', max_results=2)
 
     return [retriever_tool, tavily_tool]
 
 # ===== グラフの構築 =====
-def build_graph(model_name, memory):
+def build_graph(model_name, memory, tools=None,
+                max_context_tokens=DEFAULT_MAX_CONTEXT_TOKENS, summarize_history=False, response_cache=None,
+                route_simple_turns=False, simple_model_name=None):
     """
     グラフのインスタンスを作成し、ツールノードやチャットボットノードを追加します。
     モデル名とメモリを使用して、実行可能なグラフを作成します。
+    ツールを渡さない場合は define_tools() で作成します。
+    モデルに送る履歴は max_context_tokens トークン以内に収め、
+    summarize_history=True の場合は古い会話を要約して残します。
+    response_cache を渡した場合は、会話の最初の質問がほぼ同じであれば過去の回答を返します。
+    route_simple_turns=True の場合は、挨拶や計算などツールの要らない発言を、ツールを渡さない
+    モデル（simple_model_name を指定すればそのモデル）で回答します。
     """
+    from langchain_openai import ChatOpenAI
+
     # グラフのインスタンスを作成
     graph_builder = StateGraph(State)
 
     # ツールノードを作成（TavilySearchResultsを使用）
-    tools = define_tools()
-    tool_node = ToolNode(tools)
-    graph_builder.add_node("tools", tool_node)
+    if tools is None:
+        tools = define_tools()
+    # 1ターンの複数のツール呼び出しを並列に、ツール毎の制限時間内で実行する
+    # ツールがない場合（ツールセット none）は、ツールノードを作らない
+    if tools:
+        tool_node = create_tool_node(tools, TOOL_TIMEOUTS)
+        graph_builder.add_node("tools", tool_node)
 
     # チャットボットノードの作成
-    llm = ChatOpenAI(model_name=model_name)
-    llm_with_tools = llm.bind_tools(tools)
-    
+    # ストリーミングでもトークン数を受け取る（メトリクスに記録する）
+    llm = ChatOpenAI(model_name=model_name, stream_usage=True)
+    # ツールがない場合はツールを渡さない（OpenAIのAPIは空のツールの一覧を受け付けない）
+    llm_with_tools = llm.bind_tools(tools) if tools else llm
+
+    # 履歴の管理（古いツール結果の圧縮、窓掛け・要約）
+    context_manager = ContextManager(
+        get_encoding(model_name),
+        max_tokens=max_context_tokens,
+        summary_llm=llm if summarize_history else None,
+    )
+
+    # 回答のキャッシュは、モデル・ツール・インデックスのバージョン毎に分ける
+    # グラフは作り直さずに使い続けるため、インデックスのバージョンは確認・保存のたびに取得する
+    tool_names = "+".join(sorted(tool.name for tool in tools))
+
+    def cache_scope():
+        return f"{model_name}:{tool_names}:{current_index_version()}"
+
+    def cacheable_question(state: State):
+        """
+        会話の最初の質問であれば、その質問を返します。
+        続きの質問は前の会話に依存するため、キャッシュの対象にしません。
+        """
+        questions = [m for m in state["messages"] if isinstance(m, HumanMessage)]
+        return questions[0].content if len(questions) == 1 else None
+
+    def remember(state: State, response):
+        """
+        ツールを呼ばない最終回答をキャッシュに保存します。
+        """
+        if response_cache is not None and not response.tool_calls and response.content:
+            question = cacheable_question(state)
+            if question:
+                response_cache.store(question, cache_scope(), response.content)
+
     # チャットボットの実行方法を定義
     def chatbot(state: State):
-        return {"messages": [llm_with_tools.invoke(state["messages"])]}
+        messages, update = context_manager.prepare(state)
+        response = llm_with_tools.invoke(messages)
+        remember(state, response)
+        return {"messages": [response], **update}
+
+    # 非同期で実行する場合（ainvoke/astream）は、モデルの非同期クライアントを使う
+    async def achatbot(state: State):
+        messages, update = await context_manager.aprepare(state)
+        response = await llm_with_tools.ainvoke(messages)
+        await asyncio.to_thread(remember, state, response)
+        return {"messages": [response], **update}
     
-    graph_builder.add_node("chatbot", chatbot)
+    graph_builder.add_node("chatbot", RunnableLambda(chatbot, achatbot))
+
+    # ツールを使わない回答（ツールのスキーマを送らないため、入力のトークン数と応答時間を減らせる）
+    router = TurnRouter() if route_simple_turns else None
+    simple_llm = ChatOpenAI(model_name=simple_model_name, stream_usage=True) if simple_model_name else llm
+
+    def respond(state: State):
+        messages, update = context_manager.prepare(state)
+        response = simple_llm.invoke(messages)
+        remember(state, response)
+        return {"messages": [response], **update}
+
+    async def arespond(state: State):
+        messages, update = await context_manager.aprepare(state)
+        response = await simple_llm.ainvoke(messages)
+        await asyncio.to_thread(remember, state, response)
+        return {"messages": [response], **update}
+
+    def route_turn(state: State):
+        """
+        キャッシュの後（キャッシュなしの場合は入口）に進むノードを返します。
+        """
+        if router is not None and router(state) == "simple":
+            return "respond"
+        return "chatbot"
+
+    # キャッシュを確認する方法を定義（ヒットした場合はモデルを呼ばずに回答する）
+    def cache(state: State):
+        question = cacheable_question(state)
+        answer = response_cache.lookup(question, cache_scope()) if question else None
+        if answer is None:
+            return {}
+        return {"messages": [AIMessage(content=answer, response_metadata={"response_cache": "hit"})]}
+
+    def route_cache(state: State):
+        return END if isinstance(state["messages"][-1], AIMessage) else route_turn(state)
 
     # 実行可能なグラフの作成
-    graph_builder.add_conditional_edges(
-        "chatbot",
-        tools_condition,
-    )
-    graph_builder.add_edge("tools", "chatbot")
-    graph_builder.set_entry_point("chatbot")
+    if tools:
+        graph_builder.add_conditional_edges(
+            "chatbot",
+            tools_condition,
+        )
+        graph_builder.add_edge("tools", "chatbot")
+    else:
+        graph_builder.add_edge("chatbot", END)
+    targets = ["chatbot"]
+    if router is not None:
+        graph_builder.add_node("respond", RunnableLambda(respond, arespond))
+        graph_builder.add_edge("respond", END)
+        targets.append("respond")
+    if response_cache is not None:
+        graph_builder.add_node("cache", cache)
+        graph_builder.add_conditional_edges("cache", route_cache, targets + [END])
+        graph_builder.set_entry_point("cache")
+    elif router is not None:
+        graph_builder.set_conditional_entry_point(route_turn, targets)
+    else:
+        graph_builder.set_entry_point("chatbot")
     
     return graph_builder.compile(checkpointer=memory)
 
+# ===== グラフのレジストリ =====
+def build_registered_graph(model_name, memory, tools):
+    """
+    レジストリに保持するグラフを作成します。回答のキャッシュとエンベディングモデルはグラフ間で共有します。
+    """
+    from common.response_cache import create_response_cache
+
+    response_cache = graph_registry.shared(
+        "response_cache",
+        lambda: create_response_cache(graph_registry.shared("embedding_model", create_embedding_model)),
+    )
+    # 環境変数 ROUTER=1 で、ツールの要らない発言をツールなしの回答に振り分ける
+    # （ROUTER_MODEL を指定すると、その回答にはより小さいモデルを使う）
+    return build_graph(model_name, memory, tools, response_cache=response_cache,
+                       route_simple_turns=os.environ.get("ROUTER", "0") == "1",
+                       simple_model_name=os.environ.get("ROUTER_MODEL") or None)
+
+def create_shared_tools():
+    """
+    すべてのグラフで共有するツールを作成します（Chromaを開くのはプロセスで1回だけ）。
+    """
+    return define_tools(graph_registry.shared("embedding_model", create_embedding_model))
+
+# コンパイル済みのグラフを（モデル名, ツールセット, メモリ）毎に保持する
+# 保持するグラフの数の上限は環境変数 GRAPH_CACHE_MAX_ENTRIES で変更できる
+graph_registry = GraphRegistry(
+    build_registered_graph, create_shared_tools, TOOLSETS,
+    max_graphs=int(os.environ.get("GRAPH_CACHE_MAX_ENTRIES", DEFAULT_MAX_GRAPHS)),
+)
+
 # ===== グラフを実行する関数 =====
 def stream_graph_updates(graph: StateGraph, user_message: str, thread_id):
     """
     ユーザーからのメッセージを元に、グラフを実行し、チャットボットの応答をストリーミングします。
     """
-    response = graph.invoke(
-        {"messages": [("user", user_message)]},
-        {"configurable": {"thread_id": thread_id}},
-        stream_mode="values"
-    )
+    # ノード・ツールの実行時間とトークン数を記録する
+    with RequestTracer(thread_id) as tracer:
+        response = graph.invoke(
+            {"messages": [("user", user_message)]},
+            {"configurable": {"thread_id": thread_id}, "callbacks": [tracer]},
+            stream_mode="values"
+        )
     return response["messages"][-1].content
 
+# ===== 起動時の準備 =====
+def warm_up(memory):
+    """
+    起動時にトークナイザー・Retriever・グラフを準備し、最初のユーザーを待たせないようにします。
+    失敗した場合は状態を記録し、最初のリクエストで改めてグラフを作成します。
+    """
+    import tiktoken
+
+    started = time.perf_counter()
+    try:
+        # トークナイザー（tiktokenのエンコーディング）を読み込む
+        tiktoken.encoding_for_model(MODEL_NAME).encode("ウォームアップ")
+
+        # 既定のモデルとツールセットのグラフを作成（ツールはレジストリで共有される）
+        graph_registry.get(MODEL_NAME, TOOLSET, memory)
+
+        # Retrieverを一度実行し、インデックスとエンベディングの接続を準備
+        retriever_tool = next((tool for tool in graph_registry.tools(TOOLSET)
+                               if tool.name == "retrieve_company_rules"), None)
+        if retriever_tool is not None:
+            retriever_tool.invoke("ウォームアップ")
+    except Exception as e:
+        print(f"ウォームアップに失敗しました: {e}")
+        startup_state.update(ready=len(graph_registry) > 0, error=str(e))
+        return False
+
+    startup_state.update(ready=True, error=None, seconds=time.perf_counter() - started)
+    print(f"ウォームアップが完了しました（{startup_state['seconds']:.1f}秒）")
+    return True
+
+def get_graph(memory, model_name=None, toolset=None):
+    """
+    モデル名・ツールセット・メモリに対応するグラフを返します。
+    まだ作成されていない場合（ウォームアップ失敗時や、初めて使うモデルなど）は作成します。
+    省略した場合は既定のモデル（MODEL_NAME）とツールセット（TOOLSET）を使います。
+    """
+    graph = graph_registry.get(model_name or MODEL_NAME, toolset or TOOLSET, memory)
+    startup_state["ready"] = True
+    return graph
+
 # ===== 応答を返す関数 =====
-def get_bot_response(user_message, memory, thread_id):
+def get_bot_response(user_message, memory, thread_id, model_name=None, toolset=None):
     """
     ユーザーのメッセージに基づき、ボットの応答を取得します。
-    初回の場合、新しいグラフを作成します。
     """
-    global graph
-    # グラフがまだ作成されていない場合、新しいグラフを作成
-    if graph is None:
-        graph = build_graph(MODEL_NAME, memory)
-
     # グラフを実行してボットの応答を取得
-    return stream_graph_updates(graph, user_message, thread_id)
+    return stream_graph_updates(get_graph(memory, model_name, toolset), user_message, thread_id)
+
+# ===== 応答をトークン単位で返す関数 =====
+def response_token(chunk, metadata):
+    """
+    stream_mode="messages" で受け取ったメッセージのうち、ユーザーに返す本文を返します。
+    ツールの実行結果は返さず、chatbot・respondノードが生成した本文（キャッシュにヒットした場合はその回答）だけを返します。
+    """
+    if not chunk.content:
+        return None
+    node = metadata.get("langgraph_node")
+    if node in ("chatbot", "respond") and isinstance(chunk, AIMessageChunk):
+        return chunk.content
+    if node == "cache" and isinstance(chunk, AIMessage):
+        # キャッシュの回答はまとめて1回で返す
+        return chunk.content
+    return None
+
+def stream_bot_response(user_message, memory, thread_id, model_name=None, toolset=None):
+    """
+    ユーザーのメッセージに基づき、ボットの応答をトークン単位で順に返すジェネレーターです。
+    """
+    graph = get_graph(memory, model_name, toolset)
+    with RequestTracer(thread_id) as tracer:
+        for chunk, metadata in graph.stream(
+            {"messages": [("user", user_message)]},
+            {"configurable": {"thread_id": thread_id}, "callbacks": [tracer]},
+            stream_mode="messages"
+        ):
+            token = response_token(chunk, metadata)
+            if token:
+                yield token
+
+# ===== 非同期で応答を返す関数（ASGIアプリケーション用） =====
+async def aget_bot_response(user_message, memory, thread_id, model_name=None, toolset=None):
+    """
+    get_bot_response() の非同期版です。モデルやツールの応答を待つ間、スレッドを占有しません。
+    """
+    with RequestTracer(thread_id) as tracer:
+        response = await get_graph(memory, model_name, toolset).ainvoke(
+            {"messages": [("user", user_message)]},
+            {"configurable": {"thread_id": thread_id}, "callbacks": [tracer]},
+            stream_mode="values"
+        )
+    return response["messages"][-1].content
+
+async def astream_bot_response(user_message, memory, thread_id, model_name=None, toolset=None):
+    """
+    stream_bot_response() の非同期版です。
+    """
+    graph = get_graph(memory, model_name, toolset)
+    with RequestTracer(thread_id) as tracer:
+        async for chunk, metadata in graph.astream(
+            {"messages": [("user", user_message)]},
+            {"configurable": {"thread_id": thread_id}, "callbacks": [tracer]},
+            stream_mode="messages"
+        ):
+            token = response_token(chunk, metadata)
+            if token:
+                yield token
+
+# ===== メッセージを表示用に変換する関数 =====
+def format_message(message):
+    """
+    ユーザーとボットのメッセージを、表示用の辞書（id・class・text）に変換します。
+    表示しないメッセージの場合は None を返します。
+    """
+    if isinstance(message, HumanMessage):
+        # ユーザーからのメッセージ
+        return {'id': message.id, 'class': 'user-message', 'text': message.content.replace('\n', '<br>')}
+    elif isinstance(message, AIMessage) and message.content != "":
+        # ボットからのメッセージ（最終回答）
+        return {'id': message.id, 'class': 'bot-message', 'text': message.content.replace('\n', '<br>')}
+    return None
 
 # ===== メッセージの一覧を取得する関数 =====
 def get_messages_list(memory, thread_id):
@@ -161,10 +575,29 @@ def get_messages_list(memory, thread_id):
     # メモリからメッセージを取得
     memories = memory.get({"configurable": {"thread_id": thread_id}})['channel_values']['messages']
     for message in memories:
-        if isinstance(message, HumanMessage):
-            # ユーザーからのメッセージ
-            messages.append({'class': 'user-message', 'text': message.content.replace('\n', '<br>')})
-        elif isinstance(message, AIMessage) and message.content != "":
-            # ボットからのメッセージ（最終回答）
-            messages.append({'class': 'bot-message', 'text': message.content.replace('\n', '<br>')})
-    return messages
\ No newline at end of file
+        formatted = format_message(message)
+        if formatted is not None:
+            messages.append(formatted)
+    return messages
+
+# ===== 追加されたメッセージだけを取得する関数 =====
+def get_messages_since(memory, thread_id, after=None):
+    """
+    メッセージID after より後に追加されたメッセージだけを、表示用に変換して返します。
+    cursor は次回の after に渡すID（最後のメッセージのID）です。
+    after が見つからない場合（スレッドが消去された場合など）は、すべてのメッセージを返し reset を True にします。
+    """
+    checkpoint = memory.get({"configurable": {"thread_id": thread_id}})
+    memories = checkpoint['channel_values'].get('messages', []) if checkpoint else []
+    start = 0
+    reset = bool(after)
+    if after:
+        # 追加されたメッセージは末尾にあるため、後ろから探す
+        for position in range(len(memories) - 1, -1, -1):
+            if memories[position].id == after:
+                start = position + 1
+                reset = False
+                break
+    messages = [formatted for formatted in map(format_message, memories[start:]) if formatted is not None]
+    cursor = memories[-1].id if memories else None
+    return {'messages': messages, 'cursor': cursor, 'reset': reset}
\ No newline at end of file
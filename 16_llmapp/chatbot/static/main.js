@@ -1,19 +1,135 @@
 window.onload = function() {
   // チャットボックスを取得
   const chatBox = document.getElementById('chat-box');
-  
+
   // チャットボックスのスクロールを一番下に設定
   chatBox.scrollTop = chatBox.scrollHeight;
 
   // Ctrl + Enterでフォームを送信
   const form = document.getElementById('chat-form');
   const textarea = document.getElementById('user-input');
+  const submitButton = document.getElementById('submit-button');
+
+  // ストリーミングに対応していないブラウザでは通常のフォーム送信を使う
+  const canStream = window.fetch && window.ReadableStream && window.TextDecoder;
 
   textarea.addEventListener('keydown', function(event) {
       // Ctrl + Enterが押された場合
       if (event.ctrlKey && event.key === 'Enter') {
           event.preventDefault();  // デフォルトの動作（改行など）を防止
-          form.submit();  // フォームを送信
+          if (canStream) {
+              sendMessage();  // ストリーミングで送信
+          } else {
+              form.submit();  // フォームを送信
+          }
       }
   });
-}
\ No newline at end of file
+
+  if (canStream) {
+      form.addEventListener('submit', function(event) {
+          event.preventDefault();  // ページの再読み込みを防止
+          sendMessage();
+      });
+  }
+
+  // チャットボックスにメッセージを追加
+  function appendMessage(className, text) {
+      const message = document.createElement('div');
+      message.className = className + ' streamed-message';
+      message.textContent = text;
+      chatBox.appendChild(message);
+      chatBox.scrollTop = chatBox.scrollHeight;
+      return message;
+  }
+
+  // 前回受け取ったメッセージより後に追加されたメッセージだけを取得し、チャットボックスに追加
+  // （ストリーミング中に表示した仮のメッセージは、サーバーに保存されたメッセージに置き換える）
+  async function appendNewMessages() {
+      const after = chatBox.dataset.cursor || '';
+      const response = await fetch('/messages?after=' + encodeURIComponent(after));
+      const data = await response.json();
+      chatBox.querySelectorAll('.streamed-message').forEach(function(message) {
+          message.remove();
+      });
+      if (data.reset) {
+          chatBox.innerHTML = '';
+      }
+      data.messages.forEach(function(item) {
+          const message = document.createElement('div');
+          message.className = item.class;
+          message.innerHTML = item.text;
+          chatBox.appendChild(message);
+      });
+      chatBox.dataset.cursor = data.cursor || '';
+      chatBox.scrollTop = chatBox.scrollHeight;
+  }
+
+  // SSEのイベント（"event: ..." と "data: ..." の行）を解析
+  function parseEvent(rawEvent) {
+      let name = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach(function(line) {
+          if (line.startsWith('event:')) {
+              name = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+              data += line.slice(5).trim();
+          }
+      });
+      return { name: name, data: data ? JSON.parse(data) : {} };
+  }
+
+  // メッセージを送信し、ボットの応答をトークン毎に表示
+  async function sendMessage() {
+      const userMessage = textarea.value.trim();
+      if (!userMessage || submitButton.disabled) {
+          return;
+      }
+      appendMessage('user-message', userMessage);
+      const botMessage = appendMessage('bot-message', '');
+      textarea.value = '';
+      submitButton.disabled = true;
+      let completed = false;
+
+      try {
+          const response = await fetch('/stream', {
+              method: 'POST',
+              body: new URLSearchParams({ user_message: userMessage }),
+          });
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+
+          while (true) {
+              const { value, done } = await reader.read();
+              if (done) {
+                  break;
+              }
+              buffer += decoder.decode(value, { stream: true });
+
+              // 空行で区切られたイベントを順に処理
+              const events = buffer.split('\n\n');
+              buffer = events.pop();
+              events.forEach(function(rawEvent) {
+                  const event = parseEvent(rawEvent);
+                  if (event.name === 'error') {
+                      botMessage.textContent = 'エラーが発生しました: ' + event.data.error;
+                  } else if (event.name === 'done') {
+                      completed = true;
+                  } else if (event.data.token) {
+                      botMessage.textContent += event.data.token;
+                      chatBox.scrollTop = chatBox.scrollHeight;
+                  }
+              });
+          }
+          // 応答が完了したら、追加されたメッセージだけを取得して表示を揃える
+          if (completed) {
+              await appendNewMessages();
+          }
+      } catch (error) {
+          botMessage.textContent = 'エラーが発生しました: ' + error;
+      } finally {
+          submitButton.disabled = false;
+          textarea.focus();
+      }
+  }
+}
@@ -1,13 +1,29 @@
 import pytest
 from flask import session
-from chatbot.app import app
+from langgraph.checkpoint.base import empty_checkpoint
+from chatbot.app import create_app
 from chatbot.graph import memory, get_messages_list
 
 USER_MESSAGE_1 = "1たす2は？"
 USER_MESSAGE_2 = "東京駅のイベントの検索結果を教えて"
 
+def put_checkpoint(thread_id):
+    """
+    スレッドのチェックポイントを作成し、その設定を返します（モデルは呼ばない）。
+    """
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    memory.put(config, empty_checkpoint(), {}, {})
+    return config
+
+@pytest.fixture(scope="module")
+def app():
+    """
+    Flaskアプリケーションを作成（起動時の準備も行う）。テストの収集時には作成しない。
+    """
+    return create_app()
+
 @pytest.fixture
-def client():
+def client(app):
     """
     Flaskテストクライアントを作成。
     """
@@ -20,12 +36,38 @@ def client():
 
 def test_index_get_request(client):
     """
-    GETリクエストで初期画面が正しく表示されるかをテスト。
+    GETリクエストで初期画面が正しく表示され、このセッションのスレッドだけがメモリから削除されるかをテスト。
     """
+    with client.session_transaction() as session:
+        session['thread_id'] = 'test-index-get'
+    own = put_checkpoint('test-index-get')
+    other = put_checkpoint('test-index-get-other')
+
     response = client.get('/')
     assert response.status_code == 200, "GETリクエストに対してステータスコード200を返すべきです。"
     assert b"<form" in response.data, "HTMLにフォーム要素が含まれている必要があります。"
-    assert memory.storage == {}, "GETリクエストでメモリが初期化されるべきです。"
+    assert memory.get_tuple(own) is None, "GETリクエストでこのセッションのスレッドが削除されるべきです。"
+    assert memory.get_tuple(other) is not None, "ほかのスレッドは削除されるべきではありません。"
+    memory.delete_thread('test-index-get-other')
+
+def test_ready_endpoint(client):
+    """
+    起動時の準備が完了し、/readyエンドポイントが200を返すかをテスト。
+    """
+    response = client.get('/ready')
+    assert response.status_code == 200, "ウォームアップ後は/readyが200を返すべきです。"
+    assert response.get_json()['ready'] is True, "ウォームアップ後はready=Trueであるべきです。"
+
+def test_metrics_endpoint(client):
+    """
+    /metricsエンドポイントが、ノードの実行時間とトークン数をPrometheusの形式で返すかをテスト。
+    """
+    client.post('/', data={'user_message': USER_MESSAGE_1})
+    response = client.get('/metrics')
+    assert response.status_code == 200, "/metricsはステータスコード200を返すべきです。"
+    text = response.data.decode('utf-8')
+    assert 'chatbot_node_duration_seconds_count{node="chatbot"}' in text, "chatbotノードの実行時間が記録されるべきです。"
+    assert 'chatbot_tokens_total{type="prompt"}' in text, "トークン数が記録されるべきです。"
 
 def test_index_post_request(client):
     """
@@ -45,6 +87,24 @@ def test_index_post_request(client):
         thread_id = session.get('thread_id')
         assert thread_id is not None, "POSTリクエスト後にはセッションにthread_idが設定されているべきです。"
 
+def test_stream_endpoint(client):
+    """
+    /streamエンドポイントがボットの応答をSSEでトークン毎に返すかをテスト。
+    """
+    response = client.post('/stream', data={'user_message': USER_MESSAGE_1})
+    assert response.status_code == 200, "POSTリクエストに対してステータスコード200を返すべきです。"
+    assert response.mimetype == 'text/event-stream', "SSEのContent-Typeで返すべきです。"
+
+    decoded_data = response.data.decode('utf-8')
+    assert decoded_data.count('data: {"token"') >= 1, "トークンがイベントとして送信されるべきです。"
+    assert "event: done" in decoded_data, "最後に完了イベントが送信されるべきです。"
+    assert "3" in decoded_data, "ボットの応答が送信されるべきです。"
+
+    with client.session_transaction() as session:
+        thread_id = session.get('thread_id')
+    messages = get_messages_list(memory, thread_id)
+    assert any(msg['class'] == 'bot-message' for msg in messages), "ストリーミング後も応答がメモリに保存されるべきです。"
+
 def test_memory_persistence_with_session(client):
     """
     複数のPOSTリクエストでメモリがセッションごとに保持されるかをテスト。
@@ -61,6 +121,24 @@ def test_memory_persistence_with_session(client):
     assert any("1たす2" in msg['text'] for msg in messages if msg['class'] == 'user-message'), "メモリに最初のユーザーメッセージが保存されるべきです。"
     assert any("東京駅" in msg['text'] for msg in messages if msg['class'] == 'user-message'), "メモリに2番目のユーザーメッセージが保存されるべきです。"
 
+def test_messages_endpoint_returns_only_new_messages(client):
+    """
+    /messagesエンドポイントが、指定したメッセージより後に追加されたメッセージだけをJSONで返すかをテスト。
+    """
+    client.post('/', data={'user_message': USER_MESSAGE_1})
+    first = client.get('/messages').get_json()
+    assert any("1たす2" in msg['text'] for msg in first['messages']), "最初はすべてのメッセージを返すべきです。"
+    assert first['cursor'], "次回に渡すカーソルを返すべきです。"
+
+    client.post('/', data={'user_message': USER_MESSAGE_2})
+    second = client.get('/messages', query_string={'after': first['cursor']}).get_json()
+    assert second['reset'] is False
+    assert not any("1たす2" in msg['text'] for msg in second['messages']), "取得済みのメッセージは返さないべきです。"
+    assert any("東京駅" in msg['text'] for msg in second['messages']), "追加されたメッセージを返すべきです。"
+
+    third = client.get('/messages', query_string={'after': second['cursor']}).get_json()
+    assert third['messages'] == [], "追加がなければ空のリストを返すべきです。"
+
 def test_clear_endpoint(client):
     """
     /clearエンドポイントがセッションとメモリを正しくリセットするかをテスト。
@@ -0,0 +1,71 @@
+import pytest
+from starlette.testclient import TestClient
+from chatbot.asgi import create_app
+
+USER_MESSAGE_1 = "1たす2は？"
+USER_MESSAGE_2 = "東京駅のイベントの検索結果を教えて"
+
+@pytest.fixture
+def client():
+    """
+    ASGIアプリケーションのテストクライアントを作成（起動時の準備も実行）。
+    """
+    with TestClient(create_app()) as client:
+        yield client
+
+def test_index_get_request(client):
+    """
+    GETリクエストで初期画面が正しく表示されるかをテスト。
+    """
+    response = client.get('/')
+    assert response.status_code == 200, "GETリクエストに対してステータスコード200を返すべきです。"
+    assert "<form" in response.text, "HTMLにフォーム要素が含まれている必要があります。"
+    assert "/static/main.js" in response.text, "静的ファイルのURLが解決されるべきです。"
+
+def test_ready_endpoint(client):
+    """
+    起動時の準備が完了し、/readyエンドポイントが200を返すかをテスト。
+    """
+    response = client.get('/ready')
+    assert response.status_code == 200, "ウォームアップ後は/readyが200を返すべきです。"
+    assert response.json()['ready'] is True, "ウォームアップ後はready=Trueであるべきです。"
+
+def test_index_post_request(client):
+    """
+    POSTリクエストでボットの応答が正しく返されるかをテスト。
+    """
+    response = client.post('/', data={'user_message': USER_MESSAGE_1})
+    assert response.status_code == 200, "POSTリクエストに対してステータスコード200を返すべきです。"
+    assert "1たす2" in response.text, "ユーザーの入力がHTML内に表示されるべきです。"
+    assert "3" in response.text, "ボットの応答が正しくHTML内に表示されるべきです。"
+
+def test_stream_endpoint(client):
+    """
+    /streamエンドポイントがボットの応答をSSEでトークン毎に返すかをテスト。
+    """
+    response = client.post('/stream', data={'user_message': USER_MESSAGE_1})
+    assert response.status_code == 200, "POSTリクエストに対してステータスコード200を返すべきです。"
+    assert response.headers['content-type'].startswith('text/event-stream'), "SSEのContent-Typeで返すべきです。"
+    assert response.text.count('data: {"token"') >= 1, "トークンがイベントとして送信されるべきです。"
+    assert "event: done" in response.text, "最後に完了イベントが送信されるべきです。"
+
+def test_memory_persistence_with_session(client):
+    """
+    複数のPOSTリクエストで会話がセッションごとに保持されるかをテスト。
+    """
+    client.post('/', data={'user_message': USER_MESSAGE_1})
+    response = client.post('/', data={'user_message': USER_MESSAGE_2})
+    assert "1たす2" in response.text, "最初のユーザーメッセージが保持されるべきです。"
+    assert "東京駅" in response.text, "2番目のユーザーメッセージが表示されるべきです。"
+
+def test_clear_endpoint(client):
+    """
+    /clearエンドポイントが会話を正しくリセットするかをテスト。
+    """
+    client.post('/', data={'user_message': USER_MESSAGE_1})
+    response = client.post('/clear')
+    assert response.status_code == 200, "POSTリクエストに対してステータスコード200を返すべきです。"
+    assert "1たす2" not in response.text, "/clearエンドポイント後は会話が表示されるべきではありません。"
+
+    response = client.post('/', data={'user_message': USER_MESSAGE_2})
+    assert "1たす2" not in response.text, "/clearエンドポイント後は新しい会話として扱われるべきです。"
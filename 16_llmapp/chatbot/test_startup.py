@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+# 16_llmappディレクトリ
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import だけでは読み込まないはずの重い依存
+HEAVY_MODULES = ["chromadb", "langchain_chroma", "openai", "langchain_openai", "tiktoken",
+                 "pypdf", "langchain_community", "numpy", "langgraph.checkpoint.sqlite"]
+
+def loaded_heavy_modules(module):
+    """
+    新しいプロセスで module を import し、読み込まれた重い依存の一覧を返します。
+    """
+    code = f"import sys, json, {module}; print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    # 起動時の準備（WARMUP_ON_STARTUP）は既定のまま。アプリケーションは読み込み時に作られないため準備も走らない
+    env = {**os.environ, "API_KEY": "dummy", "TAVILY_API_KEY": "dummy"}
+    env.pop("WARMUP_ON_STARTUP", None)
+    # CHECKPOINT_DB がなければSQLiteのチェックポインターは読み込まない
+    env.pop("CHECKPOINT_DB", None)
+    output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIRECTORY, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@pytest.mark.parametrize("module", ["chatbot.graph", "original.graph", "chatbot.app", "original.app", "chatbot.asgi"])
+def test_graph_import_does_not_load_heavy_dependencies(module):
+    """
+    graph.py や app.py を import しただけでは、重い依存（OpenAI・Chroma・tiktoken・PDFの読み込みなど）を読み込まないかをテスト。
+    """
+    assert loaded_heavy_modules(module) == [], "重い依存は使う関数の中で読み込むべきです。"
+
+def test_original_import_does_not_create_chat_log_store(tmp_path):
+    """
+    original.graph や original.app を import しただけでは、保存した履歴のSQLiteファイルを作らないかをテスト。
+    """
+    path = tmp_path / "chat_logs" / "chat_logs.db"
+    env = {**os.environ, "API_KEY": "dummy", "TAVILY_API_KEY": "dummy", "CHAT_LOG_DB": str(path)}
+    subprocess.run([sys.executable, "-c", "import original.app"], cwd=APP_DIRECTORY, env=env, check=True)
+    assert not path.parent.exists(), "履歴のストアは初めて使うときに作成するべきです。"
+
+@pytest.mark.parametrize("module", ["chatbot.app", "original.app", "chatbot.asgi"])
+def test_app_is_created_on_first_access(module):
+    """
+    import しただけではアプリケーションを作らず、`gunicorn chatbot.app:app` のように app を参照したときに一度だけ作るかをテスト。
+    """
+    code = (f"import {module} as m; created = 'app' in vars(m); app = m.app; "
+            f"print(created, app is m.app, hasattr(app, '__call__'))")
+    env = {**os.environ, "API_KEY": "dummy", "TAVILY_API_KEY": "dummy", "WARMUP_ON_STARTUP": "0"}
+    output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIRECTORY, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "True", "True"], "app は初めて参照したときに一度だけ作るべきです。"
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from langgraph.checkpoint.memory import MemorySaver
+
+# スレッドを保持する時間（秒）。最後の更新からこの時間を過ぎたスレッドは削除する
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+# プロセス内に保持するスレッド数の上限
+DEFAULT_MAX_THREADS = 1000
+
+# ===== 上限付きのMemorySaver =====
+class BoundedMemorySaver(MemorySaver):
+    """
+    プロセス内に会話を保持するMemorySaverに、スレッド単位の削除と上限を加えたものです。
+    スレッド数が上限を超えると最も長く使われていないスレッドから削除し（LRU）、
+    一定時間使われていないスレッドも削除する（TTL）ため、メモリ使用量が増え続けません。
+    """
+
+    def __init__(self, max_threads=DEFAULT_MAX_THREADS, ttl_seconds=DEFAULT_TTL_SECONDS):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        # スレッドID → 最終利用時刻（古い順に並ぶ）
+        self._last_used = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, thread_id):
+        with self._lock:
+            self._last_used[thread_id] = time.monotonic()
+            self._last_used.move_to_end(thread_id)
+
+    def get_tuple(self, config):
+        result = super().get_tuple(config)
+        if result is not None:
+            self._touch(config["configurable"]["thread_id"])
+        return result
+
+    def put(self, config, *args, **kwargs):
+        result = super().put(config, *args, **kwargs)
+        self._touch(config["configurable"]["thread_id"])
+        self._evict()
+        return result
+
+    def _evict(self):
+        """
+        上限を超えた分と期限切れのスレッドを、古いものから削除します。
+        """
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for thread_id, last_used in self._last_used.items():
+                over_limit = len(self._last_used) - len(victims) > self.max_threads
+                expired = self.ttl_seconds and now - last_used > self.ttl_seconds
+                if not (over_limit or expired):
+                    break
+                victims.append(thread_id)
+        for thread_id in victims:
+            self.delete_thread(thread_id)
+
+    def delete_thread(self, thread_id):
+        """
+        指定したスレッドのチェックポイントと書き込みをすべて削除します。
+        """
+        self.storage.pop(thread_id, None)
+        for key in [key for key in list(self.writes) if key[0] == thread_id]:
+            self.writes.pop(key, None)
+        blobs = getattr(self, "blobs", None)
+        if blobs is not None:
+            for key in [key for key in list(blobs) if key[0] == thread_id]:
+                blobs.pop(key, None)
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+
+# ===== メモリの作成 =====
+def create_memory():
+    """
+    会話の状態を保持するチェックポインターを作成します。
+    環境変数 CHECKPOINT_DB にパスが設定されていればSQLiteに保存し、
+    なければプロセス内の上限付きMemorySaverを使います。
+    """
+    ttl_seconds = float(os.environ.get("CHECKPOINT_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    path = os.environ.get("CHECKPOINT_DB")
+    if path:
+        # langgraph-checkpoint-sqlite はSQLiteに保存する場合だけ使うため、ここで読み込む
+        from common.sqlite_checkpoint import SqliteCheckpointer
+        return SqliteCheckpointer(path, ttl_seconds=ttl_seconds)
+    max_threads = int(os.environ.get("MEMORY_MAX_THREADS", DEFAULT_MAX_THREADS))
+    return BoundedMemorySaver(max_threads=max_threads, ttl_seconds=ttl_seconds)
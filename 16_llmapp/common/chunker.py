@@ -0,0 +1,199 @@
+import re
+import math
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+# チャンク1つあたりのトークン数の上限
+DEFAULT_CHUNK_TOKENS = 300
+# 前のチャンクの末尾から引き継ぐトークン数の上限
+DEFAULT_OVERLAP_TOKENS = 40
+# 見出しで区切る前に、最低限ためておくトークン数（見出しだけの小さなチャンクを作らない）
+DEFAULT_MIN_CHUNK_TOKENS = 50
+
+# 章・節・条の見出し、【】や■で始まる見出し、（目的）のような括弧だけの行
+HEADING_PATTERN = re.compile(
+    r"^(第[0-9０-９一二三四五六七八九十百千]+[編章節条款]|【[^】]+】|[■◆●□]|[（(][^）)]{1,20}[）)]$)"
+)
+# 見出しだけの行とみなす文字数の上限
+MAX_HEADING_LENGTH = 40
+# 1. や（1）のような箇条書きの行
+LIST_ITEM_PATTERN = re.compile(r"^([0-9０-９]+[.．、)）]|[（(][0-9０-９一二三四五六七八九十]+[)）]|[・･])")
+# 文末（。！？と、それに続く閉じ括弧）
+SENTENCE_PATTERN = re.compile(r"[^。！？]*[。！？]+[」』）)]*|[^。！？]+$")
+# 長すぎる文を分ける位置（読点）
+CLAUSE_PATTERN = re.compile(r"[^、,]+[、,]*|[、,]+")
+
+# 文の前の区切りの種類（なし・改行・節の始まり）
+BREAK_NONE = 0
+BREAK_LINE = 1
+BREAK_SECTION = 2
+
+# ===== 文と見出しへの分割 =====
+def split_units(text):
+    """
+    テキストを (文, 前の区切りの種類) のリストに分けます。
+    PDFの行の折り返しはつなげ直し、見出し・箇条書き・空行・文末（。！？）で区切ります。
+    見出し（第○条など）で始まる文は節の始まり、箇条書きや段落の始まりは改行として扱います。
+    """
+    units = []
+    buffer = []
+    pending = BREAK_NONE
+
+    def flush():
+        nonlocal pending
+        paragraph = "".join(buffer)
+        buffer.clear()
+        for sentence in SENTENCE_PATTERN.findall(paragraph):
+            if sentence.strip():
+                units.append((sentence.strip(), pending))
+                pending = BREAK_NONE
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            flush()
+            pending = max(pending, BREAK_LINE)
+            continue
+        if HEADING_PATTERN.match(line):
+            flush()
+            pending = BREAK_SECTION
+        elif LIST_ITEM_PATTERN.match(line):
+            flush()
+            pending = max(pending, BREAK_LINE)
+        # 英単語の途中の折り返しでなければ、日本語は空白なしでつなげる
+        if buffer and buffer[-1][-1:].isascii() and line[:1].isascii():
+            buffer.append(" ")
+        buffer.append(line)
+        # 見出しだけの行（「第1条（目的）」など）は、本文とつなげずに1つの文にする
+        if pending == BREAK_SECTION and len(buffer) == 1 and len(line) <= MAX_HEADING_LENGTH and not line.endswith("。"):
+            flush()
+            pending = BREAK_LINE
+    flush()
+    return units
+
+# ===== 日本語の構造を考慮したテキスト分割 =====
+class JapaneseTextSplitter(TextSplitter):
+    """
+    日本語の文（。）と見出し（第○条など）の区切りを保ってチャンクに分けるテキスト分割です。
+    文をトークン数の上限までまとめ、見出しの位置では新しいチャンクを始めます。
+    各文はtiktokenで1回だけエンコードし、チャンクのトークン数は文のトークン数の合計で求めます
+    （求めたトークン数はメタデータの "tokens" に記録し、エンベディング時のバッチ分けに使います）。
+    """
+
+    def __init__(self, encoding, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                 min_chunk_tokens=DEFAULT_MIN_CHUNK_TOKENS):
+        super().__init__(chunk_size=chunk_tokens, chunk_overlap=overlap_tokens,
+                         length_function=lambda text: len(encoding.encode(text)))
+        self.encoding = encoding
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+
+    @property
+    def signature(self):
+        """
+        分割の設定を表す文字列です。設定が変わるとPDFを分割し直します（マニフェストに記録）。
+        """
+        encoding_name = getattr(self.encoding, "name", type(self.encoding).__name__)
+        return (f"{type(self).__name__}:{encoding_name}:"
+                f"{self.chunk_tokens}:{self.overlap_tokens}:{self.min_chunk_tokens}")
+
+    def _pieces(self, text):
+        """
+        テキストを (文, トークン数, 前の区切りの種類) のリストにします。
+        上限を超える長い文は、読点または文字数で分けます。
+        """
+        pieces = []
+        for unit, break_type in split_units(text):
+            tokens = len(self.encoding.encode(unit))
+            if tokens <= self.chunk_tokens:
+                pieces.append((unit, tokens, break_type))
+                continue
+            parts = []
+            for clause in CLAUSE_PATTERN.findall(unit):
+                clause_tokens = len(self.encoding.encode(clause))
+                if clause_tokens <= self.chunk_tokens:
+                    parts.append((clause, clause_tokens))
+                    continue
+                # 読点のない長い文は、トークン数の上限に収まる文字数で分ける
+                count = math.ceil(clause_tokens / self.chunk_tokens) + 1
+                size = math.ceil(len(clause) / count)
+                for start in range(0, len(clause), size):
+                    part = clause[start:start + size]
+                    parts.append((part, len(self.encoding.encode(part))))
+            for i, (part, part_tokens) in enumerate(parts):
+                pieces.append((part, part_tokens, break_type if i == 0 else BREAK_NONE))
+        return pieces
+
+    def _join(self, pieces):
+        """
+        文をつなげて (チャンク, トークン数) を返します。見出しや箇条書きの前では改行します。
+        """
+        text = ""
+        for piece, _, break_type in pieces:
+            if text and break_type != BREAK_NONE:
+                text += "\n"
+            text += piece
+        return text, sum(tokens for _, tokens, _ in pieces)
+
+    def _overlap(self, pieces):
+        """
+        前のチャンクの末尾から、重なりのトークン数に収まる文を返します。
+        """
+        overlap = []
+        total = 0
+        for piece in reversed(pieces[1:]):
+            if total + piece[1] > self.overlap_tokens:
+                break
+            overlap.insert(0, piece)
+            total += piece[1]
+        return overlap
+
+    def split_text_with_tokens(self, text):
+        """
+        テキストをチャンクに分け、(チャンク, トークン数) のリストを返します。
+        """
+        chunks = []
+        current = []
+
+        def tokens_of(pieces):
+            return sum(tokens for _, tokens, _ in pieces)
+
+        for piece in self._pieces(text):
+            _, tokens, break_type = piece
+            if break_type == BREAK_SECTION and tokens_of(current) >= self.min_chunk_tokens:
+                # 見出しから新しいチャンクを始める（前の節の文は引き継がない）
+                chunks.append(self._join(current))
+                current = []
+            elif current and tokens_of(current) + tokens > self.chunk_tokens:
+                # 末尾の見出し（本文がまだない節）は、次のチャンクの先頭に回す
+                start = len(current)
+                while start > 0 and current[start - 1][2] == BREAK_SECTION:
+                    start -= 1
+                heading = current[start:]
+                if start > 0:
+                    chunks.append(self._join(current[:start]))
+                carry = heading or self._overlap(current)
+                if tokens_of(carry) + tokens > self.chunk_tokens:
+                    # 見出しと次の文が上限に収まらない場合は、見出しだけで1チャンクにする
+                    if heading:
+                        chunks.append(self._join(heading))
+                    carry = []
+                current = carry
+            current.append(piece)
+        if current:
+            chunks.append(self._join(current))
+        return chunks
+
+    def split_text(self, text):
+        return [chunk for chunk, _ in self.split_text_with_tokens(text)]
+
+    def split_documents(self, documents):
+        """
+        Documentのリストをチャンクに分けます。メタデータに "tokens" を追加します。
+        """
+        return [
+            Document(page_content=chunk, metadata={**document.metadata, "tokens": tokens})
+            for document in documents
+            for chunk, tokens in self.split_text_with_tokens(document.page_content)
+        ]
@@ -0,0 +1,231 @@
+import json
+import threading
+from collections import OrderedDict
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage, trim_messages
+from langgraph.constants import TAG_NOSTREAM
+
+# 1回のリクエストでモデルに送る履歴のトークン数の上限
+DEFAULT_MAX_CONTEXT_TOKENS = 4000
+# 過去のターンのツール実行結果として残すトークン数の上限
+DEFAULT_MAX_TOOL_TOKENS = 300
+# 要約のトークン数の上限
+DEFAULT_MAX_SUMMARY_TOKENS = 500
+# メッセージ1件あたりの書式（役割など）のトークン数
+MESSAGE_OVERHEAD_TOKENS = 4
+# モデル名からエンコーディングが分からない場合に使うエンコーディング
+FALLBACK_ENCODING = "o200k_base"
+# トークン数を覚えておくメッセージの数
+DEFAULT_TOKEN_CACHE_SIZE = 4096
+
+SUMMARY_PROMPT = (
+    "あなたは会話の要約係です。これまでの要約と、新たに古くなった会話を合わせて、"
+    "以降の応答に必要な事実・ユーザーの意図・決定事項だけを日本語で簡潔に要約してください。"
+)
+
+# ===== トークン数の計算 =====
+def get_encoding(model_name):
+    """
+    モデルに対応するtiktokenのエンコーディングを返します。
+    """
+    # tiktokenは読み込みに時間がかかるため、最初に使うときに読み込む
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+def message_text(content):
+    """
+    メッセージの内容（文字列またはパーツのリスト）を文字列にします。
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+def _tool_call_texts(message):
+    return tuple(call["name"] + json.dumps(call["args"], ensure_ascii=False)
+                 for call in getattr(message, "tool_calls", None) or [])
+
+def count_tokens(messages, encoding):
+    """
+    メッセージのリストのおおよそのトークン数を数えます（ツール呼び出しの引数を含む）。
+    """
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + len(encoding.encode(message_text(message.content)))
+        for text in _tool_call_texts(message):
+            total += len(encoding.encode(text))
+    return total
+
+class TokenCounter:
+    """
+    メッセージ毎のトークン数を覚えておき、同じ内容のメッセージを数え直さない count_tokens です。
+    trim_messages は窓を広げながら何度も数えるため、毎回すべてを数えると履歴の長さの2乗の時間がかかります。
+    キーは内容（テキストとツール呼び出し）なので、切り詰めたツール結果のように内容が変わったメッセージは数え直します。
+    覚えておく数が上限を超えると、最も長く使われていないものから忘れます（LRU）。
+    """
+
+    def __init__(self, encoding, max_size=DEFAULT_TOKEN_CACHE_SIZE):
+        self.encoding = encoding
+        self.max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _message_tokens(self, message):
+        key = (message_text(message.content), _tool_call_texts(message))
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if tokens is not None:
+                self._tokens.move_to_end(key)
+                return tokens
+        tokens = count_tokens([message], self.encoding)
+        with self._lock:
+            self._tokens[key] = tokens
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+        return tokens
+
+    def __call__(self, messages):
+        return sum(self._message_tokens(message) for message in messages)
+
+def truncate_text(text, encoding, max_tokens):
+    """
+    テキストを max_tokens トークン以内に切り詰めます。
+    """
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + f"\n…（以下{len(tokens) - max_tokens}トークン省略）"
+
+# ===== 履歴の圧縮と窓掛け =====
+def compress_tool_messages(messages, encoding, max_tool_tokens=DEFAULT_MAX_TOOL_TOKENS):
+    """
+    最後のユーザー発言より前のターンのツール実行結果を max_tool_tokens トークンに切り詰めます。
+    現在のターンのツール実行結果はそのまま残します。
+    """
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    compressed = []
+    for i, message in enumerate(messages):
+        if i < last_human and isinstance(message, ToolMessage):
+            content = truncate_text(message_text(message.content), encoding, max_tool_tokens)
+            message = message.model_copy(update={"content": content})
+        compressed.append(message)
+    return compressed
+
+def window_messages(messages, encoding, max_tokens, token_counter=None):
+    """
+    直近のメッセージから max_tokens トークンに収まる範囲を、ユーザー発言から始まるように切り出します。
+    現在のターンだけで上限を超える場合も、現在のターンは必ず残します。
+    token_counter（TokenCounter）を渡すと、数えたトークン数をターンをまたいで再利用します。
+    """
+    window = trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=token_counter or TokenCounter(encoding),
+        strategy="last",
+        start_on="human",
+        include_system=True,
+        allow_partial=False,
+    )
+    if not window:
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        window = messages[last_human:]
+    return window
+
+def format_for_summary(messages, encoding, max_tool_tokens):
+    """
+    要約用に、メッセージのリストを「役割: 内容」の行に整形します。
+    """
+    lines = []
+    for message in messages:
+        text = message_text(message.content)
+        if isinstance(message, HumanMessage):
+            lines.append(f"ユーザー: {text}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"ツール結果: {truncate_text(text, encoding, max_tool_tokens)}")
+        elif isinstance(message, AIMessage) and text:
+            lines.append(f"アシスタント: {text}")
+    return "\n".join(lines)
+
+# ===== 履歴の管理 =====
+class ContextManager:
+    """
+    モデルに送る履歴をトークン数の上限内に収めます。
+    古いターンのツール実行結果を圧縮し、上限を超える古いターンは切り捨てるか、
+    summary_llm を渡した場合は要約して先頭にシステムメッセージとして付けます。
+    """
+
+    def __init__(self, encoding, max_tokens=DEFAULT_MAX_CONTEXT_TOKENS, max_tool_tokens=DEFAULT_MAX_TOOL_TOKENS,
+                 summary_llm=None, max_summary_tokens=DEFAULT_MAX_SUMMARY_TOKENS):
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.max_tool_tokens = max_tool_tokens
+        # 要約の途中経過がチャットの応答としてストリーミングされないようにする
+        self.summary_llm = summary_llm.with_config(tags=[TAG_NOSTREAM]) if summary_llm is not None else None
+        self.max_summary_tokens = max_summary_tokens
+        # メッセージ毎のトークン数（同じグラフを使うすべてのスレッドで共有する）
+        self.token_counter = TokenCounter(encoding)
+
+    def _split(self, state):
+        """
+        モデルに送る窓と、窓から外れたメッセージに分けます。
+        """
+        messages = compress_tool_messages(state["messages"], self.encoding, self.max_tool_tokens)
+        if self.summary_llm is None:
+            return window_messages(messages, self.encoding, self.max_tokens, self.token_counter), []
+        window = window_messages(messages, self.encoding, self.max_tokens - self.max_summary_tokens,
+                                 self.token_counter)
+        return window, messages[:len(messages) - len(window)]
+
+    def _with_summary(self, window, summary):
+        if summary:
+            return [SystemMessage(content=f"これまでの会話の要約:\n{summary}")] + window
+        return window
+
+    def prepare(self, state):
+        """
+        グラフの状態からモデルに送るメッセージのリストと、状態の更新（要約）を返します。
+        """
+        window, dropped = self._split(state)
+        summary = state.get("summary", "")
+        summarized_count = state.get("summarized_count", 0)
+        update = {}
+
+        # 新たに窓から外れたメッセージだけを、これまでの要約に追加して要約し直す
+        if len(dropped) > summarized_count:
+            summary = self.summarize(summary, dropped[summarized_count:])
+            update = {"summary": summary, "summarized_count": len(dropped)}
+        return self._with_summary(window, summary), update
+
+    async def aprepare(self, state):
+        """
+        prepare() の非同期版です。要約はモデルの非同期クライアントで作成します。
+        """
+        window, dropped = self._split(state)
+        summary = state.get("summary", "")
+        summarized_count = state.get("summarized_count", 0)
+        update = {}
+
+        if len(dropped) > summarized_count:
+            summary = await self.asummarize(summary, dropped[summarized_count:])
+            update = {"summary": summary, "summarized_count": len(dropped)}
+        return self._with_summary(window, summary), update
+
+    def _summary_request(self, summary, messages):
+        conversation = format_for_summary(messages, self.encoding, self.max_tool_tokens)
+        request = f"これまでの要約:\n{summary or '（なし）'}\n\n古くなった会話:\n{conversation}"
+        return [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=request)]
+
+    def summarize(self, summary, messages):
+        """
+        これまでの要約に messages の内容を加えた新しい要約を作成します。
+        """
+        response = self.summary_llm.invoke(self._summary_request(summary, messages))
+        return truncate_text(message_text(response.content), self.encoding, self.max_summary_tokens)
+
+    async def asummarize(self, summary, messages):
+        """
+        summarize() の非同期版です。
+        """
+        response = await self.summary_llm.ainvoke(self._summary_request(summary, messages))
+        return truncate_text(message_text(response.content), self.encoding, self.max_summary_tokens)
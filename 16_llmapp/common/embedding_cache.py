@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+# キャッシュの最大サイズ（ベクトルのバイト数の合計）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 上限を超えた場合にこの割合まで古いものから削除する
+EVICT_TARGET_RATIO = 0.9
+# メモリ上に保持する質問（embed_query）のベクトルの数
+DEFAULT_QUERY_CACHE_SIZE = 256
+# 最終利用時刻の更新をまとめて書き込む間隔（秒）と、まとめる件数の上限
+TOUCH_FLUSH_SECONDS = 30
+TOUCH_FLUSH_SIZE = 1000
+
+# ===== エンベディングのキャッシュ =====
+class CachedEmbeddings(Embeddings):
+    """
+    エンベディングの結果をSQLiteに保存し、同じテキストの再計算を省くラッパーです。
+    キーは（モデル名, テキストのハッシュ）で、ベクトルはfloat32のバイト列で保存します。
+    合計サイズが上限を超えると、最後に使われた時刻が古いものから削除します。
+    合計サイズは開いたときに一度だけ数え、以降は書き込み・削除のたびに足し引きするため、保存のたびに表を走査しません。
+    読み出しのたびに書き込まないよう、最終利用時刻の更新はメモリにためて、保存・削除の前か一定の間隔でまとめて書き込みます。
+    検索の質問（embed_query）は、SQLiteを読み書きせずに済むようメモリ上にも保持します。
+
+    例（ノートブックなどから利用する場合）:
+        embedding_model = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"), "embedding_cache.db")
+    """
+
+    def __init__(self, embeddings, path, model_name=None, max_bytes=DEFAULT_MAX_BYTES,
+                 query_cache_size=DEFAULT_QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.max_bytes = max_bytes
+        self.query_cache_size = query_cache_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # キー → ベクトル（SQLiteに保存済みのものだけを古い順に保持する）
+        self._queries = OrderedDict()
+        # キャッシュから返したキーと時刻（次にSQLiteへ書き込むときに最終利用時刻へ反映する）
+        self._touched = {}
+        self._touched_flushed_at = time.monotonic()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 複数のスレッド・プロセスから使えるようにWALモードで開く
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # 保存しているベクトルのバイト数の合計（ほかのプロセスの書き込みは含まないため、削除の前に数え直す）
+        self._total_bytes = self._sum_sizes()
+
+    def _sum_sizes(self, keys=None):
+        """
+        保存しているベクトルのバイト数の合計を返します。keys を渡した場合は、そのキーの分だけを数えます。
+        """
+        if keys is None:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        total = 0
+        # SQLiteの変数の上限を超えないよう分けて問い合わせる
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            total += self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchone()[0]
+        return total
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def _flush_touched(self):
+        """
+        ためておいた最終利用時刻をまとめて書き込みます（ロックを取得してから呼び、コミットは呼び出し側で行う）。
+        """
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_flushed_at = time.monotonic()
+
+    def _lookup(self, keys):
+        """
+        キャッシュ済みのベクトルを {キー: ベクトル} の形式で返します。
+        最終利用時刻はすぐには書き込まず、件数か間隔が上限を超えたときにまとめて書き込みます。
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLiteの変数の上限を超えないよう分けて問い合わせる
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            now = time.time()
+            for key in found:
+                self._touched[key] = now
+            if self._touched and (len(self._touched) >= TOUCH_FLUSH_SIZE
+                                  or time.monotonic() - self._touched_flushed_at >= TOUCH_FLUSH_SECONDS):
+                self._flush_touched()
+                self._conn.commit()
+        return found
+
+    def _store(self, items):
+        """
+        新しく計算したベクトルを保存し、上限を超えていれば古いものから削除します。
+        """
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = array('f', vector).tobytes()
+            rows.append((key, self.model_name, blob, len(blob), now))
+        with self._lock:
+            # キャッシュから返したベクトルの最終利用時刻を、削除の判定の前にまとめて反映する
+            self._flush_touched()
+            # 置き換えるベクトルの分は合計から差し引く
+            sizes = {key: size for key, _, _, size, _ in rows}
+            replaced = self._sum_sizes(list(sizes))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(sizes.values()) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # ほかのプロセスも書き込むため、削除する前に合計を数え直す
+        total = self._total_bytes = self._sum_sizes()
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        removed = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            if total <= target:
+                break
+            removed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+        self._total_bytes = total
+        for (key,) in removed:
+            self._queries.pop(key, None)
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        # キャッシュにないテキストだけをまとめてエンベディング
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def _remember_query(self, key, vector):
+        with self._lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self._touched[key] = time.time()
+                self.hits += 1
+                return vector
+        cached = self._lookup([key])
+        with self._lock:
+            if key in cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+        vector = cached.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store([(key, vector)])
+        self._remember_query(key, vector)
+        return vector
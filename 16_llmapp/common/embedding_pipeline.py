@@ -0,0 +1,199 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 1バッチあたりのトークン数の上限
+DEFAULT_BATCH_TOKENS = 8000
+# 1バッチあたりのチャンク数の上限（APIは1リクエスト2048件まで）
+DEFAULT_BATCH_SIZE = 256
+# 同時に送るエンベディングリクエストの数
+DEFAULT_MAX_WORKERS = 4
+# リトライの回数と初回の待ち時間（秒）
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+
+# ===== バッチの作成 =====
+def batch_by_tokens(items, count_tokens, max_tokens=DEFAULT_BATCH_TOKENS, max_items=DEFAULT_BATCH_SIZE):
+    """
+    (ID, Document) の列を、トークン数と件数の上限を超えないバッチに分けて順に返します。
+    上限を超える1件だけのチャンクはそのまま1バッチとして返します。
+    チャンク作成時に数えたトークン数（metadata["tokens"]）があれば、数え直さずに使います。
+    """
+    batch = []
+    batch_tokens = 0
+    for item_id, document in items:
+        tokens = document.metadata.get("tokens")
+        if tokens is None:
+            tokens = count_tokens(document.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch, batch_tokens
+            batch = []
+            batch_tokens = 0
+        batch.append((item_id, document))
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+# ===== レート制限への対応 =====
+class RateLimitGate:
+    """
+    レート制限（429）を受けたときに、すべてのワーカーの送信をまとめて一時停止させます。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+def is_retryable(error):
+    """
+    リトライするエラー（レート制限・5xx・通信エラー・タイムアウト）かどうかを返します。
+    プログラムの誤り（TypeErrorなど）や4xxはリトライしても直らないため、リトライしません。
+    """
+    import openai
+
+    # APITimeoutError は APIConnectionError のサブクラス
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def embed_with_retry(embedding_model, texts, gate, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    テキストのリストをエンベディングします。
+    429・5xx・通信エラーは指数バックオフでリトライし、それ以外のエラーはそのまま送出します。
+    リトライが重ならないよう、エンベディングモデル（OpenAIのクライアント）自身のリトライは 0 にしてください。
+    戻り値は (ベクトルのリスト, リトライ回数) です。
+    """
+    for attempt in range(max_retries + 1):
+        gate.wait()
+        try:
+            return embedding_model.embed_documents(texts), attempt
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if getattr(e, "status_code", None) == 429:
+                # レート制限の場合は他のワーカーも止めて送信量を下げる
+                gate.pause(delay)
+            else:
+                time.sleep(delay)
+
+# ===== ベクトルストアへの書き込み =====
+def chroma_collection(db):
+    """
+    Chroma（langchain_chroma）が保持する chromadb のコレクションを返します。Chroma以外の場合は None を返します。
+    Chroma.add_texts / add_documents は必ずChroma自身のエンベディング関数でベクトルを計算し直し、
+    計算済みのベクトルを渡す公開APIがないため、非公開の属性 _collection をここだけで使います（langchain_chroma 0.2）。
+    書き込みには chromadb のコレクションの公開API（upsert）を使います。
+    """
+    from langchain_chroma import Chroma
+
+    if not isinstance(db, Chroma):
+        return None
+    return db._collection
+
+def add_embedded_documents(db, ids, documents, vectors):
+    """
+    計算済みのベクトルをベクトルストアに書き込みます（再計算はしません）。
+    """
+    collection = chroma_collection(db)
+    if collection is not None:
+        collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[d.page_content for d in documents],
+            metadatas=[d.metadata or None for d in documents],
+        )
+    elif hasattr(db, "add_embeddings"):
+        db.add_embeddings(
+            list(zip([d.page_content for d in documents], vectors)),
+            metadatas=[d.metadata for d in documents],
+            ids=ids,
+        )
+    else:
+        raise TypeError(f"{type(db).__name__} は計算済みベクトルの書き込みに対応していません。")
+
+# ===== エンベディングのパイプライン =====
+def embed_and_store(db, chunks, embedding_model, count_tokens,
+                    max_tokens=DEFAULT_BATCH_TOKENS, max_items=DEFAULT_BATCH_SIZE,
+                    max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                    backoff=DEFAULT_BACKOFF):
+    """
+    (ID, Document) の列をトークン数で束ね、並列にエンベディングしてバッチ毎にベクトルストアへ書き込みます。
+    chunks はジェネレーターでもよく、読み出しながら束ねるため、すべてのチャンクをメモリに置く必要はありません。
+    同時に処理中のバッチ数は max_workers の2倍までに抑えます。
+    """
+    gate = RateLimitGate()
+    stats = {"documents": 0, "tokens": 0, "batches": 0, "retries": 0}
+    # 件数が分からない（ジェネレーターの）場合は、進捗に全体の件数を表示しない
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    started = time.perf_counter()
+    batches = batch_by_tokens(chunks, count_tokens, max_tokens, max_items)
+
+    def run(batch):
+        texts = [d.page_content for _, d in batch]
+        return embed_with_retry(embedding_model, texts, gate, max_retries, backoff)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        try:
+            for batch, tokens in batches:
+                pending[executor.submit(run, batch)] = (batch, tokens)
+                # 処理待ちが溜まりすぎないよう、空くまで待つ
+                while len(pending) >= max_workers * 2:
+                    _collect(db, pending, stats, total, started)
+            while pending:
+                _collect(db, pending, stats, total, started)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    if stats["documents"]:
+        print(
+            f"エンベディング完了: {stats['documents']}件 / {elapsed:.1f}秒 "
+            f"（{stats['documents'] / elapsed:.1f}件/秒, {stats['tokens'] / elapsed:.0f}トークン/秒, "
+            f"リトライ {stats['retries']}回）"
+        )
+    return stats
+
+def _collect(db, pending, stats, total, started):
+    """
+    完了したバッチを待ってベクトルストアに書き込み、進捗を表示します。
+    """
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        batch, tokens = pending.pop(future)
+        vectors, retries = future.result()
+        add_embedded_documents(db, [i for i, _ in batch], [d for _, d in batch], vectors)
+        stats["documents"] += len(batch)
+        stats["tokens"] += tokens
+        stats["batches"] += 1
+        stats["retries"] += retries
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        progress = stats['documents'] if total is None else f"{stats['documents']}/{total}"
+        print(f"エンベディング中: {progress}件（{stats['documents'] / elapsed:.1f}件/秒）")
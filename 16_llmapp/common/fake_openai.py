@@ -0,0 +1,176 @@
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _HTTPServer(ThreadingHTTPServer):
+    # 同時接続の多い負荷テストでも接続を取りこぼさないよう、待ち行列を長くする
+    request_queue_size = 128
+    daemon_threads = True
+
+# ===== テスト・ベンチマーク用のOpenAI互換サーバー =====
+class FakeOpenAIServer:
+    """
+    ローカルで動くOpenAI互換の簡易サーバーです。
+    テストやベンチマークで本物のAPIを呼ばずに、遅延やレート制限を再現します。
+    エンベディングと、チャット（最後のユーザー発言を返すだけ。stream=Trueにも対応）に応答します。
+
+    使い方:
+        with FakeOpenAIServer(latency=0.05) as server:
+            embeddings = OpenAIEmbeddings(api_key="test", base_url=server.base_url)
+            llm = ChatOpenAI(api_key="test", base_url=server.base_url)
+    """
+
+    def __init__(self, latency=0.0, dimensions=8, rate_limit_failures=0):
+        # 1リクエストあたりの応答遅延（秒）
+        self.latency = latency
+        # 返すエンベディングの次元数
+        self.dimensions = dimensions
+        # 最初のN回のリクエストに429（レート制限）を返す
+        self.rate_limit_failures = rate_limit_failures
+        self.requests = 0
+        self.embedded_inputs = 0
+        self.chat_requests = 0
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def embedding(self, item):
+        """
+        入力（文字列またはトークンIDのリスト）から決定的なベクトルを作成します。
+        """
+        digest = hashlib.sha256(json.dumps(item, ensure_ascii=False).encode('utf-8')).digest()
+        return [(digest[i % len(digest)] - 128) / 128 for i in range(self.dimensions)]
+
+    def _take_failure(self):
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_failures > 0:
+                self.rate_limit_failures -= 1
+                return True
+            return False
+
+    def _handle_embeddings(self, body):
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        with self._lock:
+            self.embedded_inputs += len(inputs)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": self.embedding(item)}
+                for i, item in enumerate(inputs)
+            ],
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def chat_answer(self, body):
+        """
+        最後のユーザー発言をそのまま含めた回答を作成します。
+        """
+        user_messages = [m for m in body.get("messages", []) if m.get("role") == "user"]
+        content = user_messages[-1].get("content", "") if user_messages else ""
+        if not isinstance(content, str):
+            content = "".join(part.get("text", "") for part in content)
+        return f"（テスト応答）{content}"
+
+    def _handle_chat(self, body):
+        with self._lock:
+            self.chat_requests += 1
+        answer = self.chat_answer(body)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(answer), "total_tokens": len(answer)},
+        }
+
+    def _chat_chunks(self, body):
+        """
+        stream=True の場合に返すチャンク（1文字ずつ）を順に返します。
+        """
+        with self._lock:
+            self.chat_requests += 1
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+        yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+        for char in self.chat_answer(body):
+            yield {**base, "choices": [{"index": 0, "delta": {"content": char}, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_events(self, chunks):
+                # Content-Lengthを付けずに送り、接続を閉じて終わりを知らせる
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._take_failure():
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                    headers={"Retry-After": "0"})
+                    return
+                if self.path.endswith("/chat/completions") and body.get("tools") == []:
+                    # 本物のAPIと同じく、空のツールの一覧は受け付けない
+                    self._send_json(400, {"error": {"message": "[] is too short - 'tools'",
+                                                    "type": "invalid_request_error", "param": "tools"}})
+                elif self.path.endswith("/embeddings"):
+                    self._send_json(200, server._handle_embeddings(body))
+                elif self.path.endswith("/chat/completions") and body.get("stream"):
+                    self._send_events(server._chat_chunks(body))
+                elif self.path.endswith("/chat/completions"):
+                    self._send_json(200, server._handle_chat(body))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path: {self.path}"}})
+
+        return Handler
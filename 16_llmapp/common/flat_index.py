@@ -0,0 +1,205 @@
+import os
+import json
+import glob
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+# 書き出したインデックスのメタデータのファイル名（インデックスの保存先に置く）
+FLAT_INDEX_FILENAME = "flat_index.json"
+# 書き出したインデックスの形式のバージョン
+FLAT_INDEX_VERSION = 2
+# Chromaから一度に読み出すチャンクの数
+EXPORT_BATCH_SIZE = 1000
+
+def _vectors_path(directory, version):
+    return os.path.join(directory, f"flat_vectors-{version}.f32")
+
+def _records_path(directory, version):
+    return os.path.join(directory, f"flat_records-{version}.jsonl")
+
+def _offsets_path(directory, version):
+    return os.path.join(directory, f"flat_offsets-{version}.i64")
+
+def _open_memmap(path, dtype, count):
+    # 空のファイルはmmapできないため、チャンクがない場合は空の配列にする
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+def normalize(vector):
+    """
+    長さ1に正規化したfloat32のベクトルを返します。
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def top_k(scores, k):
+    """
+    スコアの高い順に、上位k件の位置を返します（全件を並べずに部分ソートで取り出す）。
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+# ===== 書き出し =====
+def export_flat_index(db, directory, version):
+    """
+    Chromaのコレクションを、float32の行列（長さ1に正規化）と、チャンク（id・テキスト・メタデータ）のファイルに書き出します。
+    チャンクは1行1件のJSONで書き、各行の開始位置をint64の配列に保存するため、行番号で1件ずつ読み出せます。
+    ファイル名にはインデックスのバージョンを含め、メタデータを最後に置き換えるため、
+    書き出し中や書き出し後も、古いファイルを開いているワーカーはそのまま検索を続けられます。
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = [_vectors_path(directory, version), _records_path(directory, version), _offsets_path(directory, version)]
+    vectors_path, records_path, offsets_path = paths
+    tmp_paths = [f"{path}.{os.getpid()}.tmp" for path in paths]
+    # 各行の開始位置（最後に終端の位置を加え、i行目は offsets[i]〜offsets[i+1] になる）
+    offsets = [0]
+    dimensions = None
+    with open(tmp_paths[0], 'wb') as vectors_file, open(tmp_paths[1], 'wb') as records_file:
+        offset = 0
+        while True:
+            batch = db.get(include=["embeddings", "documents", "metadatas"], limit=EXPORT_BATCH_SIZE, offset=offset)
+            if not batch["ids"]:
+                break
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+            dimensions = vectors.shape[1]
+            vectors_file.write(vectors.tobytes())
+            for chunk_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                line = json.dumps([chunk_id, text, metadata or {}], ensure_ascii=False).encode('utf-8') + b"\n"
+                records_file.write(line)
+                offsets.append(offsets[-1] + len(line))
+            offset += len(batch["ids"])
+    np.asarray(offsets, dtype=np.int64).tofile(tmp_paths[2])
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+    count = len(offsets) - 1
+
+    meta_path = os.path.join(directory, FLAT_INDEX_FILENAME)
+    tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": FLAT_INDEX_VERSION,
+            "index_version": version,
+            "vectors": os.path.basename(vectors_path),
+            "records": os.path.basename(records_path),
+            "offsets": os.path.basename(offsets_path),
+            "dimensions": dimensions or 0,
+            "count": count,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_meta_path, meta_path)
+
+    # 古いバージョンのファイルを削除（開いているワーカーはmmapしたまま使い続けられる）
+    for pattern in ("flat_vectors-*.f32", "flat_records-*.jsonl", "flat_offsets-*.i64"):
+        for path in glob.glob(os.path.join(directory, pattern)):
+            if path not in paths:
+                os.remove(path)
+    return count
+
+# ===== 読み取り専用のベクトルストア =====
+class FlatIndex(VectorStore):
+    """
+    export_flat_index で書き出した行列とチャンクのファイルをmmapで開く、読み取り専用のベクトルストアです。
+    ベクトルもチャンクのテキスト・メタデータもOSのページキャッシュ上で全ワーカーに共有され、
+    検索結果の行だけを読み出すため、ワーカー毎にChromaのコレクションを読み込む場合より起動が速く、
+    チャンクが増えてもワーカー毎のメモリ（RSS）は増えません。
+    検索はNumPyの行列とベクトルの積（コサイン類似度）で全件を比較します。
+    """
+
+    def __init__(self, directory, embedding_function):
+        with open(os.path.join(directory, FLAT_INDEX_FILENAME), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != FLAT_INDEX_VERSION:
+            raise ValueError(f"インデックスの形式が異なります: {meta.get('version')}")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.index_version = meta["index_version"]
+        self.count = meta["count"]
+        if self.count:
+            self.vectors = np.memmap(os.path.join(directory, meta["vectors"]), dtype=np.float32, mode='r',
+                                     shape=(self.count, meta["dimensions"]))
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._records = _open_memmap(os.path.join(directory, meta["records"]), np.uint8, self.count)
+        self._record_offsets = _open_memmap(os.path.join(directory, meta["offsets"]), np.int64, self.count)
+        # id → 行番号（get_by_ids を初めて使うときに一度だけ作る）
+        self._positions = None
+
+    @classmethod
+    def exists(cls, directory):
+        return os.path.exists(os.path.join(directory, FLAT_INDEX_FILENAME))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _record(self, i):
+        """
+        i行目のチャンクを (id, テキスト, メタデータ) で返します。
+        """
+        start, end = self._record_offsets[i], self._record_offsets[i + 1]
+        return json.loads(self._records[start:end].tobytes())
+
+    def _document(self, i):
+        chunk_id, text, metadata = self._record(i)
+        return Document(id=chunk_id, page_content=text, metadata=metadata)
+
+    def _top(self, embedding, k):
+        """
+        類似度の高い順に (行番号, コサイン類似度) のリストを返します。
+        """
+        if not self.count:
+            return []
+        scores = self.vectors @ normalize(embedding)
+        return [(int(i), float(scores[i])) for i in top_k(scores, k)]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        return [(self._document(i), score) for i, score in self._top(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # スコアはコサイン類似度なので、そのまま関連度として使う
+        return lambda score: score
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        candidates = self._top(embedding, fetch_k)
+        if not candidates:
+            return []
+        rows = [i for i, _ in candidates]
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32), self.vectors[rows], k=k, lambda_mult=lambda_mult)
+        return [self._document(rows[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query), k, fetch_k, lambda_mult)
+
+    def get_by_ids(self, ids):
+        if self._positions is None:
+            self._positions = {self._record(i)[0]: i for i in range(self.count)}
+        return [self._document(self._positions[chunk_id]) for chunk_id in ids if chunk_id in self._positions]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("FlatIndex は読み取り専用です。Chromaに追加してから書き出し直してください。")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("FlatIndex は export_flat_index で書き出したファイルから開いてください。")
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# 保持するコンパイル済みグラフの数の上限
+DEFAULT_MAX_GRAPHS = 8
+
+# ===== グラフのレジストリ =====
+class GraphRegistry:
+    """
+    コンパイル済みのグラフを（モデル名, ツールセット, チェックポインター）毎に、初めて使うときに作成して保持します。
+    ツール（Retriever・Web検索）やエンベディングモデルは shared() で一度だけ作成し、すべてのグラフで共有します。
+    保持するグラフの数が上限を超えると、最も長く使われていないグラフから削除します（LRU）。
+    同じグラフを複数のスレッドが同時に求めた場合、作成するのは最初の1つだけで、ほかは完成を待ちます。
+    """
+
+    def __init__(self, build, create_tools, toolsets, max_graphs=DEFAULT_MAX_GRAPHS):
+        # build(モデル名, チェックポインター, ツールのリスト) → グラフ
+        self.build = build
+        # すべてのツールを作成する関数（ツールセットはこの中から名前で選ぶ）
+        self.create_tools = create_tools
+        # ツールセット: 名前 → 使うツールの名前のタプル
+        self.toolsets = toolsets
+        self.max_graphs = max_graphs
+        # グラフを作成した回数、保持していたグラフを使った回数、上限を超えて削除した回数
+        self.builds = 0
+        self.hits = 0
+        self.evictions = 0
+
+        # （モデル名, ツールセット, チェックポインターのid）→ グラフ（古い順に並ぶ）
+        self._graphs = OrderedDict()
+        # 共有するリソース: 名前 → 値
+        self._shared = OrderedDict()
+        # 作成中のキー → 完成を待つための Future
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, entries, key, create, limit=None):
+        """
+        entries にあれば返し、なければ create() で作成して保持します。
+        作成に失敗した場合は保持せず、完成を待っていたスレッドにも同じ例外を送ります。
+        """
+        with self._lock:
+            if key in entries:
+                entries.move_to_end(key)
+                if entries is self._graphs:
+                    self.hits += 1
+                return entries[key]
+            future = self._building.get(key)
+            owner = future is None
+            if owner:
+                future = self._building[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            value = create()
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[key]
+            entries[key] = value
+            if entries is self._graphs:
+                self.builds += 1
+            while limit and len(entries) > limit:
+                entries.popitem(last=False)
+                self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def shared(self, name, create):
+        """
+        すべてのグラフで共有するリソースを返します。まだない場合は create() で一度だけ作成します。
+        """
+        return self._get_or_create(self._shared, ("shared", name), create)
+
+    def tools(self, toolset):
+        """
+        ツールセットのツールを返します。ツールは共有するツールの中から選ぶため、Chromaなどを開き直しません。
+        """
+        if toolset not in self.toolsets:
+            raise ValueError(f"ツールセットは {tuple(self.toolsets)} のいずれかを指定してください: {toolset}")
+        names = self.toolsets[toolset]
+        if not names:
+            return []
+        return [tool for tool in self.shared("tools", self.create_tools) if tool.name in names]
+
+    def get(self, model_name, toolset, checkpointer):
+        """
+        モデル名・ツールセット・チェックポインターに対応するグラフを返します。まだない場合は作成します。
+        """
+        # グラフがチェックポインターを参照しているため、保持している間に id が別のオブジェクトに使われることはない
+        key = (model_name, toolset, id(checkpointer))
+        return self._get_or_create(
+            self._graphs, key,
+            lambda: self.build(model_name, checkpointer, self.tools(toolset)),
+            self.max_graphs,
+        )
+
+    def keys(self):
+        with self._lock:
+            return [(model_name, toolset) for model_name, toolset, _ in self._graphs]
+
+    def clear(self):
+        """
+        保持しているグラフを削除します（共有するリソースは残します）。
+        """
+        with self._lock:
+            self._graphs.clear()
+
+    def __len__(self):
+        return len(self._graphs)
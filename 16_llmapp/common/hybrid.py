@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import math
+import heapq
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+# キーワード検索のインデックスのファイル名（インデックスの保存先に置く）
+KEYWORD_INDEX_FILENAME = "bm25_index.json"
+# キーワード検索のインデックスの形式のバージョン
+KEYWORD_INDEX_VERSION = 1
+# 順位の融合（RRF）の定数。大きいほど下位の結果の重みが相対的に大きくなる
+DEFAULT_RRF_K = 60
+# 返すチャンクの数と、融合する前にそれぞれの検索で取得するチャンクの数
+DEFAULT_K = 4
+DEFAULT_FETCH_K = 20
+# ベクトル検索の方法（"similarity": 類似度順, "mmr": 似たチャンクの重複を避ける）
+SEARCH_TYPES = ("similarity", "mmr")
+# MMRで類似度と多様性のどちらを重視するか（1に近いほど類似度を重視）
+DEFAULT_LAMBDA_MULT = 0.5
+
+# 英数字の連続、1文字の単語文字（漢字・かななど）、それ以外（区切り）
+_UNIT_PATTERN = re.compile(r"([a-z0-9]+)|(\w)|\W+")
+
+# ===== 日本語のトークン化 =====
+def tokenize(text):
+    """
+    日本語を含むテキストを、形態素解析を使わずにキーワード検索用のトークンに分けます。
+    漢字・かなは隣り合う2文字（バイグラム）、英数字は連続をひとまとまりとして扱い、
+    「第12条」→「第12」「12条」のように条番号や様式名の表記をそのまま検索できるようにします。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    run = []
+
+    def flush():
+        # 1文字だけの漢字・かなは、その1文字をトークンにする
+        if len(run) == 1 and not run[0].isascii():
+            tokens.append(run[0])
+        tokens.extend(a + b for a, b in zip(run, run[1:]))
+        run.clear()
+
+    for match in _UNIT_PATTERN.finditer(text):
+        ascii_word, char = match.group(1), match.group(2)
+        if ascii_word:
+            # 英数字の単語はそれ単体でも検索できるようにする
+            tokens.append(ascii_word)
+            run.append(ascii_word)
+        elif char:
+            run.append(char)
+        else:
+            flush()
+    flush()
+    return tokens
+
+# ===== BM25のインデックス =====
+class BM25Index:
+    """
+    チャンクのテキストからBM25でキーワード検索する転置インデックスです。
+    チャンクIDはベクトルストアと共通で、取り込み時（sync_index）に一緒に追加・削除します。
+    テキストとメタデータをJSONファイルに保存し、起動時に転置インデックスを組み立て直します。
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # チャンクID → {"text", "metadata"}
+        self.documents = {}
+        # トークン → {チャンクID: 出現回数}
+        self.postings = defaultdict(dict)
+        # チャンクID → トークン数
+        self.lengths = {}
+        self.total_length = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _index(self, chunk_id, text):
+        counts = Counter(tokenize(text))
+        for token, count in counts.items():
+            self.postings[token][chunk_id] = count
+        length = sum(counts.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+
+    def add(self, ids, documents):
+        """
+        チャンク（Document）をIDと一緒に追加します。同じIDがあれば置き換えます。
+        """
+        self.delete([i for i in ids if i in self.documents])
+        for chunk_id, document in zip(ids, documents):
+            self.documents[chunk_id] = {"text": document.page_content, "metadata": document.metadata}
+            self._index(chunk_id, document.page_content)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            document = self.documents.pop(chunk_id, None)
+            if document is None:
+                continue
+            for token in set(tokenize(document["text"])):
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[token]
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def clear(self):
+        self.documents.clear()
+        self.postings.clear()
+        self.lengths.clear()
+        self.total_length = 0
+
+    def search(self, query, k=4):
+        """
+        クエリに対するBM25スコアの高い順に (Document, スコア) のリストを返します。
+        """
+        if not self.documents:
+            return []
+        count = len(self.documents)
+        average_length = self.total_length / count
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.document(chunk_id), score) for chunk_id, score in best]
+
+    def document(self, chunk_id):
+        entry = self.documents[chunk_id]
+        return Document(id=chunk_id, page_content=entry["text"], metadata=entry["metadata"])
+
+    # ===== 保存と読み込み =====
+    def save(self):
+        """
+        インデックスを一時ファイル経由で書き込み、途中で中断しても壊れないようにします。
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": KEYWORD_INDEX_VERSION, "documents": self.documents}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.clear()
+        if data.get("version") != KEYWORD_INDEX_VERSION:
+            return
+        for chunk_id, entry in data["documents"].items():
+            self.documents[chunk_id] = entry
+            self._index(chunk_id, entry["text"])
+
+# ===== 順位の融合 =====
+def reciprocal_rank_fusion(result_lists, k=4, rrf_k=DEFAULT_RRF_K):
+    """
+    複数の検索結果（Documentのリスト）を Reciprocal Rank Fusion で1つの順位にまとめます。
+    スコアの尺度が異なる検索（BM25とベクトル類似度）でも、順位だけで公平に融合できます。
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.id or document.page_content
+            scores[key] += 1 / (rrf_k + rank + 1)
+            documents.setdefault(key, document)
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [documents[key] for key, _ in best]
+
+# ===== ハイブリッド検索のRetriever =====
+class HybridRetriever(BaseRetriever):
+    """
+    ベクトル検索（意味の近さ）とBM25（キーワードの一致）の結果をRRFで融合するRetrieverです。
+    条番号や様式名などの完全一致する語句を、ベクトル検索だけの場合より確実に拾えます。
+    score_threshold を指定すると、類似度（0〜1）が下限に満たないベクトル検索の結果を除き、
+    下限を満たすチャンクが1つもない質問（文書と関係のない質問）ではキーワード検索の結果も返しません。
+    search_type="mmr" の場合は、ベクトル検索で内容の重複したチャンクを避けます。
+    """
+
+    vectorstore: VectorStore
+    keyword_index: Any
+    # 返すチャンクの数
+    k: int = DEFAULT_K
+    # 融合する前にそれぞれの検索で取得するチャンクの数
+    fetch_k: int = DEFAULT_FETCH_K
+    rrf_k: int = DEFAULT_RRF_K
+    search_type: str = "similarity"
+    lambda_mult: float = DEFAULT_LAMBDA_MULT
+    # ベクトル検索の類似度の下限（None の場合は絞り込まない）
+    score_threshold: Optional[float] = None
+
+    def _keyword_results(self, query):
+        return [document for document, _ in self.keyword_index.search(query, self.fetch_k)]
+
+    def _filter_dense(self, dense, scored):
+        """
+        類似度の下限を満たすチャンクだけを、dense の順位のまま返します。
+        """
+        allowed = {document.id or document.page_content for document, _ in scored}
+        return [document for document in dense if (document.id or document.page_content) in allowed]
+
+    def _fuse(self, dense, keyword):
+        """
+        ベクトル検索とキーワード検索の結果を融合します。
+        類似度の下限を指定した場合、下限を満たすベクトル検索の結果がなければ、キーワードだけが一致したチャンクも除きます
+        （助詞や一般的な語の一致だけで、関係のないチャンクをモデルに渡さないため）。
+        """
+        if self.score_threshold is not None and not dense:
+            return []
+        return reciprocal_rank_fusion([dense, keyword], k=self.k, rrf_k=self.rrf_k)
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        if self.search_type == "mmr":
+            dense = self.vectorstore.max_marginal_relevance_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult)
+        else:
+            dense = None
+        if self.score_threshold is not None:
+            scored = self.vectorstore.similarity_search_with_relevance_scores(
+                query, k=self.fetch_k, score_threshold=self.score_threshold)
+            dense = self._filter_dense(dense, scored) if dense is not None else [d for d, _ in scored]
+        elif dense is None:
+            dense = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        return self._fuse(dense, self._keyword_results(query))
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        if self.search_type == "mmr":
+            dense = await self.vectorstore.amax_marginal_relevance_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult)
+        else:
+            dense = None
+        if self.score_threshold is not None:
+            scored = await self.vectorstore.asimilarity_search_with_relevance_scores(
+                query, k=self.fetch_k, score_threshold=self.score_threshold)
+            dense = self._filter_dense(dense, scored) if dense is not None else [d for d, _ in scored]
+        elif dense is None:
+            dense = await self.vectorstore.asimilarity_search(query, k=self.fetch_k)
+        return self._fuse(dense, self._keyword_results(query))
+
+# ===== 検索の設定 =====
+def retriever_settings():
+    """
+    環境変数からハイブリッド検索の設定を読み込みます。
+    RETRIEVER_K（返すチャンクの数）, RETRIEVER_FETCH_K（融合前に取得する数）,
+    RETRIEVER_SEARCH_TYPE（similarity / mmr）, RETRIEVER_MMR_LAMBDA,
+    RETRIEVER_SCORE_THRESHOLD（ベクトル検索の類似度の下限）で変更できます。
+    """
+    search_type = os.environ.get("RETRIEVER_SEARCH_TYPE", "similarity")
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"RETRIEVER_SEARCH_TYPE は {SEARCH_TYPES} のいずれかを指定してください: {search_type}")
+    score_threshold = os.environ.get("RETRIEVER_SCORE_THRESHOLD")
+    return {
+        "k": int(os.environ.get("RETRIEVER_K", DEFAULT_K)),
+        "fetch_k": int(os.environ.get("RETRIEVER_FETCH_K", DEFAULT_FETCH_K)),
+        "search_type": search_type,
+        "lambda_mult": float(os.environ.get("RETRIEVER_MMR_LAMBDA", DEFAULT_LAMBDA_MULT)),
+        "score_threshold": float(score_threshold) if score_threshold else None,
+    }
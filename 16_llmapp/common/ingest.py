@@ -0,0 +1,338 @@
+import os
+import json
+import hashlib
+from itertools import islice
+from contextlib import contextmanager
+from collections import defaultdict
+from langchain_core.documents import Document
+from common.pdf_loader import iter_pdf_pages, iter_documents, DEFAULT_MAX_WORKERS
+
+# マニフェストのファイル名（インデックスの保存先に置く）
+MANIFEST_FILENAME = "ingest_manifest.json"
+# マニフェストの形式のバージョン
+MANIFEST_VERSION = 1
+# ベクトルストアからまとめて読み込むチャンクの数
+GET_BATCH_SIZE = 500
+
+# ===== ハッシュの計算 =====
+def file_sha256(path):
+    """
+    ファイルの内容からSHA-256ハッシュを計算します。
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(file_name, text, occurrence):
+    """
+    チャンクのIDをファイル名・チャンク本文・出現回数から決定的に作成します。
+    同じファイル内に同じ本文のチャンクが複数ある場合は出現回数で区別します。
+    """
+    key = f"{file_name}\0{occurrence}\0{text}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def assign_chunk_ids(file_name, chunks, seen=None):
+    """
+    ファイル内のチャンクの並びに対応するIDのリストを返します。
+    ページ毎に分けて呼び出す場合は、同じ seen（本文毎の出現回数）を渡し続けます。
+    """
+    seen = defaultdict(int) if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        occurrence = seen[chunk.page_content]
+        seen[chunk.page_content] += 1
+        ids.append(chunk_id(file_name, chunk.page_content, occurrence))
+    return ids
+
+# ===== マニフェストの読み書き =====
+def manifest_path(persist_directory):
+    return os.path.join(persist_directory, MANIFEST_FILENAME)
+
+def load_manifest(persist_directory):
+    """
+    マニフェストを読み込みます。存在しない、または形式が異なる場合は空のマニフェストを返します。
+    """
+    path = manifest_path(persist_directory)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+def save_manifest(persist_directory, manifest):
+    """
+    マニフェストを一時ファイル経由で書き込み、途中で中断しても壊れないようにします。
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    path = manifest_path(persist_directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def index_version(manifest):
+    """
+    取り込み済みファイルのハッシュからインデックスのバージョン文字列を作成します。
+    PDFが追加・変更・削除されるか、チャンクの分割方法が変わるとバージョンが変わります。
+    """
+    digest = hashlib.sha256()
+    # チャンクの分割方法が変わった場合もバージョンを変える
+    digest.update(f"{manifest.get('splitter', '')}\n".encode('utf-8'))
+    for name in sorted(manifest["files"]):
+        digest.update(f"{name}\0{manifest['files'][name]['sha256']}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+# マニフェストのパス → (ファイルの状態, バージョン)
+_version_cache = {}
+
+def cached_index_version(persist_directory):
+    """
+    保存先のマニフェストから求めたインデックスのバージョンを返します。
+    検索結果のキャッシュで検索の度に呼ばれるため、マニフェストが書き換えられていなければ読み込まずに前回の値を返します
+    （マニフェストにはすべてのチャンクIDが含まれ、読み込みはチャンクの数に比例して遅くなる）。
+    """
+    path = manifest_path(persist_directory)
+    try:
+        stat = os.stat(path)
+        # save_manifest はファイルを置き換えるため、書き換えるとinodeも変わる
+        state = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        state = None
+    cached = _version_cache.get(path)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    version = index_version(load_manifest(persist_directory))
+    _version_cache[path] = (state, version)
+    return version
+
+# ===== 作り直しのロック =====
+@contextmanager
+def index_lock(persist_directory):
+    """
+    インデックスの取り込み・書き出しを、同じ保存先を使うプロセスの間で1つずつ実行するためのファイルロックです。
+    保存先のディレクトリは壊れている場合に作り直すため、ロックのファイルは保存先の隣（<保存先>.lock）に置きます。
+    """
+    path = f"{os.path.normpath(os.path.abspath(persist_directory))}.lock"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            # LK_LOCK は約10秒で諦めるため、取得できるまで繰り返す
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+# ===== ベクトルストアを開く =====
+def open_vectorstore(persist_directory, embedding_model):
+    """
+    保存済みのChromaのインデックスを開きます（なければ新規作成）。
+    開けない（ファイルが壊れている）場合だけ、保存先（マニフェストとキーワード検索のインデックスを含む）を削除して作り直します。
+    エンベディングやネットワークのエラーは開いた後の取り込みで起きるため、保存済みのインデックスは削除しません。
+    """
+    import shutil
+    import sqlite3
+    from chromadb.errors import ChromaError
+    from chromadb.api.client import SharedSystemClient
+    from langchain_chroma import Chroma
+
+    try:
+        db = Chroma(persist_directory=persist_directory, embedding_function=embedding_model)
+        # コレクションを読み、壊れていないかを確かめる
+        db.get(limit=1, include=[])
+        return db
+    except (ChromaError, sqlite3.DatabaseError) as e:
+        print(f"インデックスの復元に失敗しました。新規作成します: {e}")
+    # 同じパスで開いたクライアントが残っていると、削除したファイルを使い続けるため破棄する
+    SharedSystemClient.clear_system_cache()
+    shutil.rmtree(persist_directory, ignore_errors=True)
+    return Chroma(persist_directory=persist_directory, embedding_function=embedding_model)
+
+# ===== 差分取り込み =====
+def load_pdf(path):
+    """
+    PDFをページ単位のDocumentのリストとして読み込みます。
+    """
+    # langchain_communityは読み込みに時間がかかるため、使うときに読み込む
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(path).load()
+
+def list_pdf_files(pdf_directory):
+    """
+    ディレクトリ直下のPDFファイルを {ファイル名: パス} の形式で返します。
+    """
+    if not os.path.isdir(pdf_directory):
+        return {}
+    return {
+        name: os.path.join(pdf_directory, name)
+        for name in sorted(os.listdir(pdf_directory))
+        if name.lower().endswith('.pdf')
+    }
+
+def is_up_to_date(pdf_directory, manifest, text_splitter=None):
+    """
+    PDFディレクトリの内容（ファイル名とハッシュ）とチャンクの分割方法が、マニフェストと一致するかを返します。
+    ベクトルストアを開かずに、取り込み直しが必要かどうかを判定できます。
+    """
+    if manifest.get("splitter") != getattr(text_splitter, "signature", None):
+        return False
+    current_files = list_pdf_files(pdf_directory)
+    if set(current_files) != set(manifest["files"]):
+        return False
+    return all(file_sha256(path) == manifest["files"][name]["sha256"] for name, path in current_files.items())
+
+def add_documents(db, chunks):
+    """
+    (ID, Document) の列をベクトルストアに追加します（ベクトルストア側でエンベディング）。
+    """
+    chunks = iter(chunks)
+    while batch := list(islice(chunks, GET_BATCH_SIZE)):
+        db.add_documents([document for _, document in batch], ids=[chunk_id for chunk_id, _ in batch])
+
+def sync_index(db, pdf_directory, text_splitter, persist_directory, load_documents=None,
+               add_documents=add_documents, keyword_index=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    PDFディレクトリとベクトルストアの差分を反映します。
+    新規・変更されたPDFだけを解析し、未登録のチャンクだけをエンベディングします。
+    PDFは max_workers 個のプロセスで並列に解析し、解析できたページから順に分割・エンベディングするため、
+    すべてのページをメモリに読み込んでから処理するより、メモリの使用量が少なく速くなります。
+    load_documents(path) を渡した場合は、そのファイルを1つずつ読み込みます。
+    未登録のチャンクは、すべてのPDFにわたる1つの (ID, Document) の列として add_documents(db, chunks) に一度だけ渡すため、
+    エンベディングのパイプライン（embed_and_store）がPDFやページの区切りによらずバッチを束ねて並列に処理できます。
+    中断した場合も、ベクトルストアに書き込み済みのチャンクは次回エンベディングし直しません。
+    削除されたPDFや変更で不要になったチャンクは、すべての追加が終わった後にベクトルストアから削除します。
+    keyword_index（BM25Index）を渡すと、同じチャンクでキーワード検索のインデックスも更新します。
+    text_splitter に signature（分割の設定を表す文字列）があればマニフェストに記録し、
+    設定が変わった場合はすべてのPDFを分割し直します（内容が同じチャンクはIDが同じため再エンベディングしない）。
+    """
+    manifest_exists = os.path.exists(manifest_path(persist_directory))
+    manifest = load_manifest(persist_directory)
+    files = manifest["files"]
+
+    # マニフェスト導入前に作成されたインデックスはIDが追跡できないため作り直す
+    if not manifest_exists:
+        existing_ids = db.get(include=[])["ids"]
+        if existing_ids:
+            db.delete(ids=existing_ids)
+        if keyword_index is not None:
+            keyword_index.clear()
+
+    # チャンクの分割方法が変わった場合は、内容の変わっていないPDFも分割し直す
+    # 新しい分割方法は、すべてのPDFを分割し直した後に記録する（途中で中断した場合は次回も分割し直す）
+    splitter = getattr(text_splitter, "signature", None)
+    resplit = manifest.get("splitter") != splitter
+
+    stats = {"added": 0, "deleted": 0, "unchanged": 0}
+    current_files = list_pdf_files(pdf_directory)
+
+    # 削除されたPDFのチャンクを取り除く
+    for name in sorted(set(files) - set(current_files)):
+        removed_ids = files.pop(name)["chunks"]
+        if removed_ids:
+            db.delete(ids=removed_ids)
+            if keyword_index is not None:
+                keyword_index.delete(removed_ids)
+        stats["deleted"] += len(removed_ids)
+        save_manifest(persist_directory, manifest)
+
+    # 内容が変わっていないPDFは解析しない
+    digests = {}
+    changed_files = {}
+    for name, path in current_files.items():
+        digests[name] = file_sha256(path)
+        entry = files.get(name)
+        if entry is not None and entry["sha256"] == digests[name] and not resplit:
+            stats["unchanged"] += len(entry["chunks"])
+        else:
+            changed_files[name] = path
+
+    if load_documents is None:
+        batches = iter_pdf_pages(changed_files, max_workers=max_workers)
+    else:
+        batches = iter_documents(changed_files, load_documents)
+
+    # 分割し終えたPDF: 名前 → (チャンクのID, 不要になったチャンクのID)
+    completed = {}
+
+    def new_chunks():
+        """
+        解析できたページから順にチャンクに分割し、未登録のチャンクだけを (ID, Document) で返します。
+        """
+        # ファイル毎のチャンクのIDと、本文毎の出現回数（ページをまたいでIDを割り当てる）
+        ids = []
+        seen = defaultdict(int)
+        for name, pages, last in batches:
+            entry = files.get(name)
+            old_ids = set(entry["chunks"]) if entry is not None else set()
+
+            chunks = text_splitter.split_documents(pages)
+            chunk_ids = assign_chunk_ids(name, chunks, seen)
+            ids.extend(chunk_ids)
+
+            # マニフェストにない、かつ前回中断するまでに書き込まれていないチャンクだけを追加（エンベディング）
+            candidates = [(i, c) for i, c in zip(chunk_ids, chunks) if i not in old_ids]
+            stored = set(db.get(ids=[i for i, _ in candidates], include=[])["ids"]) if candidates else set()
+            added = [(i, c) for i, c in candidates if i not in stored]
+            if added and keyword_index is not None:
+                keyword_index.add([i for i, _ in added], [c for _, c in added])
+            stats["added"] += len(added)
+            stats["unchanged"] += len(chunk_ids) - len(added)
+            yield from added
+
+            if last:
+                completed[name] = (ids, sorted(old_ids - set(ids)))
+                ids = []
+                seen = defaultdict(int)
+
+    add_documents(db, new_chunks())
+
+    # すべてのチャンクを追加した後に、不要になったチャンクを削除してマニフェストに記録する
+    for name, (ids, stale_ids) in completed.items():
+        if stale_ids:
+            db.delete(ids=stale_ids)
+            if keyword_index is not None:
+                keyword_index.delete(stale_ids)
+        stats["deleted"] += len(stale_ids)
+        files[name] = {"sha256": digests[name], "chunks": ids}
+
+    manifest["splitter"] = splitter
+    save_manifest(persist_directory, manifest)
+    if keyword_index is not None:
+        sync_keyword_index(db, keyword_index, manifest)
+        keyword_index.save()
+    print(f"インデックスを更新しました（追加: {stats['added']}件, 削除: {stats['deleted']}件, 変更なし: {stats['unchanged']}件）")
+    return stats
+
+def sync_keyword_index(db, keyword_index, manifest):
+    """
+    キーワード検索のインデックスを、マニフェストに記録されたチャンクと一致させます。
+    キーワード検索の導入前に作成されたインデックスでは、PDFを解析し直さずにベクトルストアからテキストを補います。
+    """
+    expected = [i for entry in manifest["files"].values() for i in entry["chunks"]]
+    keyword_index.delete(sorted(set(keyword_index.documents) - set(expected)))
+    missing = [i for i in expected if i not in keyword_index.documents]
+    for start in range(0, len(missing), GET_BATCH_SIZE):
+        result = db.get(ids=missing[start:start + GET_BATCH_SIZE], include=["documents", "metadatas"])
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(result["documents"], result["metadatas"])
+        ]
+        keyword_index.add(result["ids"], documents)
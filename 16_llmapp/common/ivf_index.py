@@ -0,0 +1,118 @@
+import os
+import glob
+import math
+import numpy as np
+from common.flat_index import FlatIndex, normalize, top_k
+
+# リストの数（nlist）を決めない場合は、ベクトル数の平方根のこの倍数にする
+NLIST_PER_SQRT = 4
+# 検索するリストの数（大きいほど再現率が上がり、遅くなる）
+DEFAULT_NPROBE = 32
+# k-meansの繰り返し回数と、学習に使うリスト1つあたりのベクトル数
+DEFAULT_ITERATIONS = 10
+SAMPLES_PER_LIST = 64
+# リストへの割り当てを一度に計算するベクトルの数
+ASSIGN_BATCH_SIZE = 65536
+
+def _ivf_path(directory, version):
+    return os.path.join(directory, f"ivf_index-{version}.npz")
+
+def default_nlist(count):
+    return max(1, int(NLIST_PER_SQRT * math.sqrt(count)))
+
+# ===== 学習（k-means） =====
+def assign_lists(vectors, centroids):
+    """
+    各ベクトルを、コサイン類似度が最も高い中心のリストに割り当てます。
+    """
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE])
+        assignment[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignment
+
+def train_ivf(vectors, nlist=None, iterations=DEFAULT_ITERATIONS, seed=0):
+    """
+    長さ1に正規化したベクトルを、球面k-meansでnlist個のリストに分けます。
+    (中心の行列, リスト順に並べた行番号, 各リストの開始位置) を返します。
+    中心は一部のベクトルだけで学習し、全ベクトルはその後でまとめて割り当てます。
+    """
+    count = len(vectors)
+    nlist = min(nlist or default_nlist(count), count)
+    rng = np.random.default_rng(seed)
+    sample_size = min(count, nlist * SAMPLES_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = assign_lists(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=nlist)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[nonempty] = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(min=1e-12)
+        # 空になったリストは、ランダムに選んだベクトルから始め直す
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+
+    assignment = assign_lists(vectors, centroids)
+    rows = np.argsort(assignment, kind="stable").astype(np.int32)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+    return centroids, rows, offsets
+
+# ===== 検索 =====
+def search_ivf(vectors, centroids, rows, offsets, query, k, nprobe=DEFAULT_NPROBE):
+    """
+    クエリに近い中心のリストをnprobe個選び、その中のベクトルだけを比較します。
+    (行番号の配列, コサイン類似度の配列) を類似度の高い順に返します。
+    """
+    probes = top_k(centroids @ query, nprobe)
+    candidates = np.concatenate([rows[offsets[i]:offsets[i + 1]] for i in probes])
+    # mmapのファイルを先頭から順に読むよう、行番号を並べてから取り出す
+    candidates.sort()
+    scores = np.asarray(vectors[candidates]) @ query
+    best = top_k(scores, k)
+    return candidates[best], scores[best]
+
+# ===== 書き出しと読み取り専用のベクトルストア =====
+def export_ivf_index(directory, nlist=None, iterations=DEFAULT_ITERATIONS):
+    """
+    export_flat_index で書き出したベクトルからリストを学習し、同じバージョンのファイル名で保存します。
+    """
+    flat = FlatIndex(directory, embedding_function=None)
+    path = _ivf_path(directory, flat.index_version)
+    if len(flat):
+        centroids, rows, offsets = train_ivf(flat.vectors, nlist, iterations)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, centroids=centroids, rows=rows, offsets=offsets)
+        os.replace(tmp_path, path)
+    for old_path in glob.glob(os.path.join(directory, "ivf_index-*.npz")):
+        if old_path != path:
+            os.remove(old_path)
+    return path
+
+class IVFIndex(FlatIndex):
+    """
+    FlatIndex にIVF（ベクトルをk-meansのリストに分け、近いリストだけを検索する近似最近傍探索）を加えたものです。
+    nprobe（検索するリストの数）で再現率と検索時間を調整できます。
+    チャンクが数万件を超え、全件との比較が遅くなる場合に使います。
+    """
+
+    def __init__(self, directory, embedding_function, nprobe=DEFAULT_NPROBE):
+        super().__init__(directory, embedding_function)
+        self.nprobe = nprobe
+        if not self.count:
+            return
+        with np.load(_ivf_path(directory, self.index_version)) as data:
+            self.centroids = data["centroids"]
+            self.rows = data["rows"]
+            self.offsets = data["offsets"]
+
+    def _top(self, embedding, k):
+        if not self.count:
+            return []
+        rows, scores = search_ivf(self.vectors, self.centroids, self.rows, self.offsets,
+                                  normalize(embedding), k, self.nprobe)
+        return [(int(i), float(score)) for i, score in zip(rows, scores)]
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import logging
+import threading
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 時間のヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 1リクエストあたりのchatbot↔toolsの往復回数のヒストグラムの区切り
+LOOP_BUCKETS = (0, 1, 2, 3, 5, 8)
+# Prometheusのテキスト形式のContent-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# リクエスト毎のトレースを書き出すロガー（環境変数 TRACE_LOG にファイルのパスを指定するとJSON Linesで保存）
+trace_logger = logging.getLogger("chatbot.trace")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+# ===== メトリクス =====
+class Counter:
+    """
+    ラベル毎に値を足していくカウンターです。
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    """
+    ラベル毎に観測値の分布（区切り毎の件数・合計・件数）を記録するヒストグラムです。
+    """
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # ラベルの値 → [区切り毎の件数のリスト, 合計, 件数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels[name] for name in self.labels))
+        return entry[2] if entry else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', f'{bound:g}'))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    チャットボットのメトリクス（ノード・ツールの時間、トークン数、往復回数）をまとめて保持します。
+    値はプロセス毎に保持します（ワーカーが複数の場合は、ワーカー毎に収集してください）。
+    """
+
+    def __init__(self):
+        self.requests = Counter("chatbot_requests_total", "グラフを実行したリクエストの数", ("status",))
+        self.request_seconds = Histogram("chatbot_request_duration_seconds", "1リクエストのグラフの実行時間")
+        self.node_seconds = Histogram("chatbot_node_duration_seconds", "ノード毎の実行時間", ("node",))
+        self.tool_seconds = Histogram("chatbot_tool_duration_seconds", "ツール毎の実行時間", ("tool", "status"))
+        self.tokens = Counter("chatbot_tokens_total", "モデルのトークン数", ("type",))
+        self.loops = Histogram("chatbot_tool_loops", "1リクエストあたりのchatbot↔toolsの往復回数", buckets=LOOP_BUCKETS)
+        self.routes = Counter("chatbot_routes_total", "入口で振り分けた発言の数（simple: ツールなしの回答, agent: エージェント）", ("route",))
+
+    def all(self):
+        return [self.requests, self.request_seconds, self.node_seconds, self.tool_seconds, self.tokens, self.loops,
+                self.routes]
+
+    def render(self):
+        """
+        Prometheusのテキスト形式で返します。
+        """
+        return "\n".join(line for metric in self.all() for line in metric.render()) + "\n"
+
+# プロセス内で共有するメトリクス
+metrics = MetricsRegistry()
+
+# ===== リクエスト毎の計測 =====
+class RequestTracer(BaseCallbackHandler):
+    """
+    グラフの実行に callbacks として渡し、1リクエストのノード・ツールの実行時間とトークン数を記録します。
+    リクエストの終わりに finish() を呼ぶと（with文でも可）、メトリクスに加えてトレースをログに書き出します。
+    """
+
+    # 非同期の実行でも、コールバックを別スレッドに回さずその場で呼ぶ
+    run_inline = True
+
+    def __init__(self, thread_id=None, registry=metrics):
+        self.thread_id = thread_id
+        self.registry = registry
+        self.started = time.perf_counter()
+        # 実行中のノード・ツール: run_id → (種類, 名前, 開始時刻)
+        self._running = {}
+        # 終わったノード・ツール（トレース用）
+        self.spans = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, kind, name):
+        with self._lock:
+            self._running[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id, status):
+        with self._lock:
+            entry = self._running.pop(run_id, None)
+        if entry is None:
+            return
+        kind, name, started = entry
+        seconds = time.perf_counter() - started
+        if kind == "node":
+            self.registry.node_seconds.observe(seconds, node=name)
+        else:
+            self.registry.tool_seconds.observe(seconds, tool=name, status=status)
+        with self._lock:
+            self.spans.append({"type": kind, "name": name, "status": status,
+                               "start": round(started - self.started, 4), "seconds": round(seconds, 4)})
+
+    # ===== ノード =====
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        # グラフのノードそのものの実行（ノード内の処理は除く）だけを計測する
+        node = (metadata or {}).get("langgraph_node")
+        if node and node == kwargs.get("name") and any(tag.startswith("graph:step:") for tag in tags or []):
+            self._start(run_id, "node", node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, "success")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    # ===== ツール =====
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", "unknown"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, getattr(output, "status", "success"))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    # ===== トークン数 =====
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                with self._lock:
+                    self.prompt_tokens += usage.get("input_tokens", 0)
+                    self.completion_tokens += usage.get("output_tokens", 0)
+
+    # ===== リクエストの終わり =====
+    def finish(self, error=None):
+        """
+        リクエストのメトリクスを記録し、トレースをログに書き出します。トレースの辞書を返します。
+        終わっていないツール（制限時間で打ち切られたもの）は timeout として記録します。
+        """
+        for run_id, (kind, _, _) in list(self._running.items()):
+            self._end(run_id, "timeout" if kind == "tool" else "cancelled")
+        seconds = time.perf_counter() - self.started
+        status = "success" if error is None else type(error).__name__
+        loops = sum(1 for span in self.spans if span["type"] == "node" and span["name"] == "tools")
+
+        self.registry.requests.inc(status=status)
+        self.registry.request_seconds.observe(seconds)
+        self.registry.loops.observe(loops)
+        self.registry.tokens.inc(self.prompt_tokens, type="prompt")
+        self.registry.tokens.inc(self.completion_tokens, type="completion")
+
+        trace = {
+            "thread_id": self.thread_id, "status": status, "seconds": round(seconds, 4), "loops": loops,
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+        trace_logger.info(json.dumps(trace, ensure_ascii=False))
+        return trace
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        return False
+
+# ===== トレースの書き出し先 =====
+def configure_trace_log():
+    """
+    環境変数 TRACE_LOG にパスが設定されていれば、リクエスト毎のトレースをそのファイルにJSON Linesで追記します。
+    """
+    path = os.environ.get("TRACE_LOG")
+    if not path or any(getattr(handler, "baseFilename", None) == os.path.abspath(path)
+                       for handler in trace_logger.handlers):
+        return
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
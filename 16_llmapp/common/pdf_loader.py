@@ -0,0 +1,98 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pypdf
+from langchain_core.documents import Document
+
+# 1つのタスクで解析するページ数
+PAGES_PER_TASK = 8
+# 同時に解析するプロセスの数の既定値
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+# プロセス1つあたりに先行して投入するタスクの数（メモリ上のページ数の上限を決める）
+PENDING_PER_WORKER = 2
+
+# ===== ページの解析 =====
+def count_pages(path):
+    """
+    PDFのページ数を返します（テキストは取り出さない）。
+    """
+    return len(pypdf.PdfReader(path).pages)
+
+def _read_pages(reader, path, start, stop):
+    total_pages = len(reader.pages)
+    return [
+        Document(
+            page_content=reader.pages[page].extract_text(extraction_mode="plain").strip(),
+            metadata={"source": path, "total_pages": total_pages, "page": page,
+                      "page_label": reader.page_labels[page]},
+        )
+        for page in range(start, min(stop, total_pages))
+    ]
+
+def load_pdf_pages(path, start, stop):
+    """
+    PDFの start ページから stop - 1 ページまでを、ページ単位のDocumentのリストとして読み込みます。
+    テキストの取り出し方は PyPDFLoader と同じため、チャンクの本文（とID）は変わりません。
+    プロセスプールのワーカーで実行します。
+    """
+    return _read_pages(pypdf.PdfReader(path), path, start, stop)
+
+# ===== 並列の読み込み =====
+def _iter_in_process(files, pages_per_task):
+    """
+    このプロセスでPDFを1つずつ開き、pages_per_task ページ毎に返します。
+    """
+    for name, path in files.items():
+        reader = pypdf.PdfReader(path)
+        count = len(reader.pages)
+        for start in range(0, max(count, 1), pages_per_task):
+            stop = start + pages_per_task
+            yield name, _read_pages(reader, path, start, stop), stop >= count
+
+def iter_pdf_pages(files, max_workers=DEFAULT_MAX_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    {ファイル名: パス} のPDFをプロセスプールで並列に解析し、(ファイル名, ページのリスト, 最後かどうか) を順に返すジェネレーターです。
+    PDFは pages_per_task ページ毎のタスクに分けるため、1つの大きなPDFも複数のプロセスで解析します。
+    先行して投入するタスクの数を制限し、メモリ上のページ数を全体のページ数によらず一定に保ちます。
+    ページはファイル順・ページ順に返します。
+    """
+    if max_workers <= 1:
+        yield from _iter_in_process(files, pages_per_task)
+        return
+
+    tasks = []
+    for name, path in files.items():
+        count = count_pages(path)
+        starts = list(range(0, max(count, 1), pages_per_task))
+        for i, start in enumerate(starts):
+            tasks.append((name, path, start, start + pages_per_task, i == len(starts) - 1))
+
+    # タスクが1つだけの場合は、プロセスを起動せずにこのプロセスで解析する
+    if len(tasks) <= 1:
+        yield from _iter_in_process(files, pages_per_task)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        pending = deque()
+        remaining = iter(tasks)
+
+        def submit():
+            for name, path, start, stop, last in remaining:
+                pending.append((name, last, executor.submit(load_pdf_pages, path, start, stop)))
+                return
+
+        for _ in range(max_workers * PENDING_PER_WORKER):
+            submit()
+        while pending:
+            name, last, future = pending.popleft()
+            pages = future.result()
+            # 受け取った分だけ次のタスクを投入する
+            submit()
+            yield name, pages, last
+
+def iter_documents(files, load_documents):
+    """
+    {ファイル名: パス} のファイルを load_documents(path) で1つずつ読み込み、iter_pdf_pages と同じ形式で返します。
+    """
+    for name, path in files.items():
+        yield name, load_documents(path), True
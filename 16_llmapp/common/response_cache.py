@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# 同じ質問とみなすコサイン類似度の下限
+DEFAULT_THRESHOLD = 0.95
+# 回答を保持する時間（秒）
+DEFAULT_TTL_SECONDS = 60 * 60
+# 保持する回答の数の上限
+DEFAULT_MAX_ENTRIES = 1000
+
+# ===== 回答のキャッシュ =====
+class ResponseCache:
+    """
+    質問のエンベディングの類似度で、ほぼ同じ質問に対する過去の回答を返すキャッシュです。
+    回答はスコープ（モデル名とインデックスのバージョンなど）毎に分け、
+    PDFの更新やモデルの変更で古い回答が返らないようにします。
+    保持数が上限を超えると最も長く使われていない回答から削除し（LRU）、
+    一定時間を過ぎた回答も使いません（TTL）。
+    """
+
+    def __init__(self, embeddings, threshold=DEFAULT_THRESHOLD, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # （スコープ, 質問）→ {"vector", "answer", "created"}（古い順に並ぶ）
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        """
+        質問をエンベディングし、長さ1に正規化したベクトルを返します。
+        """
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry["created"] > self.ttl_seconds
+
+    def lookup(self, question, scope):
+        """
+        スコープ内で質問に最も近い回答を返します。類似度が閾値未満の場合は None を返します。
+        """
+        now = time.time()
+        with self._lock:
+            # 完全に同じ質問であればエンベディングせずに返す
+            entry = self._entries.get((scope, question))
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end((scope, question))
+                self.hits += 1
+                return entry["answer"]
+
+        vector = self._embed(question)
+        with self._lock:
+            keys = []
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                elif key[0] == scope:
+                    keys.append(key)
+            if keys:
+                vectors = np.stack([self._entries[key]["vector"] for key in keys])
+                similarities = vectors @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, question, scope, answer):
+        """
+        質問に対する回答を保存します。
+        """
+        vector = self._embed(question)
+        with self._lock:
+            self._entries[(scope, question)] = {"vector": vector, "answer": answer, "created": time.time()}
+            self._entries.move_to_end((scope, question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# ===== キャッシュの作成 =====
+def create_response_cache(embeddings):
+    """
+    環境変数 RESPONSE_CACHE=1 の場合に回答のキャッシュを作成します。無効の場合は None を返します。
+    閾値・TTL・上限は RESPONSE_CACHE_THRESHOLD / RESPONSE_CACHE_TTL_SECONDS / RESPONSE_CACHE_MAX_ENTRIES で変更できます。
+    """
+    if os.environ.get("RESPONSE_CACHE", "0") != "1":
+        return None
+    return ResponseCache(
+        embeddings,
+        threshold=float(os.environ.get("RESPONSE_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+        ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
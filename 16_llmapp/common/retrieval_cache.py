@@ -0,0 +1,98 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable
+from pydantic import PrivateAttr
+from langchain_core.retrievers import BaseRetriever
+
+# 保持する検索結果の数の上限
+DEFAULT_MAX_ENTRIES = 256
+
+# 同じ質問とみなすために取り除く空白と文末の記号
+_SPACE_PATTERN = re.compile(r"\s+")
+_TRAILING_PATTERN = re.compile(r"[。．.！!？?、,\s]+$")
+
+def normalize_query(query):
+    """
+    表記の揺れ（全角・半角、大文字・小文字、空白、文末の記号）をそろえた質問を返します。
+    """
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = _SPACE_PATTERN.sub(" ", query).strip()
+    return _TRAILING_PATTERN.sub("", query)
+
+# ===== 検索結果のキャッシュ =====
+class CachedRetriever(BaseRetriever):
+    """
+    Retrieverの検索結果を、インデックスのバージョンと質問毎にメモリ上に保持するラッパーです。
+    モデルは同じ会話の中でほぼ同じ質問で何度も検索するため、2回目以降はエンベディングも検索も省きます。
+    PDFが更新されてインデックスのバージョンが変わると、古い検索結果は使いません。
+    保持数が上限を超えると最も長く使われていない結果から削除します（LRU）。
+    """
+
+    retriever: BaseRetriever
+    # インデックスのバージョンを返す関数
+    version: Callable[[], str]
+    max_entries: int = DEFAULT_MAX_ENTRIES
+    # キャッシュを使った回数と、使えなかった回数
+    hits: int = 0
+    misses: int = 0
+
+    # （バージョン, 質問）→ Documentのリスト（古い順に並ぶ）
+    _entries: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _lookup(self, key):
+        with self._lock:
+            documents = self._entries.get(key)
+            if documents is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(documents)
+
+    def _store(self, key, documents):
+        with self._lock:
+            # バージョンが変わった場合は、古いバージョンの結果をまとめて削除する
+            for old_key in [k for k in self._entries if k[0] != key[0]]:
+                del self._entries[old_key]
+            self._entries[key] = list(documents)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        key = (self.version(), normalize_query(query))
+        documents = self._lookup(key)
+        if documents is None:
+            documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            self._store(key, documents)
+        return documents
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        key = (self.version(), normalize_query(query))
+        documents = self._lookup(key)
+        if documents is None:
+            documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+            self._store(key, documents)
+        return documents
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# ===== キャッシュの作成 =====
+def create_cached_retriever(retriever, version):
+    """
+    検索結果のキャッシュで retriever を包みます。
+    保持数の上限は RETRIEVAL_CACHE_MAX_ENTRIES で変更でき、0 の場合はキャッシュせずにそのまま返します。
+    """
+    max_entries = int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    if max_entries <= 0:
+        return retriever
+    return CachedRetriever(retriever=retriever, version=version, max_entries=max_entries)
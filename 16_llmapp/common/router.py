@@ -0,0 +1,60 @@
+import re
+from langchain_core.messages import HumanMessage
+from common.retrieval_cache import normalize_query
+from common.metrics import metrics
+
+# ツールを使わない回答に振り分ける発言の長さの上限（文字数）
+DEFAULT_MAX_CHARS = 40
+
+# 社内規程の検索やWeb検索が必要になりやすい言葉（含まれる場合はエージェントに進む）
+TOOL_KEYWORDS = (
+    "規程", "規則", "規定", "社内", "会社", "就業", "休暇", "休日", "有給", "経費", "手当", "給与",
+    "申請", "制度", "最新", "ニュース", "今日", "今週", "現在", "天気", "検索", "調べ", "イベント", "http",
+)
+
+# 挨拶・お礼（normalize_query で文末の記号を取り除いた後の発言と比べる）
+SMALL_TALK_PATTERN = re.compile(
+    r"^(こんにちは|こんばんは|おはよう(ございます)?|ありがとう(ございます)?|はじめまして|"
+    r"よろしく(お願いします)?|さようなら|hello|hi|thanks?( you)?)$"
+)
+
+# 数の計算（「1たす2は」「12 * 3 は いくつ」など）
+_NUMBER = r"\d+(\.\d+)?"
+_OPERATOR = r"(たす|足す|ひく|引く|かける|掛ける|わる|割る|[-+*/×÷])"
+ARITHMETIC_PATTERN = re.compile(
+    rf"^{_NUMBER}(\s*{_OPERATOR}\s*{_NUMBER})+\s*(は|って|=)?\s*(いくつ|何|なに|なん)?\s*(ですか|でしょう)?$"
+)
+
+def classify_turn(text, max_chars=DEFAULT_MAX_CHARS):
+    """
+    ユーザーの発言を "simple"（ツールを使わずに答えられる挨拶・計算）か "agent"（ツールを使うエージェント）に分類します。
+    迷う発言はすべて "agent" にします（ツールが必要な質問を取りこぼさないため）。
+    """
+    query = normalize_query(text)
+    if not query or len(query) > max_chars:
+        return "agent"
+    if any(keyword in query for keyword in TOOL_KEYWORDS):
+        return "agent"
+    if SMALL_TALK_PATTERN.match(query) or ARITHMETIC_PATTERN.match(query):
+        return "simple"
+    return "agent"
+
+# ===== 入口の振り分け =====
+class TurnRouter:
+    """
+    グラフの入口で、最後のユーザーの発言をツールを使わない回答とエージェントに振り分けます。
+    振り分けた回数をメトリクス（chatbot_routes_total）に記録し、削減できた呼び出しを確認できるようにします。
+    """
+
+    def __init__(self, registry=metrics, max_chars=DEFAULT_MAX_CHARS):
+        self.registry = registry
+        self.max_chars = max_chars
+
+    def __call__(self, state):
+        message = state["messages"][-1]
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            route = classify_turn(message.content, self.max_chars)
+        else:
+            route = "agent"
+        self.registry.routes.inc(route=route)
+        return route
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Any, Optional
+from pydantic import PrivateAttr
+from langchain_core.tools import BaseTool
+from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.tools.tavily_search.tool import TavilyInput
+from common.retrieval_cache import normalize_query
+
+# 検索結果を保持する時間（秒）。イベントやニュースの検索が多いため短めにする
+DEFAULT_TTL_SECONDS = 10 * 60
+# 期限切れの検索結果を削除する間隔（秒）
+CLEANUP_INTERVAL_SECONDS = 10 * 60
+# 1回の検索で返す結果の数
+DEFAULT_MAX_RESULTS = 2
+# 検索の方式（環境変数 SEARCH_BACKEND で選択）
+SEARCH_BACKENDS = ("tavily", "local")
+
+# ===== 検索結果の保存先 =====
+class SearchResultStore:
+    """
+    Web検索の結果を、正規化した質問毎にSQLiteファイル（WALモード）に保存します。
+    複数のワーカープロセスから同じファイルを共有できます。
+    保存から ttl_seconds 秒を過ぎた結果は使わず、一定の間隔でまとめて削除します。
+    """
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_results ("
+            " scope TEXT NOT NULL,"
+            " query TEXT NOT NULL,"
+            " results TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " PRIMARY KEY (scope, query))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS search_results_created ON search_results (created)")
+        self.conn.commit()
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    def get(self, scope, query):
+        """
+        保存から ttl_seconds 秒以内の検索結果を返します。なければ None を返します。
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT results FROM search_results WHERE scope = ? AND query = ? AND created >= ?",
+                (scope, query, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, scope, query, results):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_results (scope, query, results, created) VALUES (?, ?, ?, ?)",
+                (scope, query, json.dumps(results, ensure_ascii=False), now),
+            )
+            if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL_SECONDS:
+                self._last_cleanup = time.monotonic()
+                self.conn.execute("DELETE FROM search_results WHERE created < ?", (now - self.ttl_seconds,))
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM search_results")
+
+# ===== キャッシュ付きの検索ツール =====
+class CachedSearchTool(BaseTool):
+    """
+    Web検索ツールの結果を、正規化した質問毎に SearchResultStore に保存して再利用するラッパーです。
+    名前・説明・引数は元のツールと同じため、モデルやツールの制限時間の設定からは区別できません。
+    検索に失敗した場合（結果がリストでない場合）は保存しません。
+    """
+
+    tool: BaseTool
+    store: Any
+    # 検索の方式や結果の数が異なる場合に、結果を分けるためのキー
+    scope: str
+    # キャッシュを使った回数と、使えなかった回数
+    hits: int = 0
+    misses: int = 0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _run(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        key = normalize_query(query)
+        results = self.store.get(self.scope, key)
+        self._count(results is not None)
+        if results is not None:
+            return results
+        results = self.tool.invoke({"query": query})
+        if isinstance(results, list):
+            self.store.put(self.scope, key, results)
+        return results
+
+    async def _arun(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        # SQLiteの読み書きは別スレッドで行い、イベントループを止めない
+        key = normalize_query(query)
+        results = await asyncio.to_thread(self.store.get, self.scope, key)
+        self._count(results is not None)
+        if results is not None:
+            return results
+        results = await self.tool.ainvoke({"query": query})
+        if isinstance(results, list):
+            await asyncio.to_thread(self.store.put, self.scope, key, results)
+        return results
+
+# ===== ローカルの検索ツール =====
+class LocalSearchTool(BaseTool):
+    """
+    Web検索の代わりに、あらかじめ用意した結果を返すツールです（APIを呼ばない）。
+    ベンチマークやテストで、検索を含む処理をオフラインで実行するために使います。
+    latency 秒待ってから返すため、Web検索の待ち時間を再現できます。
+    """
+
+    name: str = "tavily_search_results_json"
+    description: str = TavilySearchResults.model_fields["description"].default
+    args_schema: Any = TavilyInput
+    # 正規化した質問 → 検索結果のリスト
+    results: dict = {}
+    latency: float = 0.0
+    max_results: int = DEFAULT_MAX_RESULTS
+    # 検索した回数
+    calls: int = 0
+
+    def _search(self, query):
+        self.calls += 1
+        results = self.results.get(normalize_query(query))
+        if results is None:
+            results = [{"url": f"https://example.com/search?q={query}", "content": f"「{query}」の検索結果（ローカル）"}]
+        return results[:self.max_results]
+
+    def _run(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        time.sleep(self.latency)
+        return self._search(query)
+
+    async def _arun(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        await asyncio.sleep(self.latency)
+        return self._search(query)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        {質問: 検索結果のリスト} のJSONファイルから作成します。
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        return cls(results={normalize_query(query): items for query, items in results.items()}, **kwargs)
+
+# ===== 検索ツールの作成 =====
+def create_search_tool(cache_path, max_results=DEFAULT_MAX_RESULTS):
+    """
+    Web検索ツールを作成します。
+    環境変数 SEARCH_BACKEND=local の場合は LocalSearchTool を使います
+    （結果のJSONファイルを LOCAL_SEARCH_RESULTS、待ち時間（秒）を LOCAL_SEARCH_LATENCY で指定）。
+    検索結果は cache_path（環境変数 SEARCH_CACHE_DB で変更可）に SEARCH_CACHE_TTL_SECONDS 秒保存し、
+    0 の場合は保存しません。
+    """
+    backend = os.environ.get("SEARCH_BACKEND", "tavily")
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"SEARCH_BACKEND は {SEARCH_BACKENDS} のいずれかを指定してください: {backend}")
+    if backend == "local":
+        latency = float(os.environ.get("LOCAL_SEARCH_LATENCY", 0))
+        results_path = os.environ.get("LOCAL_SEARCH_RESULTS")
+        if results_path:
+            tool = LocalSearchTool.from_file(results_path, latency=latency, max_results=max_results)
+        else:
+            tool = LocalSearchTool(latency=latency, max_results=max_results)
+    else:
+        tool = TavilySearchResults(max_results=max_results)
+
+    ttl_seconds = float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    if not ttl_seconds:
+        return tool
+    store = SearchResultStore(os.environ.get("SEARCH_CACHE_DB", cache_path), ttl_seconds=ttl_seconds)
+    return CachedSearchTool(
+        name=tool.name, description=tool.description, args_schema=tool.args_schema,
+        tool=tool, store=store, scope=f"{backend}:{max_results}",
+    )
@@ -0,0 +1,95 @@
+import os
+import time
+import asyncio
+import sqlite3
+from langgraph.checkpoint.sqlite import SqliteSaver
+from common.checkpoint import DEFAULT_TTL_SECONDS
+
+# 期限切れのスレッドを削除する間隔（秒）
+CLEANUP_INTERVAL_SECONDS = 10 * 60
+
+# ===== SQLiteのチェックポインター =====
+class SqliteCheckpointer(SqliteSaver):
+    """
+    会話の状態をSQLiteファイル（WALモード）に保存するチェックポインターです。
+    複数のワーカープロセスから同じファイルを共有でき、再起動しても会話が残ります。
+    スレッド単位の削除と、一定時間更新のないスレッドの削除（TTL）に対応します。
+    非同期の実行（ainvoke/astream）では、SQLiteの読み書きを別スレッドで行います。
+    """
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # 読み込みと書き込みを並行できるWALモードにする
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # スレッド毎の最終更新時刻（TTLによる削除に使う）
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_activity ("
+            " thread_id TEXT PRIMARY KEY,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS thread_activity_updated_at ON thread_activity (updated_at)")
+        conn.commit()
+        super().__init__(conn)
+        self.ttl_seconds = ttl_seconds
+        self._last_cleanup = 0.0
+
+    def put(self, config, *args, **kwargs):
+        result = super().put(config, *args, **kwargs)
+        self._touch(config["configurable"]["thread_id"])
+        self._cleanup_if_due()
+        return result
+
+    # ===== 非同期版（イベントループを止めないよう別スレッドで実行） =====
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _touch(self, thread_id):
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                (str(thread_id), time.time()),
+            )
+
+    def _cleanup_if_due(self):
+        now = time.monotonic()
+        if self.ttl_seconds and now - self._last_cleanup >= CLEANUP_INTERVAL_SECONDS:
+            self._last_cleanup = now
+            self.cleanup_expired()
+
+    def delete_thread(self, thread_id):
+        """
+        指定したスレッドのチェックポイントと書き込みをすべて削除します。
+        """
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def cleanup_expired(self, ttl_seconds=None):
+        """
+        最後の更新から ttl_seconds 秒以上経過したスレッドを削除し、削除した数を返します。
+        """
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        cutoff = time.time() - ttl_seconds
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,))
+            expired = [row[0] for row in cur.fetchall()]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from typing import Annotated
+from typing_extensions import TypedDict
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
+from common.checkpoint import BoundedMemorySaver
+from common.sqlite_checkpoint import SqliteCheckpointer
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+def build_echo_graph(memory):
+    """
+    テスト用のグラフ。ユーザーのメッセージをそのまま返します（モデルは呼びません）。
+    """
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("chatbot", lambda state: {"messages": [AIMessage(content=state["messages"][-1].content)]})
+    graph_builder.set_entry_point("chatbot")
+    return graph_builder.compile(checkpointer=memory)
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "checkpoints.db")
+
+def test_sqlite_checkpointer_persists_across_instances(db_path):
+    """
+    別のインスタンス（別のワーカープロセス）からも会話を読み込めるかをテスト。
+    """
+    build_echo_graph(SqliteCheckpointer(db_path)).invoke({"messages": [("user", "こんにちは")]}, config("a"))
+
+    memory = SqliteCheckpointer(db_path)
+    messages = memory.get(config("a"))["channel_values"]["messages"]
+    assert [m.content for m in messages] == ["こんにちは", "こんにちは"], "保存した会話が読み込めるべきです。"
+    assert memory.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal", "WALモードで開かれるべきです。"
+
+def test_sqlite_checkpointer_deletes_single_thread(db_path):
+    """
+    スレッド単位の削除で他のスレッドの会話が残るかをテスト。
+    """
+    memory = SqliteCheckpointer(db_path)
+    graph = build_echo_graph(memory)
+    graph.invoke({"messages": [("user", "A")]}, config("a"))
+    graph.invoke({"messages": [("user", "B")]}, config("b"))
+
+    memory.delete_thread("a")
+    assert memory.get(config("a")) is None, "削除したスレッドは残っているべきではありません。"
+    assert memory.get(config("b")) is not None, "他のスレッドは残っているべきです。"
+
+def test_sqlite_checkpointer_cleanup_expired(db_path):
+    """
+    一定時間更新のないスレッドがTTLで削除されるかをテスト。
+    """
+    memory = SqliteCheckpointer(db_path)
+    graph = build_echo_graph(memory)
+    graph.invoke({"messages": [("user", "A")]}, config("old"))
+    memory.conn.execute("UPDATE thread_activity SET updated_at = 0 WHERE thread_id = 'old'")
+    graph.invoke({"messages": [("user", "B")]}, config("new"))
+
+    assert memory.cleanup_expired(ttl_seconds=60) == 1, "期限切れのスレッドだけが削除されるべきです。"
+    assert memory.get(config("old")) is None, "期限切れのスレッドは削除されるべきです。"
+    assert memory.get(config("new")) is not None, "最近更新されたスレッドは残っているべきです。"
+
+def test_sqlite_checkpointer_supports_async(db_path):
+    """
+    非同期の実行（ainvoke）でも会話の保存・読み込み・削除ができるかをテスト。
+    """
+    memory = SqliteCheckpointer(db_path)
+    graph = build_echo_graph(memory)
+
+    async def run():
+        await graph.ainvoke({"messages": [("user", "A")]}, config("a"))
+        await graph.ainvoke({"messages": [("user", "B")]}, config("a"))
+        state = await graph.aget_state(config("a"))
+        await memory.adelete_thread("a")
+        return state
+
+    state = asyncio.run(run())
+    assert [m.content for m in state.values["messages"]] == ["A", "A", "B", "B"], "非同期でも会話が引き継がれるべきです。"
+    assert memory.get(config("a")) is None, "非同期でもスレッドを削除できるべきです。"
+
+def test_bounded_memory_deletes_single_thread():
+    """
+    スレッド単位の削除で他のユーザーの会話が残るかをテスト。
+    """
+    memory = BoundedMemorySaver()
+    graph = build_echo_graph(memory)
+    graph.invoke({"messages": [("user", "A")]}, config("a"))
+    graph.invoke({"messages": [("user", "B")]}, config("b"))
+
+    memory.delete_thread("a")
+    assert memory.get(config("a")) is None, "削除したスレッドは残っているべきではありません。"
+    assert not any(key[0] == "a" for key in memory.writes), "削除したスレッドの書き込みは残っているべきではありません。"
+    assert memory.get(config("b")) is not None, "他のスレッドは残っているべきです。"
+
+def test_bounded_memory_evicts_least_recently_used():
+    """
+    スレッド数が上限を超えると、最も長く使われていないスレッドから削除されるかをテスト。
+    """
+    memory = BoundedMemorySaver(max_threads=2)
+    graph = build_echo_graph(memory)
+    graph.invoke({"messages": [("user", "A")]}, config("a"))
+    graph.invoke({"messages": [("user", "B")]}, config("b"))
+    memory.get(config("a"))
+    graph.invoke({"messages": [("user", "C")]}, config("c"))
+
+    assert memory.get(config("b")) is None, "最も長く使われていないスレッドが削除されるべきです。"
+    assert memory.get(config("a")) is not None, "最近使われたスレッドは残っているべきです。"
+    assert memory.get(config("c")) is not None, "新しいスレッドは残っているべきです。"
+
+def test_bounded_memory_evicts_expired_threads():
+    """
+    一定時間使われていないスレッドがTTLで削除されるかをテスト。
+    """
+    memory = BoundedMemorySaver(ttl_seconds=60)
+    graph = build_echo_graph(memory)
+    graph.invoke({"messages": [("user", "A")]}, config("old"))
+    memory._last_used["old"] -= 120
+    graph.invoke({"messages": [("user", "B")]}, config("new"))
+
+    assert memory.get(config("old")) is None, "期限切れのスレッドは削除されるべきです。"
+    assert memory.get(config("new")) is not None, "最近使われたスレッドは残っているべきです。"
@@ -0,0 +1,89 @@
+import pytest
+from langchain_core.documents import Document
+from common.chunker import JapaneseTextSplitter, split_units, BREAK_NONE, BREAK_LINE, BREAK_SECTION
+
+RULES = """第1章 総則
+第1条（目的）
+この規則は、従業員の就業に関する事項を
+定めるものである。会社と従業員は、この規則を誠実に守らなければならない。
+第2条（適用範囲）この規則は、すべての従業員に適用する。
+ただし、パートタイマーについては別に定める。
+（1）正社員
+（2）契約社員
+"""
+
+class CountingEncoding:
+    """
+    テスト用のエンコーディング。1文字を1トークンとして扱い、エンコードした文字数を数えます。
+    """
+    name = "char"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return list(text)
+
+@pytest.fixture
+def encoding():
+    return CountingEncoding()
+
+def test_split_units_keeps_sentences_and_headings():
+    """
+    折り返された行がつながり、文・見出し・箇条書きの区切りが分かるかをテスト。
+    """
+    units = split_units(RULES)
+    assert ("第1条（目的）", BREAK_SECTION) in units, "見出しの行は節の始まりになるべきです。"
+    assert ("この規則は、従業員の就業に関する事項を定めるものである。", BREAK_LINE) in units, "PDFの折り返しはつなげるべきです。"
+    assert ("会社と従業員は、この規則を誠実に守らなければならない。", BREAK_NONE) in units, "。で文を区切るべきです。"
+    assert ("（1）正社員", BREAK_LINE) in units, "箇条書きは改行として扱うべきです。"
+
+def test_chunks_follow_sections(encoding):
+    """
+    見出しの位置で新しいチャンクが始まり、トークン数の上限を超えないかをテスト。
+    """
+    splitter = JapaneseTextSplitter(encoding, chunk_tokens=80, overlap_tokens=10, min_chunk_tokens=10)
+    chunks = splitter.split_text_with_tokens(RULES)
+
+    assert len(chunks) == 2, "条の見出しの位置で分けるべきです。"
+    assert chunks[0][0].startswith("第1章 総則\n第1条（目的）\n"), "見出しは本文と改行で区切るべきです。"
+    assert chunks[1][0].startswith("第2条（適用範囲）"), "条の見出しから新しいチャンクが始まるべきです。"
+    assert all(tokens <= 80 for _, tokens in chunks), "チャンクはトークン数の上限を超えるべきではありません。"
+    assert all(tokens == len(text.replace("\n", "")) for text, tokens in chunks), "トークン数は文のトークン数の合計であるべきです。"
+
+def test_chunks_overlap_and_encode_once(encoding):
+    """
+    上限で分けたチャンクが前の文を引き継ぎ、各文が1回だけエンコードされるかをテスト。
+    """
+    text = "".join(f"これは{i}番目の文です。" for i in range(20))
+    splitter = JapaneseTextSplitter(encoding, chunk_tokens=40, overlap_tokens=12, min_chunk_tokens=10)
+    chunks = splitter.split_text(text)
+
+    assert len(chunks) > 1, "上限を超えるテキストは複数のチャンクに分けるべきです。"
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous.split("。")[-2] + "。"
+        assert current.startswith(last_sentence), "前のチャンクの末尾の文を引き継ぐべきです。"
+    assert len(encoding.encoded) == 20, "各文は1回だけエンコードされるべきです。"
+
+def test_long_sentence_is_split(encoding):
+    """
+    上限を超える長い文が、読点または文字数で分けられるかをテスト。
+    """
+    text = "あ" * 50 + "、" + "い" * 120 + "。"
+    splitter = JapaneseTextSplitter(encoding, chunk_tokens=60, overlap_tokens=0, min_chunk_tokens=10)
+    chunks = splitter.split_text_with_tokens(text)
+
+    assert all(tokens <= 60 for _, tokens in chunks), "長い文も上限を超えないように分けるべきです。"
+    assert "".join(text for text, _ in chunks) == text, "分けた文をつなげると元の文に戻るべきです。"
+
+def test_split_documents_records_tokens(encoding):
+    """
+    チャンクのメタデータに元のメタデータとトークン数が記録されるかをテスト。
+    """
+    splitter = JapaneseTextSplitter(encoding, chunk_tokens=80, overlap_tokens=10, min_chunk_tokens=10)
+    chunks = splitter.split_documents([Document(page_content=RULES, metadata={"source": "rules.pdf", "page": 0})])
+
+    assert all(chunk.metadata["source"] == "rules.pdf" for chunk in chunks), "元のメタデータを引き継ぐべきです。"
+    assert all(chunk.metadata["tokens"] > 0 for chunk in chunks), "トークン数が記録されるべきです。"
+    assert splitter.signature != JapaneseTextSplitter(encoding, chunk_tokens=100).signature, "設定が変わると署名が変わるべきです。"
@@ -0,0 +1,109 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+from common.context import ContextManager, compress_tool_messages, count_tokens
+
+class CharEncoding:
+    """
+    テスト用のエンコーディング。1文字を1トークンとして扱います。
+    """
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def decode(self, tokens):
+        return "".join(chr(t) for t in tokens)
+
+def turn(question, tool_result, answer):
+    """
+    ツール呼び出しを含む1ターン分のメッセージを作成します。
+    """
+    call_id = f"call_{question}"
+    return [
+        HumanMessage(content=question),
+        AIMessage(content="", tool_calls=[{"name": "retrieve_company_rules", "args": {"query": question}, "id": call_id}]),
+        ToolMessage(content=tool_result, tool_call_id=call_id),
+        AIMessage(content=answer),
+    ]
+
+@pytest.fixture
+def encoding():
+    return CharEncoding()
+
+def test_compress_tool_messages_keeps_current_turn(encoding):
+    """
+    過去のターンのツール結果だけが切り詰められるかをテスト。
+    """
+    messages = turn("質問1", "あ" * 100, "回答1") + turn("質問2", "い" * 100, "回答2")[:3]
+    compressed = compress_tool_messages(messages, encoding, max_tool_tokens=10)
+    assert compressed[2].content.startswith("あ" * 10) and len(compressed[2].content) < 100, "過去のツール結果は切り詰められるべきです。"
+    assert compressed[6].content == "い" * 100, "現在のターンのツール結果はそのまま残すべきです。"
+    assert messages[2].content == "あ" * 100, "元のメッセージは変更されるべきではありません。"
+
+def test_context_manager_trims_to_budget(encoding):
+    """
+    履歴が上限のトークン数に収まり、ユーザー発言から始まるかをテスト。
+    """
+    messages = []
+    for i in range(10):
+        messages += turn(f"質問{i}", "結果" * 20, f"回答{i}")
+    messages.append(HumanMessage(content="最新の質問"))
+
+    manager = ContextManager(encoding, max_tokens=200, max_tool_tokens=10)
+    window, update = manager.prepare({"messages": messages})
+
+    assert count_tokens(window, encoding) <= 200, "上限のトークン数に収まるべきです。"
+    assert isinstance(window[0], HumanMessage), "窓はユーザー発言から始まるべきです。"
+    assert window[-1].content == "最新の質問", "最新のメッセージは必ず残すべきです。"
+    assert update == {}, "要約を使わない場合は状態を更新すべきではありません。"
+
+def test_context_manager_counts_each_message_once(encoding):
+    """
+    窓を切り出すときも、次のターンでも、同じメッセージのトークン数を数え直さないかをテスト。
+    """
+    class CountingEncoding(CharEncoding):
+        calls = 0
+
+        def encode(self, text):
+            CountingEncoding.calls += 1
+            return super().encode(text)
+
+    messages = []
+    for i in range(30):
+        messages += turn(f"質問{i}", "結果" * 20, f"回答{i}")
+    messages.append(HumanMessage(content="最新の質問"))
+
+    counting = CountingEncoding()
+    manager = ContextManager(counting, max_tokens=10000, max_tool_tokens=10)
+    window, _ = manager.prepare({"messages": messages})
+    assert len(window) == len(messages)
+    # 切り詰めたツール結果は切り詰めるときにも1回ずつエンコードする
+    first_turn = CountingEncoding.calls
+    assert first_turn <= len(messages) + 30 * 2, "メッセージ毎に1回だけ数えるべきです。"
+
+    messages += [AIMessage(content="最新の回答"), HumanMessage(content="次の質問")]
+    CountingEncoding.calls = 0
+    manager.prepare({"messages": messages})
+    assert CountingEncoding.calls <= 30 + 2 + 1, "前のターンで数えたメッセージは数え直すべきではありません。"
+    assert manager.token_counter(window) == count_tokens(window, counting)
+
+def test_context_manager_summarizes_dropped_messages(encoding):
+    """
+    要約を有効にした場合、窓から外れた会話が要約されて先頭に付くかをテスト。
+    """
+    messages = []
+    for i in range(10):
+        messages += turn(f"質問{i}", "結果" * 20, f"回答{i}")
+    messages.append(HumanMessage(content="最新の質問"))
+
+    summary_llm = GenericFakeChatModel(messages=iter([AIMessage(content="有給休暇について質問された。")]))
+    manager = ContextManager(encoding, max_tokens=300, max_tool_tokens=10, summary_llm=summary_llm, max_summary_tokens=50)
+    window, update = manager.prepare({"messages": messages})
+
+    assert isinstance(window[0], SystemMessage) and "有給休暇" in window[0].content, "要約がシステムメッセージとして付くべきです。"
+    assert update["summary"] == "有給休暇について質問された。"
+    assert 0 < update["summarized_count"] < len(messages), "要約済みのメッセージ数が記録されるべきです。"
+
+    # 新たに窓から外れたメッセージがなければ、要約し直さない
+    window, update = manager.prepare({"messages": messages, **update})
+    assert update == {}, "要約済みの範囲は要約し直すべきではありません。"
+    assert "有給休暇" in window[0].content, "保存済みの要約が使われるべきです。"
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from common import embedding_cache
+from common.embedding_cache import CachedEmbeddings
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """
+    テスト用のエンベディング。エンベディングしたテキストの数を数えます。
+    """
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embedding_cache.db")
+
+def test_cached_embeddings_reuses_vectors(cache_path):
+    """
+    同じテキストのエンベディングがキャッシュから再利用されるかをテスト。
+    """
+    base = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake")
+    first = embeddings.embed_documents(["有給休暇", "給与", "有給休暇"])
+    assert base.calls == 2, "重複したテキストは1回だけエンベディングされるべきです。"
+
+    # 別のインスタンス（再起動後）からも再利用できる
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake")
+    second = embeddings.embed_documents(["有給休暇", "給与"])
+    assert base.calls == 2, "キャッシュ済みのテキストはエンベディングされるべきではありません。"
+    for cached, computed in zip(second, first):
+        assert cached == pytest.approx(computed, abs=1e-6), "キャッシュから同じベクトルが返されるべきです。"
+    assert embeddings.hits == 2
+
+    # モデル名が異なる場合は別のキーになる
+    CachedEmbeddings(base, cache_path, model_name="other").embed_query("有給休暇")
+    assert base.calls == 3, "モデル名が異なる場合はキャッシュを共有すべきではありません。"
+
+def test_cached_embeddings_evicts_least_recently_used(cache_path):
+    """
+    上限サイズを超えると最後に使われた時刻が古いものから削除されるかをテスト。
+    """
+    base = CountingEmbeddings(size=8)
+    # 8次元のfloat32は32バイトなので、3件までしか保持できない
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake", max_bytes=100)
+    for text in ["a", "b", "c"]:
+        embeddings.embed_query(text)
+    embeddings.embed_query("a")
+    embeddings.embed_query("d")
+    base.calls = 0
+
+    embeddings.embed_query("a")
+    assert base.calls == 0, "最近使われたベクトルは残っているべきです。"
+    embeddings.embed_query("b")
+    assert base.calls == 1, "最も古いベクトルは削除されているべきです。"
+
+def test_cached_embeddings_tracks_total_size_without_scanning(cache_path):
+    """
+    保存のたびに表全体の合計サイズを数えず、上限を超えたときだけ数え直すかをテスト。
+    """
+    base = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake", max_bytes=100)
+    statements = []
+    embeddings._conn.set_trace_callback(statements.append)
+
+    def scans():
+        return [s for s in statements if "SUM(size)" in s and "WHERE" not in s]
+
+    embeddings.embed_documents(["a", "b"])
+    embeddings._store([(embeddings._key("a"), [0.5] * 8)])
+    assert scans() == [], "上限を超えるまでは表全体を数えるべきではありません。"
+    assert embeddings._total_bytes == 64, "置き換えたベクトルの分は合計に重ねて数えるべきではありません。"
+
+    embeddings.embed_documents(["c", "d"])
+    assert len(scans()) == 1, "上限を超えたときだけ数え直すべきです。"
+    assert embeddings._total_bytes == embeddings._sum_sizes() <= 100
+
+def test_cached_embeddings_keeps_queries_in_memory(cache_path, monkeypatch):
+    """
+    同じ質問のエンベディングが、SQLiteを読まずにメモリから返されるかをテスト。
+    """
+    base = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake", query_cache_size=1)
+    vector = embeddings.embed_query("有給休暇")
+
+    def fail(keys):
+        raise AssertionError("メモリにある質問はSQLiteを読むべきではありません。")
+    monkeypatch.setattr(embeddings, "_lookup", fail)
+    assert embeddings.embed_query("有給休暇") == vector
+    assert base.calls == 1
+
+    monkeypatch.undo()
+    embeddings.embed_query("給与")
+    embeddings.embed_query("有給休暇")
+    assert base.calls == 2, "メモリから外れた質問はSQLiteから読むべきです。"
+
+def test_cached_embeddings_batches_last_used_updates(cache_path, monkeypatch):
+    """
+    キャッシュから読み出すたびにSQLiteへ書き込まず、最終利用時刻の更新をまとめて書き込むかをテスト。
+    ヒット・ミスの回数が、複数のスレッドから使っても正しく数えられるかもテスト。
+    """
+    def last_used(text):
+        with sqlite3.connect(cache_path) as conn:
+            return conn.execute("SELECT last_used FROM embeddings WHERE key = ?", (embeddings._key(text),)).fetchone()[0]
+
+    base = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(base, cache_path, model_name="fake")
+    embeddings.embed_documents(["有給休暇", "給与"])
+    stored = last_used("有給休暇")
+
+    changes = embeddings._conn.total_changes
+    embeddings.embed_documents(["有給休暇", "給与"])
+    assert embeddings._conn.total_changes == changes, "読み出しのたびに書き込むべきではありません。"
+    assert last_used("有給休暇") == stored
+
+    monkeypatch.setattr(embedding_cache, "TOUCH_FLUSH_SECONDS", 0)
+    embeddings.embed_documents(["有給休暇"])
+    assert last_used("有給休暇") > stored, "間隔を過ぎたら最終利用時刻をまとめて書き込むべきです。"
+    assert not embeddings._touched
+
+    monkeypatch.undo()
+    embeddings.hits = embeddings.misses = 0
+    threads = [threading.Thread(target=lambda: [embeddings.embed_documents(["有給休暇", "給与"]) for _ in range(50)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (embeddings.hits, embeddings.misses) == (800, 0), "ヒットの回数はロックを取って数えるべきです。"
@@ -0,0 +1,85 @@
+import uuid
+import httpx
+import openai
+import pytest
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+from langchain_chroma import Chroma
+from common.fake_openai import FakeOpenAIServer
+from common.embedding_pipeline import batch_by_tokens, embed_and_store, embed_with_retry, RateLimitGate
+
+def count_chars(text):
+    # テスト用のトークン数（1文字1トークンとみなす）
+    return len(text)
+
+@pytest.fixture
+def documents():
+    return [Document(page_content=f"第{i}条 規程の本文", metadata={"page": i}) for i in range(20)]
+
+def test_batch_by_tokens(documents):
+    """
+    バッチがトークン数と件数の上限を超えないかをテスト。
+    """
+    items = [(str(i), d) for i, d in enumerate(documents)]
+    batches = list(batch_by_tokens(items, count_chars, max_tokens=40, max_items=3))
+    assert sum(len(b) for b, _ in batches) == len(documents), "すべてのチャンクがバッチに含まれるべきです。"
+    assert all(tokens <= 40 and len(b) <= 3 for b, tokens in batches), "バッチは上限を超えるべきではありません。"
+
+def test_embed_and_store_with_fake_server(documents):
+    """
+    ローカルの擬似サーバーに対して、レート制限をリトライしながら全件を書き込めるかをテスト。
+    """
+    with FakeOpenAIServer(latency=0.01, rate_limit_failures=2) as server:
+        embedding_model = OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            api_key="test",
+            base_url=server.base_url,
+            check_embedding_ctx_length=False,
+            max_retries=0,
+        )
+        db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embedding_model)
+        ids = [str(i) for i in range(len(documents))]
+
+        stats = embed_and_store(db, zip(ids, documents), embedding_model, count_chars,
+                                max_tokens=40, max_workers=3, backoff=0.01)
+
+        assert stats["documents"] == len(documents), "すべてのチャンクがエンベディングされるべきです。"
+        assert stats["retries"] == 2, "レート制限を受けたリクエストはリトライされるべきです。"
+        assert server.embedded_inputs == len(documents), "各チャンクは1回だけエンベディングされるべきです。"
+        assert sorted(db.get()["ids"]) == sorted(ids), "すべてのチャンクがベクトルストアに書き込まれるべきです。"
+
+class FlakyEmbeddings:
+    """
+    テスト用のエンベディング。決められたエラーを順に送出した後、ベクトルを返します。
+    """
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[0.0] for _ in texts]
+
+def test_embed_with_retry_retries_only_transient_errors():
+    """
+    レート制限・5xx・通信エラーだけをリトライし、プログラムの誤りや4xxはすぐに送出するかをテスト。
+    """
+    request = httpx.Request("POST", "http://testserver/v1/embeddings")
+    transient = [
+        openai.RateLimitError("rate limit", response=httpx.Response(429, request=request), body=None),
+        openai.InternalServerError("server error", response=httpx.Response(500, request=request), body=None),
+        openai.APIConnectionError(request=request),
+        openai.APITimeoutError(request=request),
+    ]
+    model = FlakyEmbeddings(transient)
+    vectors, retries = embed_with_retry(model, ["a"], RateLimitGate(), backoff=0.001)
+    assert vectors == [[0.0]] and retries == 4, "一時的なエラーはリトライするべきです。"
+
+    for error in [TypeError("引数の誤り"), KeyError("data"),
+                  openai.BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)]:
+        model = FlakyEmbeddings([error])
+        with pytest.raises(type(error)):
+            embed_with_retry(model, ["a"], RateLimitGate(), backoff=0.001)
+        assert model.calls == 1, f"{type(error).__name__} はリトライするべきではありません。"
@@ -0,0 +1,94 @@
+import os
+import uuid
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from common.flat_index import FlatIndex, export_flat_index
+from common.hybrid import BM25Index, HybridRetriever
+
+RULES = {
+    "rule-1": "第1条（目的）この規則は、従業員の就業に関する事項を定める。",
+    "rule-12": "第12条（年次有給休暇）会社は、6か月継続勤務した従業員に10日の年次有給休暇を与える。",
+    "rule-21": "第21条（賃金の支払）賃金は毎月25日に支払う。",
+    "form-a3": "休暇を取得する場合は、様式A-3の休暇届を所属長に提出する。",
+}
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+@pytest.fixture
+def db(embeddings):
+    db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embeddings,
+                collection_metadata={"hnsw:space": "cosine"})
+    db.add_documents([Document(page_content=text, metadata={"source": "rules.pdf"}) for text in RULES.values()],
+                     ids=list(RULES))
+    return db
+
+def test_flat_index_matches_chroma(db, embeddings, tmp_path):
+    """
+    書き出したインデックスの検索結果が、Chroma（コサイン類似度）と同じ順位になるかをテスト。
+    """
+    assert export_flat_index(db, str(tmp_path), "v1") == len(RULES)
+    index = FlatIndex(str(tmp_path), embeddings)
+
+    for query in RULES.values():
+        expected = [d.id for d in db.similarity_search(query, k=3)]
+        assert [d.id for d in index.similarity_search(query, k=3)] == expected, "Chromaと同じ順位になるべきです。"
+    document, score = index.similarity_search_with_score(RULES["rule-21"], k=1)[0]
+    assert (document.id, document.metadata["source"]) == ("rule-21", "rules.pdf")
+    assert score == pytest.approx(1.0, abs=1e-5), "同じテキストのコサイン類似度は1になるべきです。"
+    assert len(index.max_marginal_relevance_search(RULES["rule-1"], k=2, fetch_k=4)) == 2
+
+    with pytest.raises(NotImplementedError):
+        index.add_texts(["追加"])
+
+def test_flat_index_reexport_keeps_open_readers(db, embeddings, tmp_path):
+    """
+    書き出し直しても、開いているインデックスで検索でき、古いベクトルのファイルは削除されるかをテスト。
+    """
+    export_flat_index(db, str(tmp_path), "v1")
+    old = FlatIndex(str(tmp_path), embeddings)
+
+    db.delete(ids=["rule-1"])
+    export_flat_index(db, str(tmp_path), "v2")
+    new = FlatIndex(str(tmp_path), embeddings)
+
+    assert (new.index_version, len(new)) == ("v2", 3)
+    assert sorted(os.listdir(tmp_path)) == ["flat_index.json", "flat_offsets-v2.i64", "flat_records-v2.jsonl",
+                                            "flat_vectors-v2.f32"], "古いファイルは削除されるべきです。"
+    assert old.similarity_search(RULES["rule-1"], k=1)[0].id == "rule-1", "開いているインデックスはそのまま使えるべきです。"
+
+def test_flat_index_reads_chunks_by_row(db, embeddings, tmp_path):
+    """
+    チャンクのテキスト・メタデータをワーカーのメモリに読み込まず、mmapしたファイルから行番号で読み出すかをテスト。
+    get_by_ids の id → 行番号の対応は一度だけ作るかもテスト。
+    """
+    export_flat_index(db, str(tmp_path), "v1")
+    index = FlatIndex(str(tmp_path), embeddings)
+    assert not any(isinstance(value, list) for value in vars(index).values()), "チャンクをリストで持たないべきです。"
+
+    documents = index.get_by_ids(["form-a3", "unknown", "rule-12"])
+    assert [(d.id, d.page_content, d.metadata) for d in documents] == [
+        ("form-a3", RULES["form-a3"], {"source": "rules.pdf"}),
+        ("rule-12", RULES["rule-12"], {"source": "rules.pdf"}),
+    ], "存在するidのチャンクを、指定した順に返すべきです。"
+    positions = index._positions
+    index.get_by_ids(["rule-1"])
+    assert index._positions is positions, "id → 行番号の対応は作り直さないべきです。"
+
+    db.delete(ids=list(RULES))
+    export_flat_index(db, str(tmp_path), "v2")
+    empty = FlatIndex(str(tmp_path), embeddings)
+    assert (len(empty), empty.similarity_search("休暇"), empty.get_by_ids(["rule-1"])) == (0, [], [])
+
+def test_hybrid_retriever_with_flat_index(db, embeddings, tmp_path):
+    """
+    書き出したインデックスをハイブリッド検索のベクトルストアとして使えるかをテスト。
+    """
+    export_flat_index(db, str(tmp_path), "v1")
+    keyword_index = BM25Index()
+    keyword_index.add(list(RULES), [Document(page_content=text) for text in RULES.values()])
+    retriever = HybridRetriever(vectorstore=FlatIndex(str(tmp_path), embeddings), keyword_index=keyword_index, k=2)
+    assert retriever.invoke("第21条の内容は？")[0].id == "rule-21"
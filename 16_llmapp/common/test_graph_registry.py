@@ -0,0 +1,110 @@
+import time
+import threading
+import pytest
+from langchain_core.tools import tool
+from common.graph_registry import GraphRegistry
+
+@tool
+def retrieve_company_rules(query: str) -> str:
+    """社内規程を検索します。"""
+    return query
+
+@tool
+def tavily_search_results_json(query: str) -> str:
+    """Web検索です。"""
+    return query
+
+TOOLSETS = {
+    "default": ("retrieve_company_rules", "tavily_search_results_json"),
+    "rules": ("retrieve_company_rules",),
+    "none": (),
+}
+
+def create_registry(max_graphs=2, build_seconds=0.0, fail=False):
+    """
+    テスト用のレジストリ。グラフの代わりに、作成に使った引数を持つ辞書を作ります。
+    """
+    calls = {"build": 0, "tools": 0}
+
+    def build(model_name, checkpointer, tools):
+        calls["build"] += 1
+        time.sleep(build_seconds)
+        if fail:
+            raise RuntimeError("作成に失敗しました")
+        return {"model": model_name, "checkpointer": checkpointer, "tools": [t.name for t in tools]}
+
+    def create_tools():
+        calls["tools"] += 1
+        return [retrieve_company_rules, tavily_search_results_json]
+
+    return GraphRegistry(build, create_tools, TOOLSETS, max_graphs=max_graphs), calls
+
+def test_registry_caches_graphs_and_shares_tools():
+    """
+    (モデル名, ツールセット, チェックポインター) 毎にグラフを保持し、ツールは一度だけ作成して共有するかをテスト。
+    """
+    registry, calls = create_registry(max_graphs=4)
+    memory, other_memory = object(), object()
+
+    graph = registry.get("gpt-4o-mini", "default", memory)
+    assert registry.get("gpt-4o-mini", "default", memory) is graph, "同じキーのグラフは作り直さないべきです。"
+    assert registry.get("gpt-4o", "rules", memory)["tools"] == ["retrieve_company_rules"]
+    assert registry.get("gpt-4o-mini", "none", memory)["tools"] == []
+    assert registry.get("gpt-4o-mini", "default", other_memory)["checkpointer"] is other_memory
+    assert calls == {"build": 4, "tools": 1}, "ツールはすべてのグラフで共有し、一度だけ作成するべきです。"
+    assert registry.hits == 1 and registry.builds == 4
+
+    with pytest.raises(ValueError):
+        registry.get("gpt-4o-mini", "unknown", memory)
+
+def test_registry_evicts_least_recently_used():
+    """
+    保持するグラフの数が上限を超えると、最も長く使われていないグラフから削除するかをテスト。
+    """
+    registry, calls = create_registry(max_graphs=2)
+    memory = object()
+    registry.get("a", "none", memory)
+    registry.get("b", "none", memory)
+    registry.get("a", "none", memory)
+    registry.get("c", "none", memory)
+    assert registry.keys() == [("a", "none"), ("c", "none")], "最も長く使われていない b を削除するべきです。"
+    assert registry.evictions == 1
+    registry.get("b", "none", memory)
+    assert calls["build"] == 4, "削除したグラフは、次に使うときに作り直すべきです。"
+
+def test_registry_single_flight():
+    """
+    同じグラフを複数のスレッドが同時に求めても、作成は1回だけで、全員が同じグラフを受け取るかをテスト。
+    作成に失敗した場合は保持せず、待っていたスレッドにも例外が届くかもテスト。
+    """
+    registry, calls = create_registry(build_seconds=0.2)
+    memory = object()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("gpt-4o-mini", "default", memory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls["build"] == 1, "同時に求められても、グラフの作成は1回だけであるべきです。"
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+    registry, calls = create_registry(build_seconds=0.2, fail=True)
+    errors = []
+
+    def get():
+        try:
+            registry.get("gpt-4o-mini", "default", memory)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls["build"] == 1 and len(errors) == 4, "待っていたスレッドにも作成の失敗が届くべきです。"
+    assert len(registry) == 0, "作成に失敗したグラフは保持しないべきです。"
+    with pytest.raises(RuntimeError):
+        registry.get("gpt-4o-mini", "default", memory)
+    assert calls["build"] == 2, "失敗した後は、次に求められたときに作り直すべきです。"
@@ -0,0 +1,140 @@
+import uuid
+import asyncio
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings, DeterministicFakeEmbedding
+from common.hybrid import tokenize, BM25Index, HybridRetriever, reciprocal_rank_fusion, retriever_settings
+
+RULES = {
+    "rule-1": "第1条（目的）この規則は、従業員の就業に関する事項を定める。",
+    "rule-12": "第12条（年次有給休暇）会社は、6か月継続勤務した従業員に10日の年次有給休暇を与える。",
+    "rule-21": "第21条（賃金の支払）賃金は毎月25日に支払う。",
+    "form-a3": "休暇を取得する場合は、様式A-3の休暇届を所属長に提出する。",
+}
+
+@pytest.fixture
+def documents():
+    return [Document(page_content=text, metadata={"source": "rules.pdf"}) for text in RULES.values()]
+
+@pytest.fixture
+def keyword_index(documents):
+    index = BM25Index()
+    index.add(list(RULES), documents)
+    return index
+
+def test_tokenize_japanese():
+    """
+    漢字・かなのバイグラムと、英数字の連続がトークンになるかをテスト。
+    """
+    tokens = tokenize("第１２条（有給休暇）")
+    assert "第12" in tokens and "12条" in tokens, "全角の条番号も正規化して扱うべきです。"
+    assert "有給" in tokens and "休暇" in tokens, "漢字はバイグラムに分けるべきです。"
+    assert "（" not in "".join(tokens), "記号はトークンに含めるべきではありません。"
+
+def test_bm25_finds_exact_terms(keyword_index):
+    """
+    条番号や様式名などの完全一致する語句で検索できるかをテスト。
+    """
+    assert keyword_index.search("第12条について教えて", k=1)[0][0].id == "rule-12", "条番号で検索できるべきです。"
+    assert keyword_index.search("様式A-3はどこに出す？", k=1)[0][0].id == "form-a3", "様式名で検索できるべきです。"
+    assert keyword_index.search("第1条", k=1)[0][0].id == "rule-1", "似た条番号と区別されるべきです。"
+
+def test_bm25_delete_and_reload(keyword_index, tmp_path):
+    """
+    チャンクの削除と、保存したファイルからの読み込みができるかをテスト。
+    """
+    keyword_index.delete(["rule-12"])
+    assert all(doc.id != "rule-12" for doc, _ in keyword_index.search("有給休暇", k=4)), "削除したチャンクは検索されるべきではありません。"
+
+    keyword_index.path = str(tmp_path / "bm25_index.json")
+    keyword_index.save()
+    loaded = BM25Index(keyword_index.path)
+    assert len(loaded) == 3
+    assert loaded.search("賃金", k=1) == keyword_index.search("賃金", k=1), "読み込んだインデックスで同じ結果になるべきです。"
+
+def test_reciprocal_rank_fusion():
+    """
+    両方の検索に含まれるチャンクが、片方だけのチャンクより上位になるかをテスト。
+    """
+    a, b, c = (Document(id=i, page_content=i) for i in "abc")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, c]], k=2)
+    assert [d.id for d in fused] == ["b", "c"], "両方の検索に含まれるチャンクが上位になるべきです。"
+
+def test_hybrid_retriever(keyword_index, documents):
+    """
+    ベクトル検索とキーワード検索を融合した結果に、条番号が一致するチャンクが含まれるかをテスト。
+    """
+    db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=DeterministicFakeEmbedding(size=16))
+    db.add_documents(documents, ids=list(RULES))
+    retriever = HybridRetriever(vectorstore=db, keyword_index=keyword_index, k=2)
+
+    results = retriever.invoke("第21条の内容は？")
+    assert len(results) == 2, "k件のチャンクを返すべきです。"
+    assert results[0].id == "rule-21", "条番号が一致するチャンクが最上位になるべきです。"
+
+    results = asyncio.run(retriever.ainvoke("第21条の内容は？"))
+    assert results[0].id == "rule-21", "非同期でも同じ結果になるべきです。"
+
+class TopicEmbeddings(Embeddings):
+    """
+    テスト用のエンベディング。話題のキーワードを含むかどうかで長さ1のベクトルを作ります。
+    """
+    topics = ["休暇", "賃金", "規則"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = [1.0 if topic in text else 0.0 for topic in self.topics] + [0.1]
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector]
+
+def test_hybrid_retriever_score_threshold_and_mmr(documents):
+    """
+    類似度の下限に満たないベクトル検索の結果が除かれ、MMRでも同じ下限が使われるかをテスト。
+    """
+    db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=TopicEmbeddings(),
+                collection_metadata={"hnsw:space": "cosine"})
+    db.add_documents(documents, ids=list(RULES))
+    # キーワード検索は使わず、ベクトル検索の結果だけを見る
+    empty_index = BM25Index()
+
+    retriever = HybridRetriever(vectorstore=db, keyword_index=empty_index, k=4, score_threshold=0.9)
+    assert {d.id for d in retriever.invoke("賃金")} == {"rule-21"}, "類似度の低いチャンクは除くべきです。"
+
+    retriever = HybridRetriever(vectorstore=db, keyword_index=empty_index, k=4, search_type="mmr", score_threshold=0.9)
+    assert {d.id for d in retriever.invoke("休暇")} == {"rule-12", "form-a3"}, "MMRでも類似度の下限で絞り込むべきです。"
+    results = asyncio.run(retriever.ainvoke("休暇"))
+    assert {d.id for d in results} == {"rule-12", "form-a3"}, "非同期でも同じ結果になるべきです。"
+
+def test_hybrid_retriever_score_threshold_drops_keyword_only_hits(keyword_index, documents):
+    """
+    類似度の下限を満たすチャンクがない質問では、キーワードだけが一致したチャンクも返さないかをテスト。
+    """
+    db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=TopicEmbeddings(),
+                collection_metadata={"hnsw:space": "cosine"})
+    db.add_documents(documents, ids=list(RULES))
+    retriever = HybridRetriever(vectorstore=db, keyword_index=keyword_index, k=4, score_threshold=0.9)
+
+    # 「条」はキーワード検索で一致するが、どの話題とも関係がない
+    assert keyword_index.search("第3条の昼食の時間", 4), "キーワード検索では一致するチャンクがあるはずです。"
+    assert retriever.invoke("第3条の昼食の時間") == [], "類似度の下限を満たすチャンクがなければ何も返さないべきです。"
+    assert asyncio.run(retriever.ainvoke("第3条の昼食の時間")) == []
+
+    results = retriever.invoke("第21条の賃金")
+    assert results[0].id == "rule-21", "下限を満たすチャンクがあれば、キーワード検索と融合するべきです。"
+
+def test_retriever_settings(monkeypatch):
+    """
+    環境変数から検索の設定が読み込まれるかをテスト。
+    """
+    monkeypatch.setenv("RETRIEVER_K", "2")
+    monkeypatch.setenv("RETRIEVER_SEARCH_TYPE", "mmr")
+    monkeypatch.setenv("RETRIEVER_SCORE_THRESHOLD", "0.3")
+    settings = retriever_settings()
+    assert (settings["k"], settings["search_type"], settings["score_threshold"]) == (2, "mmr", 0.3)
+
+    monkeypatch.setenv("RETRIEVER_SEARCH_TYPE", "random")
+    with pytest.raises(ValueError):
+        retriever_settings()
@@ -0,0 +1,317 @@
+import pytest
+from langchain_core.documents import Document
+import os
+import time
+import threading
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import common.ingest
+from common.ingest import cached_index_version, index_lock, sync_index, load_manifest, index_version, is_up_to_date, open_vectorstore, manifest_path
+from common.hybrid import BM25Index
+
+class FakeVectorStore:
+    """
+    テスト用のベクトルストア。追加・削除されたIDを記録します。
+    """
+    def __init__(self):
+        self.documents = {}
+        self.added = []
+
+    def add_documents(self, documents, ids):
+        self.added.extend(ids)
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for i in ids:
+            self.documents.pop(i, None)
+
+    def get(self, ids=None, include=None):
+        ids = list(self.documents) if ids is None else [i for i in ids if i in self.documents]
+        return {
+            "ids": ids,
+            "documents": [self.documents[i].page_content for i in ids],
+            "metadatas": [self.documents[i].metadata for i in ids],
+        }
+
+class LineSplitter:
+    """
+    テスト用のテキスト分割。1行を1チャンクとして扱います。
+    """
+    signature = "line"
+
+    def split_documents(self, documents):
+        return [
+            Document(page_content=line, metadata=doc.metadata)
+            for doc in documents for line in doc.page_content.splitlines() if line
+        ]
+
+def load_text(path):
+    # PDFの代わりにテキストファイルをそのまま1ページとして読み込む
+    with open(path, encoding='utf-8') as f:
+        return [Document(page_content=f.read(), metadata={"source": path, "page": 0})]
+
+@pytest.fixture
+def workspace(tmp_path):
+    pdf_directory = tmp_path / "pdf"
+    pdf_directory.mkdir()
+    (pdf_directory / "rules.pdf").write_text("第1条 総則\n第2条 有給休暇\n", encoding='utf-8')
+    (pdf_directory / "salary.pdf").write_text("第1条 給与\n", encoding='utf-8')
+    return pdf_directory, str(tmp_path / "chroma_db")
+
+def sync(db, workspace, keyword_index=None, text_splitter=None):
+    pdf_directory, persist_directory = workspace
+    return sync_index(db, str(pdf_directory), text_splitter or LineSplitter(), persist_directory,
+                      load_documents=load_text, keyword_index=keyword_index)
+
+def test_sync_index_skips_unchanged_files(workspace):
+    """
+    変更のないPDFは再度エンベディングされないかをテスト。
+    """
+    db = FakeVectorStore()
+    stats = sync(db, workspace)
+    assert stats["added"] == 3, "初回はすべてのチャンクが追加されるべきです。"
+
+    db.added.clear()
+    stats = sync(db, workspace)
+    assert db.added == [], "変更のないPDFのチャンクは追加されるべきではありません。"
+    assert stats["unchanged"] == 3, "すべてのチャンクが変更なしとして扱われるべきです。"
+
+def test_sync_index_updates_changed_and_deleted_files(workspace):
+    """
+    変更されたPDFは差分のチャンクだけが追加され、削除されたPDFのチャンクは取り除かれるかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    sync(db, workspace)
+    version = index_version(load_manifest(persist_directory))
+
+    db.added.clear()
+    (pdf_directory / "rules.pdf").write_text("第1条 総則\n第2条 有給休暇は20日\n", encoding='utf-8')
+    (pdf_directory / "salary.pdf").unlink()
+    stats = sync(db, workspace)
+
+    assert len(db.added) == 1, "変更された行のチャンクだけが追加されるべきです。"
+    assert stats["deleted"] == 2, "古いチャンクと削除されたPDFのチャンクが削除されるべきです。"
+    assert sorted(d.page_content for d in db.documents.values()) == ["第1条 総則", "第2条 有給休暇は20日"]
+    assert index_version(load_manifest(persist_directory)) != version, "PDFの変更でインデックスのバージョンが変わるべきです。"
+
+def test_sync_index_updates_keyword_index(workspace):
+    """
+    キーワード検索のインデックスが、ベクトルストアと同じチャンクで更新・保存されるかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    keyword_index = BM25Index(f"{persist_directory}/bm25_index.json")
+    sync(db, workspace, keyword_index)
+    assert set(keyword_index.documents) == set(db.documents), "ベクトルストアと同じチャンクが登録されるべきです。"
+
+    (pdf_directory / "salary.pdf").unlink()
+    sync(db, workspace, keyword_index)
+    assert set(keyword_index.documents) == set(db.documents), "削除されたPDFのチャンクは取り除かれるべきです。"
+
+    # 保存したファイルから読み込める
+    loaded = BM25Index(f"{persist_directory}/bm25_index.json")
+    assert loaded.search("第2条", k=1)[0][0].page_content == "第2条 有給休暇"
+
+def test_sync_index_fills_missing_keyword_index(workspace):
+    """
+    キーワード検索の導入前に作成されたインデックスでは、PDFを解析し直さずにベクトルストアから補うかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    sync(db, workspace)
+
+    db.added.clear()
+    keyword_index = BM25Index(f"{persist_directory}/bm25_index.json")
+    sync(db, workspace, keyword_index)
+    assert db.added == [], "変更のないPDFのチャンクは追加されるべきではありません。"
+    assert set(keyword_index.documents) == set(db.documents), "ベクトルストアのチャンクから補われるべきです。"
+
+def test_sync_index_resplits_when_splitter_changes(workspace):
+    """
+    チャンクの分割方法が変わった場合、内容の変わっていないPDFも分割し直されるかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    sync(db, workspace)
+    version = index_version(load_manifest(persist_directory))
+
+    class PageSplitter:
+        # ページ全体を1チャンクにする
+        signature = "page"
+
+        def split_documents(self, documents):
+            return documents
+
+    db.added.clear()
+    stats = sync(db, workspace, text_splitter=PageSplitter())
+    assert stats["added"] == 2 and stats["deleted"] == 3, "分割方法が変わったPDFは分割し直すべきです。"
+    assert index_version(load_manifest(persist_directory)) != version, "分割方法の変更でインデックスのバージョンが変わるべきです。"
+
+    db.added.clear()
+    stats = sync(db, workspace, text_splitter=PageSplitter())
+    assert db.added == [], "同じ分割方法であれば分割し直すべきではありません。"
+
+def test_sync_index_interrupted_resplit_is_resumed(workspace):
+    """
+    分割し直す途中で中断した場合、新しい分割方法を記録せず、次回に残りのPDFも分割し直すかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    sync(db, workspace)
+
+    class PageSplitter:
+        signature = "page"
+
+        def split_documents(self, documents):
+            return documents
+
+    def fail_on_salary(db, chunks):
+        for chunk_id, document in chunks:
+            if "給与" in document.page_content:
+                raise ConnectionError("中断")
+            db.add_documents([document], [chunk_id])
+
+    with pytest.raises(ConnectionError):
+        sync_index(db, str(pdf_directory), PageSplitter(), persist_directory,
+                   load_documents=load_text, add_documents=fail_on_salary)
+    assert load_manifest(persist_directory)["splitter"] == "line", "途中で中断した場合は新しい分割方法を記録するべきではありません。"
+
+    stats = sync(db, workspace, text_splitter=PageSplitter())
+    assert load_manifest(persist_directory)["splitter"] == "page"
+    assert set(db.documents) == {i for entry in load_manifest(persist_directory)["files"].values() for i in entry["chunks"]}
+    assert "第1条 給与\n" in [d.page_content for d in db.documents.values()], "残りのPDFも新しい分割方法で分割し直すべきです。"
+
+def test_sync_index_embeds_all_files_in_one_call(workspace):
+    """
+    すべてのPDFの未登録のチャンクを、1つの列として add_documents に一度だけ渡すかをテスト。
+    中断した場合は、書き込み済みのチャンクを次回エンベディングし直さないかもテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    calls = []
+
+    def record(db, chunks):
+        chunks = list(chunks)
+        calls.append([chunk_id for chunk_id, _ in chunks])
+        db.add_documents([document for _, document in chunks], [chunk_id for chunk_id, _ in chunks])
+
+    stats = sync_index(db, str(pdf_directory), LineSplitter(), persist_directory,
+                       load_documents=load_text, add_documents=record)
+    assert [len(ids) for ids in calls] == [3], "すべてのPDFのチャンクを一度に渡すべきです。"
+    assert stats["added"] == 3
+
+    (pdf_directory / "rules.pdf").write_text("第1条 総則\n第2条 有給休暇\n第3条 特別休暇\n", encoding='utf-8')
+    (pdf_directory / "salary.pdf").write_text("第1条 給与\n第2条 賞与\n", encoding='utf-8')
+
+    def fail_after_first(db, chunks):
+        chunk_id, document = next(iter(chunks))
+        db.add_documents([document], [chunk_id])
+        raise ConnectionError("中断")
+
+    with pytest.raises(ConnectionError):
+        sync_index(db, str(pdf_directory), LineSplitter(), persist_directory,
+                   load_documents=load_text, add_documents=fail_after_first)
+    calls.clear()
+    stats = sync_index(db, str(pdf_directory), LineSplitter(), persist_directory,
+                       load_documents=load_text, add_documents=record)
+    assert [len(ids) for ids in calls] == [1], "中断前に書き込んだチャンクはエンベディングし直すべきではありません。"
+    assert set(db.documents) == {i for entry in load_manifest(persist_directory)["files"].values() for i in entry["chunks"]}
+
+def test_cached_index_version_reads_manifest_only_when_changed(workspace, monkeypatch):
+    """
+    マニフェストが書き換えられるまで、読み込まずに前回のバージョンを返すかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    db = FakeVectorStore()
+    sync(db, workspace)
+    loads = []
+    load = common.ingest.load_manifest
+    monkeypatch.setattr(common.ingest, "load_manifest", lambda path: loads.append(path) or load(path))
+
+    version = cached_index_version(persist_directory)
+    assert version == index_version(load(persist_directory))
+    assert cached_index_version(persist_directory) == version
+    assert len(loads) == 1, "マニフェストが変わらなければ、読み込み直すべきではありません。"
+
+    (pdf_directory / "salary.pdf").write_text("第1条 給与\n第2条 賞与\n", encoding='utf-8')
+    sync(db, workspace)
+    assert cached_index_version(persist_directory) != version, "PDFを取り込み直したらバージョンが変わるべきです。"
+
+def test_is_up_to_date(workspace):
+    """
+    ベクトルストアを開かずに、PDFの追加・変更と分割方法の変更を検出できるかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    sync(FakeVectorStore(), workspace)
+    manifest = load_manifest(persist_directory)
+    assert is_up_to_date(str(pdf_directory), manifest, LineSplitter()), "取り込み済みの状態では最新とみなすべきです。"
+
+    class PageSplitter:
+        signature = "page"
+    assert not is_up_to_date(str(pdf_directory), manifest, PageSplitter()), "分割方法の変更を検出すべきです。"
+
+    (pdf_directory / "salary.pdf").write_text("第1条 給与\n第2条 賞与\n", encoding='utf-8')
+    assert not is_up_to_date(str(pdf_directory), manifest, LineSplitter()), "PDFの変更を検出すべきです。"
+
+def test_open_vectorstore_keeps_index_on_embedding_error(workspace):
+    """
+    取り込み中のエンベディングのエラーでは、保存済みのインデックスとマニフェストが削除されないかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    embedding_model = DeterministicFakeEmbedding(size=8)
+    sync_index(open_vectorstore(persist_directory, embedding_model), str(pdf_directory), LineSplitter(),
+               persist_directory, load_documents=load_text)
+    (pdf_directory / "salary.pdf").write_text("第1条 給与\n第2条 賞与\n", encoding='utf-8')
+
+    def fail(db, chunks):
+        raise ConnectionError("エンベディングのAPIに接続できません")
+
+    with pytest.raises(ConnectionError):
+        sync_index(open_vectorstore(persist_directory, embedding_model), str(pdf_directory), LineSplitter(),
+                   persist_directory, load_documents=load_text, add_documents=fail)
+    db = open_vectorstore(persist_directory, embedding_model)
+    assert len(db.get(include=[])["ids"]) == 3, "エンベディングのエラーで保存済みのチャンクを削除するべきではありません。"
+    assert "rules.pdf" in load_manifest(persist_directory)["files"]
+
+def test_open_vectorstore_rebuilds_corrupted_index(workspace):
+    """
+    Chromaのファイルが壊れていて開けない場合だけ、保存先を作り直すかをテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    embedding_model = DeterministicFakeEmbedding(size=8)
+    sync_index(open_vectorstore(persist_directory, embedding_model), str(pdf_directory), LineSplitter(),
+               persist_directory, load_documents=load_text)
+    with open(os.path.join(persist_directory, "chroma.sqlite3"), "wb") as f:
+        f.write(b"broken" * 1000)
+
+    db = open_vectorstore(persist_directory, embedding_model)
+    assert db.get(include=[])["ids"] == [], "壊れたインデックスは新規作成するべきです。"
+    assert not os.path.exists(manifest_path(persist_directory)), "作り直す場合はマニフェストも削除するべきです。"
+
+def test_index_lock_serializes_rebuilds(workspace):
+    """
+    インデックスの作り直しを、同じ保存先を使うほかのワーカーと同時に行わないかをテスト。
+    ロックのファイルは、作り直しで削除される保存先の中ではなく隣に置くかもテスト。
+    """
+    pdf_directory, persist_directory = workspace
+    events = []
+    locked = threading.Event()
+
+    def first():
+        with index_lock(persist_directory):
+            locked.set()
+            time.sleep(0.3)
+            events.append("first done")
+
+    def second():
+        locked.wait()
+        with index_lock(persist_directory):
+            events.append("second start")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events == ["first done", "second start"], "ほかのワーカーは作り直しが終わるまで待つべきです。"
+    assert os.path.exists(f"{persist_directory}.lock") and not os.path.exists(persist_directory)
@@ -0,0 +1,76 @@
+import os
+import uuid
+import numpy as np
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from common.flat_index import FlatIndex, export_flat_index, top_k
+from common.ivf_index import IVFIndex, train_ivf, search_ivf, export_ivf_index
+
+def clustered_vectors(count, dimensions=32, clusters=20, seed=0):
+    """
+    テスト用のベクトル。いくつかの中心の周りに集まった、長さ1のベクトルを作ります。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.standard_normal((count, dimensions))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall(vectors, queries, k, nprobe, index):
+    found = 0
+    for query in queries:
+        expected = set(top_k(vectors @ query, k))
+        rows, _ = search_ivf(vectors, *index, query, k, nprobe)
+        found += len(expected & set(rows))
+    return found / (k * len(queries))
+
+def test_train_ivf_covers_all_vectors():
+    """
+    すべてのベクトルが、いずれか1つのリストに割り当てられるかをテスト。
+    """
+    vectors = clustered_vectors(2000)
+    centroids, rows, offsets = train_ivf(vectors, nlist=32)
+    assert centroids.shape == (32, 32)
+    assert sorted(rows.tolist()) == list(range(2000)), "すべてのベクトルが1回ずつ割り当てられるべきです。"
+    assert offsets[0] == 0 and offsets[-1] == 2000
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1, atol=1e-4), "中心は長さ1に正規化されるべきです。"
+
+def test_search_ivf_recall():
+    """
+    検索するリストの数（nprobe）を増やすと再現率が上がり、全リストを検索すると全件検索と一致するかをテスト。
+    """
+    vectors = clustered_vectors(5000)
+    index = train_ivf(vectors, nlist=64)
+    queries = clustered_vectors(50, seed=1)
+
+    assert recall(vectors, queries, 10, nprobe=64, index=index) == 1.0, "全リストを検索すれば全件検索と一致するべきです。"
+    low = recall(vectors, queries, 10, nprobe=1, index=index)
+    high = recall(vectors, queries, 10, nprobe=8, index=index)
+    assert low <= high and high >= 0.9, f"nprobeを増やすと再現率が上がるべきです（{low:.2f} → {high:.2f}）。"
+
+def test_ivf_index_as_vectorstore(tmp_path):
+    """
+    書き出したインデックスからリストを作成し、ベクトルストアとして検索できるかをテスト。
+    """
+    embeddings = DeterministicFakeEmbedding(size=16)
+    db = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embeddings)
+    texts = [f"第{n}条 規則の本文{n}" for n in range(200)]
+    db.add_documents([Document(page_content=text) for text in texts], ids=[f"rule-{n}" for n in range(200)])
+    export_flat_index(db, str(tmp_path), "v1")
+    export_ivf_index(str(tmp_path), nlist=8)
+    assert "ivf_index-v1.npz" in os.listdir(tmp_path)
+
+    flat = FlatIndex(str(tmp_path), embeddings)
+    index = IVFIndex(str(tmp_path), embeddings, nprobe=8)
+    for text in texts[:20]:
+        assert index.similarity_search(text, k=3) == flat.similarity_search(text, k=3), \
+            "全リストを検索すれば全件検索と同じ結果になるべきです。"
+    assert index.similarity_search(texts[5], k=1)[0].id == "rule-5"
+
+    db.delete(ids=[f"rule-{n}" for n in range(200)])
+    export_flat_index(db, str(tmp_path), "v2")
+    export_ivf_index(str(tmp_path))
+    assert len(IVFIndex(str(tmp_path), embeddings).similarity_search("規則", k=3)) == 0, "空のインデックスも開けるべきです。"
+    assert not any(name.startswith("ivf_index-") for name in os.listdir(tmp_path)), "古いリストは削除されるべきです。"
@@ -0,0 +1,113 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Annotated
+from typing_extensions import TypedDict
+from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import tools_condition
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from common.tool_executor import create_tool_node
+from common.metrics import MetricsRegistry, RequestTracer, Histogram, trace_logger
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+@tool
+def add(a: int, b: int) -> int:
+    """2つの数を足します。"""
+    return a + b
+
+@tool
+def slow_search(query: str) -> str:
+    """時間のかかる検索です。"""
+    time.sleep(0.5)
+    return query
+
+def tool_call(name, args, id):
+    return {"name": name, "args": args, "id": id}
+
+def build_test_graph(responses):
+    """
+    テスト用のグラフ。決まった応答を返すモデルと、ツールノード（制限時間付き）を使います。
+    """
+    llm = GenericFakeChatModel(messages=iter(responses))
+
+    def chatbot(state: State):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    async def achatbot(state: State):
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", RunnableLambda(chatbot, achatbot))
+    builder.add_node("tools", create_tool_node([add, slow_search], {"slow_search": 0.1}))
+    builder.add_conditional_edges("chatbot", tools_condition)
+    builder.add_edge("tools", "chatbot")
+    builder.set_entry_point("chatbot")
+    return builder.compile()
+
+def responses():
+    return [
+        AIMessage(content="", tool_calls=[tool_call("add", {"a": 1, "b": 2}, "call-1")],
+                  usage_metadata={"input_tokens": 10, "output_tokens": 3, "total_tokens": 13}),
+        AIMessage(content="", tool_calls=[tool_call("slow_search", {"query": "東京駅"}, "call-2")],
+                  usage_metadata={"input_tokens": 20, "output_tokens": 4, "total_tokens": 24}),
+        AIMessage(content="3です", usage_metadata={"input_tokens": 30, "output_tokens": 2, "total_tokens": 32}),
+    ]
+
+def test_request_tracer_records_nodes_tools_and_tokens():
+    """
+    ノード・ツール毎の実行時間、トークン数、往復回数が記録されるかをテスト。
+    制限時間で打ち切られたツールは timeout として記録されるかもテスト。
+    """
+    registry = MetricsRegistry()
+    with RequestTracer("thread-1", registry) as tracer:
+        build_test_graph(responses()).invoke({"messages": [("user", "1たす2は？")]}, {"callbacks": [tracer]})
+
+    assert registry.node_seconds.count(node="chatbot") == 3, "chatbotノードは3回実行されるべきです。"
+    assert registry.node_seconds.count(node="tools") == 2
+    assert registry.tool_seconds.count(tool="add", status="success") == 1
+    assert registry.tool_seconds.count(tool="slow_search", status="timeout") == 1, "打ち切られたツールは timeout として記録するべきです。"
+    assert registry.tokens.value(type="prompt") == 60 and registry.tokens.value(type="completion") == 9
+    assert registry.loops.count() == 1 and registry.requests.value(status="success") == 1
+    assert tracer.prompt_tokens == 60 and len(tracer.spans) == 7, "ノード5回とツール2回が記録されるべきです。"
+
+def test_request_tracer_async_and_trace_log(caplog):
+    """
+    非同期の実行でも記録され、リクエスト毎のトレースがJSONでログに書き出されるかをテスト。
+    """
+    registry = MetricsRegistry()
+
+    async def run():
+        with RequestTracer("thread-2", registry) as tracer:
+            await build_test_graph(responses()).ainvoke({"messages": [("user", "1たす2は？")]}, {"callbacks": [tracer]})
+
+    with caplog.at_level(logging.INFO, logger=trace_logger.name):
+        asyncio.run(run())
+    trace = json.loads(caplog.records[-1].getMessage())
+    assert trace["thread_id"] == "thread-2" and trace["loops"] == 2, "往復回数はtoolsノードの実行回数であるべきです。"
+    assert trace["prompt_tokens"] == 60 and trace["completion_tokens"] == 9
+    assert [span["name"] for span in trace["spans"] if span["type"] == "node"] == \
+        ["chatbot", "tools", "chatbot", "tools", "chatbot"], "ノードは実行順に並ぶべきです。"
+    assert registry.tool_seconds.count(tool="slow_search", status="timeout") == 1
+
+def test_histogram_prometheus_format():
+    """
+    ヒストグラムがPrometheusのテキスト形式（累積の件数・合計・件数）で出力されるかをテスト。
+    """
+    histogram = Histogram("test_seconds", "テスト", ("node",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, node="chatbot")
+    histogram.observe(0.5, node="chatbot")
+    histogram.observe(2.0, node='a"b')
+    lines = histogram.render()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{node="chatbot",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{node="chatbot",le="1"} 2' in lines, "区切りの件数は累積であるべきです。"
+    assert 'test_seconds_bucket{node="chatbot",le="+Inf"} 2' in lines
+    assert 'test_seconds_count{node="chatbot"} 2' in lines
+    assert 'test_seconds_count{node="a\\"b"} 1' in lines, "ラベルの値はエスケープするべきです。"
@@ -0,0 +1,99 @@
+import pytest
+import pypdf
+from pypdf.generic import DictionaryObject, NameObject, DecodedStreamObject
+from langchain_community.document_loaders import PyPDFLoader
+from common.pdf_loader import load_pdf_pages, iter_pdf_pages
+from common.ingest import sync_index, load_pdf, load_manifest
+
+def write_pdf(path, pages):
+    """
+    テスト用のPDFを作成します。pages の各要素（改行区切りの英数字のテキスト）を1ページにします。
+    """
+    writer = pypdf.PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for text in pages:
+        page = writer.add_blank_page(595, 842)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        lines = " ".join(f"({line}) '" for line in text.split("\n"))
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 14 TL 72 770 Td {lines} ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    writer.write(str(path))
+
+class LineSplitter:
+    """
+    テスト用のテキスト分割。1行を1チャンクとして扱います。
+    """
+    def split_documents(self, documents):
+        return [
+            type(document)(page_content=line, metadata=document.metadata)
+            for document in documents
+            for line in document.page_content.split("\n") if line
+        ]
+
+class FakeVectorStore:
+    """
+    テスト用のベクトルストア。追加されたIDを記録します。
+    """
+    def __init__(self):
+        self.added = []
+
+    def add_documents(self, documents, ids):
+        self.added.extend(ids)
+
+    def delete(self, ids):
+        pass
+
+    def get(self, ids=None, include=None):
+        return {"ids": [i for i in ids or [] if i in self.added]}
+
+@pytest.fixture
+def pdf_directory(tmp_path):
+    directory = tmp_path / "pdf"
+    directory.mkdir()
+    write_pdf(directory / "rules.pdf", [f"Article {n}\nSame line" for n in range(1, 6)])
+    write_pdf(directory / "salary.pdf", ["Salary is paid on the 25th"])
+    return directory
+
+def test_load_pdf_pages_matches_pypdfloader(pdf_directory):
+    """
+    ページ範囲を指定した読み込みが、PyPDFLoader と同じテキストになるかをテスト。
+    """
+    path = str(pdf_directory / "rules.pdf")
+    expected = PyPDFLoader(path).load()
+    pages = load_pdf_pages(path, 1, 3)
+    assert [p.page_content for p in pages] == [d.page_content for d in expected[1:3]]
+    assert [p.metadata["page"] for p in pages] == [1, 2]
+    assert pages[0].metadata["source"] == path and pages[0].metadata["total_pages"] == 5
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_iter_pdf_pages_in_order(pdf_directory, max_workers):
+    """
+    1つのプロセスでも複数のプロセスでも、ファイル順・ページ順に返されるかをテスト。
+    """
+    files = {name: str(pdf_directory / name) for name in ["rules.pdf", "salary.pdf"]}
+    batches = list(iter_pdf_pages(files, max_workers=max_workers, pages_per_task=2))
+
+    assert [(name, len(pages), last) for name, pages, last in batches] == [
+        ("rules.pdf", 2, False), ("rules.pdf", 2, False), ("rules.pdf", 1, True), ("salary.pdf", 1, True),
+    ], "ページ数毎のタスクに分け、ファイルの最後のページで last が True になるべきです。"
+    pages = [page for name, batch, _ in batches if name == "rules.pdf" for page in batch]
+    assert [page.metadata["page"] for page in pages] == [0, 1, 2, 3, 4], "ページ順に返すべきです。"
+
+def test_sync_index_streams_pages(pdf_directory, tmp_path):
+    """
+    ページ毎に分けて取り込んでも、ファイル全体を読み込んだ場合と同じチャンクIDになるかをテスト。
+    """
+    streamed = FakeVectorStore()
+    sync_index(streamed, str(pdf_directory), LineSplitter(), str(tmp_path / "streamed"), max_workers=2)
+    whole = FakeVectorStore()
+    sync_index(whole, str(pdf_directory), LineSplitter(), str(tmp_path / "whole"), load_documents=load_pdf)
+
+    assert streamed.added == whole.added, "ページをまたいでも同じIDを割り当てるべきです。"
+    assert len(set(streamed.added)) == 11, "ページをまたいで同じ本文のチャンクも区別するべきです。"
+    assert load_manifest(str(tmp_path / "streamed"))["files"] == load_manifest(str(tmp_path / "whole"))["files"]
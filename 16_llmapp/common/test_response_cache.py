@@ -0,0 +1,75 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from common.response_cache import ResponseCache
+
+class KeywordEmbeddings(Embeddings):
+    """
+    テスト用のエンベディング。キーワードを含むかどうかでベクトルを作ります。
+    表記が少し異なる質問でも、同じキーワードを含めば同じ向きのベクトルになります。
+    """
+    keywords = ["有給", "給与", "残業"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0 if keyword in text else 0.0 for keyword in self.keywords] + [0.1]
+
+@pytest.fixture
+def embeddings():
+    return KeywordEmbeddings()
+
+def test_response_cache_hits_similar_question(embeddings):
+    """
+    ほぼ同じ質問に対して保存済みの回答が返されるかをテスト。
+    """
+    cache = ResponseCache(embeddings, threshold=0.95)
+    cache.store("有給休暇は何日ありますか？", "gpt-4o-mini:v1", "20日です。")
+
+    assert cache.lookup("有給休暇って何日もらえる？", "gpt-4o-mini:v1") == "20日です。", "類似した質問はヒットするべきです。"
+    assert cache.lookup("給与の支払日はいつですか？", "gpt-4o-mini:v1") is None, "異なる質問はヒットするべきではありません。"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # 完全に同じ質問はエンベディングせずに返す
+    calls = embeddings.calls
+    assert cache.lookup("有給休暇は何日ありますか？", "gpt-4o-mini:v1") == "20日です。"
+    assert embeddings.calls == calls, "完全に同じ質問はエンベディングされるべきではありません。"
+
+def test_response_cache_is_scoped(embeddings):
+    """
+    インデックスのバージョンやモデルが異なる場合は回答が返されないかをテスト。
+    """
+    cache = ResponseCache(embeddings)
+    cache.store("有給休暇は何日ありますか？", "gpt-4o-mini:v1", "20日です。")
+
+    assert cache.lookup("有給休暇は何日ありますか？", "gpt-4o-mini:v2") is None, "インデックスが更新された場合はヒットするべきではありません。"
+    assert cache.lookup("有給休暇は何日ありますか？", "gpt-4o:v1") is None, "モデルが異なる場合はヒットするべきではありません。"
+
+def test_response_cache_expires_entries(embeddings):
+    """
+    TTLを過ぎた回答が返されないかをテスト。
+    """
+    cache = ResponseCache(embeddings, ttl_seconds=60)
+    cache.store("有給休暇は何日ありますか？", "v1", "20日です。")
+    cache._entries[("v1", "有給休暇は何日ありますか？")]["created"] -= 120
+
+    assert cache.lookup("有給休暇は何日ありますか？", "v1") is None, "期限切れの回答は返されるべきではありません。"
+    assert len(cache) == 0, "期限切れの回答は削除されるべきです。"
+
+def test_response_cache_evicts_least_recently_used(embeddings):
+    """
+    保持数が上限を超えると、最も長く使われていない回答から削除されるかをテスト。
+    """
+    cache = ResponseCache(embeddings, max_entries=2)
+    cache.store("有給休暇は何日ですか？", "v1", "20日です。")
+    cache.store("給与の支払日は？", "v1", "25日です。")
+    cache.lookup("有給休暇は何日ですか？", "v1")
+    cache.store("残業の上限は？", "v1", "月45時間です。")
+
+    assert cache.lookup("給与の支払日は？", "v1") is None, "最も長く使われていない回答が削除されるべきです。"
+    assert cache.lookup("有給休暇は何日ですか？", "v1") == "20日です。", "最近使われた回答は残っているべきです。"
+    assert cache.lookup("残業の上限は？", "v1") == "月45時間です。", "新しい回答は残っているべきです。"
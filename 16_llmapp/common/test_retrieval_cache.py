@@ -0,0 +1,64 @@
+import asyncio
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from common.retrieval_cache import CachedRetriever, create_cached_retriever, normalize_query
+
+class CountingRetriever(BaseRetriever):
+    """
+    テスト用のRetriever。検索した回数を数え、質問をそのまま1件のチャンクとして返します。
+    """
+    calls: int = 0
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.calls += 1
+        return [Document(page_content=query)]
+
+def test_normalize_query():
+    """
+    表記の揺れをそろえて同じ質問とみなせるかをテスト。
+    """
+    assert normalize_query("有給休暇は　何日？") == normalize_query("有給休暇は 何日?") == "有給休暇は 何日"
+    assert normalize_query("ＰＣの貸与") == "pcの貸与", "全角英字は半角の小文字にそろえるべきです。"
+
+def test_cached_retriever_reuses_results():
+    """
+    ほぼ同じ質問の検索結果が再利用され、インデックスのバージョンが変わると検索し直すかをテスト。
+    """
+    versions = ["v1"]
+    base = CountingRetriever()
+    retriever = CachedRetriever(retriever=base, version=lambda: versions[0])
+
+    first = retriever.invoke("有給休暇は何日？")
+    assert retriever.invoke("有給休暇は何日?") == first, "ほぼ同じ質問は同じ結果を返すべきです。"
+    assert asyncio.run(retriever.ainvoke("有給休暇は何日")) == first, "非同期でも再利用するべきです。"
+    assert base.calls == 1, "2回目以降は検索するべきではありません。"
+    assert (retriever.hits, retriever.misses) == (2, 1)
+
+    versions[0] = "v2"
+    retriever.invoke("有給休暇は何日？")
+    assert base.calls == 2, "インデックスのバージョンが変わったら検索し直すべきです。"
+    assert len(retriever) == 1, "古いバージョンの結果は削除されるべきです。"
+
+def test_cached_retriever_evicts_least_recently_used():
+    """
+    保持数の上限を超えると、最も長く使われていない結果から削除されるかをテスト。
+    """
+    base = CountingRetriever()
+    retriever = CachedRetriever(retriever=base, version=lambda: "v1", max_entries=2)
+    for query in ["有給", "給与", "有給", "残業"]:
+        retriever.invoke(query)
+    assert base.calls == 3
+
+    retriever.invoke("有給")
+    assert base.calls == 3, "最近使われた結果は残っているべきです。"
+    retriever.invoke("給与")
+    assert base.calls == 4, "最も古い結果は削除されているべきです。"
+
+def test_create_cached_retriever(monkeypatch):
+    """
+    RETRIEVAL_CACHE_MAX_ENTRIES=0 の場合はキャッシュしないかをテスト。
+    """
+    base = CountingRetriever()
+    assert isinstance(create_cached_retriever(base, lambda: "v1"), CachedRetriever)
+    monkeypatch.setenv("RETRIEVAL_CACHE_MAX_ENTRIES", "0")
+    assert create_cached_retriever(base, lambda: "v1") is base, "上限が0の場合はキャッシュするべきではありません。"
@@ -0,0 +1,38 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from common.metrics import MetricsRegistry
+from common.router import TurnRouter, classify_turn
+
+@pytest.mark.parametrize("text, route", [
+    ("1たす2は？", "simple"),
+    ("１２ * ３ は いくつですか", "simple"),
+    ("こんにちは！", "simple"),
+    ("ありがとうございます。", "simple"),
+    ("有給休暇の日数は？", "agent"),
+    ("東京駅のイベントの検索結果を教えて", "agent"),
+    ("それは？", "agent"),
+    ("", "agent"),
+])
+def test_classify_turn(text, route):
+    """
+    挨拶・計算はツールなしの回答に、社内規程やWeb検索が必要な質問・判断できない発言はエージェントに分類されるかをテスト。
+    """
+    assert classify_turn(text) == route
+
+def test_classify_turn_long_text_goes_to_agent():
+    """
+    長い発言は、計算に見えてもエージェントに分類されるかをテスト。
+    """
+    assert classify_turn(" + ".join(["1"] * 30)) == "agent", "上限より長い発言はエージェントに分類するべきです。"
+
+def test_turn_router_counts_decisions():
+    """
+    振り分けた回数がメトリクスに記録されるかをテスト。最後の発言がユーザーでない場合はエージェントに進むかもテスト。
+    """
+    registry = MetricsRegistry()
+    router = TurnRouter(registry)
+    assert router({"messages": [HumanMessage(content="1たす2は？")]}) == "simple"
+    assert router({"messages": [HumanMessage(content="有給休暇の日数は？")]}) == "agent"
+    assert router({"messages": [AIMessage(content="こんにちは")]}) == "agent"
+    assert registry.routes.value(route="simple") == 1 and registry.routes.value(route="agent") == 2
+    assert 'chatbot_routes_total{route="simple"} 1' in registry.render()
@@ -0,0 +1,63 @@
+import time
+import asyncio
+from langchain_core.messages import ToolMessage
+from common.search_cache import SearchResultStore, CachedSearchTool, LocalSearchTool, create_search_tool
+
+QUERY = "東京駅のイベント"
+RESULTS = [{"url": "https://example.com/tokyo", "content": "東京駅で開催中のイベント"}]
+
+def cached_tool(tmp_path, ttl_seconds=60, **kwargs):
+    """
+    テスト用の、ローカルの検索ツールにキャッシュを付けたツールを作ります。
+    """
+    local = LocalSearchTool(results={QUERY.lower(): RESULTS}, **kwargs)
+    store = SearchResultStore(str(tmp_path / "search_cache.db"), ttl_seconds=ttl_seconds)
+    tool = CachedSearchTool(name=local.name, description=local.description, args_schema=local.args_schema,
+                            tool=local, store=store, scope="local:2")
+    return tool, local
+
+def test_cached_search_reuses_normalized_queries(tmp_path):
+    """
+    表記の揺れがあっても同じ質問の検索結果を再利用し、ツール呼び出しの形式も変わらないかをテスト。
+    """
+    tool, local = cached_tool(tmp_path, latency=0.2)
+    assert tool.invoke({"query": QUERY}) == RESULTS
+    started = time.perf_counter()
+    assert tool.invoke({"query": " 東京駅のイベント？"}) == RESULTS
+    assert asyncio.run(tool.ainvoke({"query": "東京駅のイベント。"})) == RESULTS
+    assert time.perf_counter() - started < 0.2, "キャッシュを使った検索は待たずに返すべきです。"
+    assert local.calls == 1, "正規化して同じ質問は、検索せずに保存した結果を返すべきです。"
+    assert tool.hits == 2 and tool.misses == 1
+
+    message = tool.invoke({"name": tool.name, "args": {"query": QUERY}, "id": "call-1", "type": "tool_call"})
+    assert isinstance(message, ToolMessage) and message.name == "tavily_search_results_json"
+
+def test_cached_search_expires(tmp_path):
+    """
+    保持する時間を過ぎた検索結果は使わず、もう一度検索するかをテスト。
+    他のワーカー（別の接続）からも保存した結果を使えるかもテスト。
+    """
+    tool, local = cached_tool(tmp_path, ttl_seconds=0.2)
+    tool.invoke({"query": QUERY})
+    other = SearchResultStore(str(tmp_path / "search_cache.db"), ttl_seconds=0.2)
+    assert other.get("local:2", QUERY.lower()) == RESULTS, "同じファイルを開いた別の接続からも読めるべきです。"
+    time.sleep(0.3)
+    tool.invoke({"query": QUERY})
+    assert local.calls == 2, "期限切れの結果は使わず、もう一度検索するべきです。"
+
+def test_create_search_tool_local_backend(tmp_path, monkeypatch):
+    """
+    環境変数でローカルの検索に切り替え、キャッシュの無効化もできるかをテスト。
+    """
+    results_path = tmp_path / "results.json"
+    results_path.write_text('{"東京駅のイベント": [{"url": "u", "content": "c"}]}', encoding="utf-8")
+    monkeypatch.setenv("SEARCH_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_SEARCH_RESULTS", str(results_path))
+
+    tool = create_search_tool(str(tmp_path / "search_cache.db"))
+    assert isinstance(tool, CachedSearchTool) and tool.name == "tavily_search_results_json"
+    assert tool.invoke({"query": "東京駅のイベント"}) == [{"url": "u", "content": "c"}]
+
+    monkeypatch.setenv("SEARCH_CACHE_TTL_SECONDS", "0")
+    assert isinstance(create_search_tool(str(tmp_path / "search_cache.db")), LocalSearchTool), \
+        "保持する時間が0の場合はキャッシュを付けないべきです。"
@@ -0,0 +1,118 @@
+import time
+import asyncio
+import threading
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from common.tool_executor import ParallelToolExecutor, create_tool_node, TIMEOUT_MARKER
+
+cancelled = []
+
+@tool
+def retrieve_company_rules(query: str) -> str:
+    """社内規則を検索します（テスト用）。"""
+    time.sleep(0.3)
+    return f"規則: {query}"
+
+@tool
+def web_search(query: str) -> str:
+    """Web検索をします（テスト用）。"""
+    time.sleep(0.3)
+    return f"検索結果: {query}"
+
+@tool
+def hung_search(query: str) -> str:
+    """応答しない検索です（テスト用）。"""
+    time.sleep(2)
+    return "届かない結果"
+
+@tool
+async def ahung_search(query: str) -> str:
+    """応答しない検索の非同期版です（テスト用）。"""
+    try:
+        await asyncio.sleep(2)
+    except asyncio.CancelledError:
+        cancelled.append(query)
+        raise
+    return "届かない結果"
+
+@tool
+def broken_tool(query: str) -> str:
+    """例外を送出するツールです（テスト用）。"""
+    raise ValueError("壊れています")
+
+def tool_calls_state(*names):
+    calls = [{"name": name, "args": {"query": "有給休暇"}, "id": f"call_{i}"} for i, name in enumerate(names)]
+    return {"messages": [AIMessage(content="", tool_calls=calls)]}
+
+def test_tools_run_in_parallel():
+    """
+    複数のツール呼び出しが並列に実行され、呼び出し順に結果が返るかをテスト。
+    """
+    node = create_tool_node([retrieve_company_rules, web_search])
+    started = time.perf_counter()
+    result = node.invoke(tool_calls_state("retrieve_company_rules", "web_search"))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5, "全体の時間は合計ではなく、最も遅いツールの時間になるべきです。"
+    assert [m.content for m in result["messages"]] == ["規則: 有給休暇", "検索結果: 有給休暇"]
+    assert [m.tool_call_id for m in result["messages"]] == ["call_0", "call_1"]
+
+def test_tool_timeout_returns_partial_results():
+    """
+    制限時間を過ぎたツールは打ち切られ、他のツールの結果は返るかをテスト。
+    """
+    executor = ParallelToolExecutor([retrieve_company_rules, hung_search], timeouts={"hung_search": 0.5})
+    started = time.perf_counter()
+    result = executor.invoke(tool_calls_state("retrieve_company_rules", "hung_search"))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0, "応答しないツールを待ち続けるべきではありません。"
+    rules, search = result["messages"]
+    assert rules.content == "規則: 有給休暇", "間に合ったツールの結果は返るべきです。"
+    assert search.content.startswith(TIMEOUT_MARKER) and search.status == "error", "打ち切ったツールには目印を付けるべきです。"
+    assert search.tool_call_id == "call_1"
+
+def test_hung_tools_do_not_block_other_requests():
+    """
+    ほかのリクエストの応答しないツールがスレッドを使い続けていても、ツールがすぐに始まり、
+    制限時間は実行を始めた時刻から数えられるかをテスト。
+    """
+    executor = ParallelToolExecutor([retrieve_company_rules, hung_search], timeouts={"hung_search": 0.2})
+    hung = [threading.Thread(target=executor.invoke, args=(tool_calls_state(*["hung_search"] * 8),))
+            for _ in range(2)]
+    for thread in hung:
+        thread.start()
+    time.sleep(0.3)
+
+    started = time.perf_counter()
+    result = executor.invoke(tool_calls_state("retrieve_company_rules"))
+    elapsed = time.perf_counter() - started
+    assert result["messages"][0].content == "規則: 有給休暇", "ほかのリクエストのツールが応答しなくても実行されるべきです。"
+    assert elapsed < 0.6, "ほかのリクエストのツールの終わりを待つべきではありません。"
+    for thread in hung:
+        thread.join()
+
+def test_async_tool_timeout_cancels_tool():
+    """
+    非同期版では、制限時間を過ぎたツールがキャンセルされるかをテスト。
+    """
+    node = create_tool_node([web_search, ahung_search], timeouts={"ahung_search": 0.5})
+    started = time.perf_counter()
+    result = asyncio.run(node.ainvoke(tool_calls_state("web_search", "ahung_search")))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0, "応答しないツールを待ち続けるべきではありません。"
+    assert result["messages"][0].content == "検索結果: 有給休暇"
+    assert result["messages"][1].content.startswith(TIMEOUT_MARKER)
+    assert cancelled == ["有給休暇"], "制限時間を過ぎたツールはキャンセルされるべきです。"
+
+def test_tool_errors_are_returned_as_messages():
+    """
+    ツールの例外や存在しないツールの呼び出しが、エラーのToolMessageとして返るかをテスト。
+    """
+    node = create_tool_node([broken_tool])
+    result = node.invoke(tool_calls_state("broken_tool", "unknown_tool"))
+
+    broken, unknown = result["messages"]
+    assert broken.status == "error" and "壊れています" in broken.content, "ツールの例外はエラーとして返すべきです。"
+    assert unknown.status == "error" and "unknown_tool" in unknown.content, "存在しないツールはエラーとして返すべきです。"
@@ -0,0 +1,138 @@
+import time
+import asyncio
+import threading
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+# ツール1回あたりの制限時間（秒）の既定値
+DEFAULT_TOOL_TIMEOUT_SECONDS = 20.0
+# 制限時間を過ぎたツールの結果に付ける目印
+TIMEOUT_MARKER = "[timeout]"
+
+# ===== ツール呼び出し1つを実行するスレッド =====
+class _ToolThread(threading.Thread):
+    """
+    ツール呼び出し1つを実行するスレッドです（同期版）。制限時間は実行を始めた時刻から数えます。
+    """
+
+    def __init__(self, run, call, config):
+        super().__init__(name=f"tool-{call['name']}", daemon=True)
+        self._run = run
+        self.call = call
+        self.config = config
+        self.started_at = None
+        self.result = None
+        self._begun = threading.Event()
+
+    def run(self):
+        self.started_at = time.monotonic()
+        self._begun.set()
+        self.result = self._run(self.call, self.config)
+
+    def wait(self, timeout):
+        """
+        実行を始めてから timeout 秒まで待ち、結果を返します。間に合わなかった場合は None を返します。
+        """
+        self._begun.wait()
+        self.join(max(self.started_at + timeout - time.monotonic(), 0))
+        return None if self.is_alive() else self.result
+
+# ===== ツールの並列実行 =====
+class ParallelToolExecutor:
+    """
+    1つのAIMessageに含まれる複数のツール呼び出しを並列に実行します（ToolNodeの代わり）。
+    全体の待ち時間は各ツールの合計ではなく、最も遅いツールの時間になります。
+    ツール毎に制限時間を設け、間に合わなかったツールは打ち切って目印付きの結果を返すため、
+    1つのツールが応答しなくても、他のツールの結果でモデルが回答を続けられます。
+    """
+
+    def __init__(self, tools, timeouts=None, default_timeout=DEFAULT_TOOL_TIMEOUT_SECONDS):
+        self.tools = {tool.name: tool for tool in tools}
+        # ツール名 → 制限時間（秒）
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+
+    def timeout_for(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _tool_calls(self, state):
+        return state["messages"][-1].tool_calls
+
+    def _unknown_tool(self, call):
+        return ToolMessage(
+            content=f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools)}].",
+            name=call["name"], tool_call_id=call["id"], status="error",
+        )
+
+    def _timed_out(self, call):
+        timeout = self.timeout_for(call["name"])
+        return ToolMessage(
+            content=f"{TIMEOUT_MARKER} ツール {call['name']} が{timeout:g}秒以内に応答しなかったため、結果はありません。"
+                    "他の情報から回答してください。",
+            name=call["name"], tool_call_id=call["id"], status="error",
+        )
+
+    def _failed(self, call, error):
+        return ToolMessage(
+            content=f"Error: {error!r}\n Please fix your mistakes.",
+            name=call["name"], tool_call_id=call["id"], status="error",
+        )
+
+    def _run_one(self, call, config):
+        """
+        ツールを1つ実行し、ToolMessageを返します（エラーはToolMessageとして返す）。
+        """
+        try:
+            return self.tools[call["name"]].invoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            return self._failed(call, e)
+
+    def invoke(self, state, config=None):
+        """
+        ツール呼び出しをスレッドで並列に実行し、呼び出しと同じ順に結果を返します。
+        スレッドは呼び出し毎に作るため（共有のスレッドプールを使わない）、ほかのリクエストのツールを待たずにすぐ始まり、
+        制限時間を過ぎても止められないスレッドが残っても、ほかのリクエストのツールは妨げられません。
+        """
+        threads = {}
+        for call in self._tool_calls(state):
+            if call["name"] in self.tools:
+                threads[call["id"]] = _ToolThread(self._run_one, call, config)
+                threads[call["id"]].start()
+
+        messages = []
+        for call in self._tool_calls(state):
+            thread = threads.get(call["id"])
+            if thread is None:
+                messages.append(self._unknown_tool(call))
+                continue
+            # 制限時間を過ぎたスレッドは止められないため、結果を待たずに打ち切る
+            message = thread.wait(self.timeout_for(call["name"]))
+            messages.append(message if message is not None else self._timed_out(call))
+        return {"messages": messages}
+
+    async def ainvoke(self, state, config=None):
+        """
+        invoke() の非同期版です。制限時間を過ぎたツールはキャンセルします。
+        """
+        async def run(call):
+            if call["name"] not in self.tools:
+                return self._unknown_tool(call)
+            try:
+                return await asyncio.wait_for(
+                    self.tools[call["name"]].ainvoke({**call, "type": "tool_call"}, config),
+                    timeout=self.timeout_for(call["name"]),
+                )
+            except asyncio.TimeoutError:
+                return self._timed_out(call)
+            except Exception as e:
+                return self._failed(call, e)
+
+        messages = await asyncio.gather(*(run(call) for call in self._tool_calls(state)))
+        return {"messages": list(messages)}
+
+def create_tool_node(tools, timeouts=None, default_timeout=DEFAULT_TOOL_TIMEOUT_SECONDS):
+    """
+    グラフに追加するツールノードを作成します。同期（invoke）・非同期（ainvoke）の両方で使えます。
+    """
+    executor = ParallelToolExecutor(tools, timeouts=timeouts, default_timeout=default_timeout)
+    return RunnableLambda(executor.invoke, executor.ainvoke, name="tools")
@@ -4,19 +4,23 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import uuid
-from flask import Flask, render_template, request, make_response, session 
-from original.graph import get_bot_response, get_messages_list, memory, graph, get_saved_thread_ids, build_graph
-import json
-from langchain_core.messages import messages_from_dict, messages_to_dict, HumanMessage
-
-# Flaskアプリケーションのセットアップ
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # セッション用の秘密鍵
-
-# 使用するモデル名
-MODEL_NAME = "gpt-4o-mini" 
-
-@app.route('/', methods=['GET', 'POST'])
+from flask import Flask, Blueprint, Response, render_template, request, make_response, session, jsonify
+from common.metrics import metrics, configure_trace_log, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from original.graph import get_bot_response, get_messages_list, get_messages_since, memory, get_chat_log_store, get_saved_threads, restore_messages, warm_up, startup_state
+
+# ルートをまとめるBlueprint
+bp = Blueprint('original', __name__)
+
+def thread_page():
+    """
+    保存済みスレッドの一覧で表示するページ番号をリクエストから取得します。
+    """
+    try:
+        return int(request.values.get('page', 1))
+    except ValueError:
+        return 1
+
+@bp.route('/', methods=['GET', 'POST'])
 def index():
 
     # セッションからthread_idを取得、なければ新しく生成してセッションに保存
@@ -25,9 +29,9 @@ def index():
 
     # GETリクエスト時は初期メッセージ表示
     if request.method == 'GET':
-        # メモリをクリア
-        memory.storage.clear()
-        return render_template('index.html', messages=[], saved_threads=get_saved_thread_ids())
+        # このユーザーのスレッドだけをメモリから削除
+        memory.delete_thread(session['thread_id'])
+        return render_template('index.html', messages=[], saved_threads=get_saved_threads(thread_page()))
         # response = make_response(render_template('index.html', messages=[]))
         # return response
 
@@ -41,58 +45,112 @@ def index():
     messages = get_messages_list(memory, session['thread_id'])
 
     # レスポンスを返す
-    return make_response(render_template('index.html', messages=messages, saved_threads=get_saved_thread_ids()))
+    return make_response(render_template('index.html', messages=messages, saved_threads=get_saved_threads(thread_page())))
+
+@bp.route('/messages', methods=['GET', 'POST'])
+def messages():
+    """
+    メッセージID（after）より後に追加されたメッセージだけをJSONで返します。
+    POSTの場合は、ユーザーのメッセージに応答してから返します（ページ全体は再描画しない）。
+    """
+    if request.method == 'POST':
+        if 'thread_id' not in session:
+            session['thread_id'] = str(uuid.uuid4())
+        get_bot_response(request.form['user_message'], memory, session['thread_id'])
+
+    thread_id = session.get('thread_id')
+    if thread_id is None:
+        return jsonify({'messages': [], 'cursor': None, 'reset': False})
+    return jsonify(get_messages_since(memory, thread_id, request.values.get('after')))
 
-@app.route('/clear', methods=['POST'])
+@bp.route('/clear', methods=['POST'])
 def clear():
     # セッションからthread_idを削除
-    session.pop('thread_id', None)
+    thread_id = session.pop('thread_id', None)
 
-    # メモリをクリア
-    memory.storage.clear()
+    # このユーザーのスレッドだけをメモリから削除
+    if thread_id is not None:
+        memory.delete_thread(thread_id)
     # 対話履歴を初期化
-    response = make_response(render_template('index.html', messages=[], saved_threads=get_saved_thread_ids()))
+    response = make_response(render_template('index.html', messages=[], saved_threads=get_saved_threads(thread_page())))
     return response
 
-@app.route('/save', methods=['POST'])
+@bp.route('/save', methods=['POST'])
 def save():
     thread_id = session.get('thread_id')
     if thread_id:
         logs = memory.get({"configurable": {"thread_id": thread_id}})['channel_values']['messages']
-        os.makedirs('chat_logs', exist_ok=True)
-        save_path = f'chat_logs/{thread_id}.json'
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(messages_to_dict(logs), f, ensure_ascii=False, indent=2)
-    return make_response(render_template('index.html', messages=get_messages_list(memory, thread_id), saved_threads=get_saved_thread_ids()))
+        # 前回の保存から増えたメッセージだけを追記する
+        get_chat_log_store().save(thread_id, logs)
+    return make_response(render_template('index.html', messages=get_messages_list(memory, thread_id), saved_threads=get_saved_threads(thread_page())))
 
-@app.route('/load', methods=['POST'])
+@bp.route('/load', methods=['POST'])
 def load():
     thread_id = request.form.get('thread_id')
     session['thread_id'] = thread_id
-    filepath = f'chat_logs/{thread_id}.json'
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            message_dicts = json.load(f)
-            messages = messages_from_dict(message_dicts)
-
-            # メモリを一度クリアしてから履歴を順に再生（手動注入の代替）
-            memory.storage.clear()
-
-            # graphが存在しなければ作る（初回用）
-            global graph
-            if graph is None:
-                graph = build_graph(MODEL_NAME, memory)
-
-            # 履歴のHumanMessageだけを順に再実行
-            for msg in messages:
-                if isinstance(msg, HumanMessage):
-                    graph.invoke(
-                        {"messages": [("user", msg.content)]},
-                        {"configurable": {"thread_id": thread_id}},
-                        stream_mode="values"
-                    )
-            
-    return make_response(render_template('index.html', messages=get_messages_list(memory, thread_id), saved_threads=get_saved_thread_ids()))
+    messages = get_chat_log_store().load(thread_id)
+    if messages is not None:
+        # スレッドを一度削除してから、履歴をそのままスレッドの状態に書き込む（モデルは呼ばない）
+        memory.delete_thread(thread_id)
+        restore_messages(memory, thread_id, messages)
+
+    return make_response(render_template('index.html', messages=get_messages_list(memory, thread_id), saved_threads=get_saved_threads(thread_page())))
+
+@bp.route('/threads', methods=['POST'])
+def threads():
+    # 保存済みスレッドの一覧のページを切り替える（現在の会話はそのまま表示する）
+    thread_id = session.get('thread_id')
+    has_messages = thread_id is not None and memory.get({"configurable": {"thread_id": thread_id}}) is not None
+    messages = get_messages_list(memory, thread_id) if has_messages else []
+    return make_response(render_template('index.html', messages=messages, saved_threads=get_saved_threads(thread_page())))
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    # ノード・ツールの実行時間、トークン数、往復回数をPrometheusのテキスト形式で返す
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/ready')
+def ready():
+    # 起動時の準備が完了していればリクエストを受け付けられる
+    status = 200 if startup_state['ready'] else 503
+    return jsonify(startup_state), status
+
+# ===== アプリケーションの作成 =====
+def create_app(warm=None):
+    """
+    Flaskアプリケーションを作成します。
+    リクエストを受け付ける前に、グラフ・Retriever・トークナイザーを準備します。
+    環境変数 WARMUP_ON_STARTUP=0 で準備を省略できます（ツール類からの読み込み用）。
+    """
+    if warm is None:
+        warm = os.environ.get('WARMUP_ON_STARTUP', '1') != '0'
+
+    # Flaskアプリケーションのセットアップ
+    app = Flask(__name__)
+    app.secret_key = 'your_secret_key'  # セッション用の秘密鍵
+    app.register_blueprint(bp)
+
+    # リクエスト毎のトレースの書き出し先（環境変数 TRACE_LOG）
+    configure_trace_log()
+
+    # 起動時にグラフを準備（最初のユーザーを待たせない）
+    if warm:
+        warm_up(memory)
+    return app
+
+# アプリケーションは読み込み時には作らない（テストの収集などで準備やネットワークへの接続が走らないようにする）
+# 起動方法（16_llmappディレクトリで実行）:
+#   python original/app.py
+#   flask --app "original.app:create_app()" run
+#   gunicorn "original.app:create_app()"
+# 以前の `flask --app original.app run` や `gunicorn original.app:app` も、初めて app を参照したときに作成して動く
+def __getattr__(name):
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # デバッグの自動再読み込みでは、ファイルを監視する親プロセスでは準備せず、アプリを動かす子プロセスだけで準備する
+    reloader_parent = os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    create_app(warm=False if reloader_parent else None).run(debug=True)
\ No newline at end of file
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from langchain_core.messages import HumanMessage, messages_from_dict, messages_to_dict
+
+# 保存した履歴の既定のパス
+DEFAULT_CHAT_LOG_DB = "chat_logs/chat_logs.db"
+# 1ページに表示するスレッドの数
+DEFAULT_PAGE_SIZE = 20
+# タイトル（最初のユーザーの発言）の最大文字数
+TITLE_LENGTH = 40
+# 以前の形式の履歴を取り込み済みかを記録するキー
+JSON_LOGS_IMPORTED_KEY = "json_logs_imported"
+
+def digest_records(records):
+    """
+    保存するメッセージ（JSON文字列）のリストのハッシュ値を返します。
+    """
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update(record.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+def make_title(messages):
+    """
+    最初のユーザーの発言の1行目を、スレッドのタイトルにします。
+    """
+    for message in messages:
+        if isinstance(message, HumanMessage) and isinstance(message.content, str) and message.content.strip():
+            return message.content.strip().splitlines()[0][:TITLE_LENGTH]
+    return ""
+
+# ===== 履歴の保存先 =====
+class ChatLogStore:
+    """
+    保存した会話の履歴を、SQLiteファイル（WALモード）に保存します。
+    メッセージは1件ずつ行として追記し、保存のたびに増えた分だけを書き込みます。
+    スレッド毎のタイトル・最終更新時刻・メッセージ数を別の表に持つため、
+    保存済みのスレッドの一覧はファイル数によらず、1ページ分だけを読み込みます。
+    """
+
+    def __init__(self, path=DEFAULT_CHAT_LOG_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS threads ("
+            " thread_id TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " message_count INTEGER NOT NULL,"
+            " digest TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " thread_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " message TEXT NOT NULL,"
+            " PRIMARY KEY (thread_id, position))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def save(self, thread_id, messages, updated_at=None):
+        """
+        スレッドのメッセージを保存し、追記したメッセージの数を返します。
+        前回の保存から増えたメッセージだけを追記します（保存済みの部分が変わっていた場合は書き直す）。
+        """
+        records = [json.dumps(record, ensure_ascii=False) for record in messages_to_dict(messages)]
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT message_count, digest FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            count = 0
+            # 保存済みのメッセージと先頭が一致していれば、続きだけを追記する
+            if row and row[0] <= len(records) and digest_records(records[:row[0]]) == row[1]:
+                count = row[0]
+            self.conn.execute("DELETE FROM messages WHERE thread_id = ? AND position >= ?", (thread_id, count))
+            self.conn.executemany(
+                "INSERT INTO messages (thread_id, position, message) VALUES (?, ?, ?)",
+                [(thread_id, position, records[position]) for position in range(count, len(records))],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, title, updated_at, message_count, digest)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (thread_id, make_title(messages), updated_at or time.time(), len(records), digest_records(records)),
+            )
+        return len(records) - count
+
+    def load(self, thread_id):
+        """
+        保存したメッセージのリストを返します。保存されていなければ None を返します。
+        """
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,)).fetchone() is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT message FROM messages WHERE thread_id = ? ORDER BY position", (thread_id,)).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def delete(self, thread_id):
+        """
+        保存したスレッドを削除します。
+        """
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+
+    def list_threads(self, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """
+        保存したスレッドを新しい順に page ページ目（1から）の分だけ返します。
+        各要素は thread_id・title・updated_at・message_count を持つ辞書です。
+        """
+        offset = (max(page, 1) - 1) * page_size
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, title, updated_at, message_count FROM threads"
+                " ORDER BY updated_at DESC, thread_id LIMIT ? OFFSET ?",
+                (page_size, offset),
+            ).fetchall()
+        return [
+            {"thread_id": thread_id, "title": title, "updated_at": updated_at, "message_count": message_count}
+            for thread_id, title, updated_at, message_count in rows
+        ]
+
+    def count_threads(self):
+        """
+        保存したスレッドの数を返します。
+        """
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+    def import_json_logs(self, directory):
+        """
+        以前の形式（directory/<thread_id>.json）で保存された履歴のうち、まだ取り込んでいないものを取り込みます。
+        最終更新時刻にはファイルの更新時刻を使います。取り込んだスレッドの数を返します。
+        取り込みは一度だけ行い（移行）、取り込んだことをデータベースに記録して、次からはディレクトリを読みません。
+        """
+        with self._lock:
+            done = self.conn.execute(
+                "SELECT 1 FROM meta WHERE key = ?", (JSON_LOGS_IMPORTED_KEY,)).fetchone() is not None
+        if done:
+            return 0
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        imported = 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            thread_id = name[:-len(".json")]
+            with self._lock:
+                exists = self.conn.execute(
+                    "SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,)).fetchone() is not None
+            if exists:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    messages = messages_from_dict(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError):
+                # 壊れたファイルは取り込まない
+                continue
+            self.save(thread_id, messages, updated_at=os.path.getmtime(path))
+            imported += 1
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              (JSON_LOGS_IMPORTED_KEY, str(time.time())))
+        return imported
+
+# ===== 保存先の作成 =====
+def create_chat_log_store():
+    """
+    保存した履歴のストアを作成します。環境変数 CHAT_LOG_DB でパスを変更できます。
+    同じディレクトリにある以前の形式（<thread_id>.json）の履歴は、初めて作成したときに一度だけ取り込みます。
+    """
+    path = os.environ.get("CHAT_LOG_DB", DEFAULT_CHAT_LOG_DB)
+    store = ChatLogStore(path)
+    store.import_json_logs(os.path.dirname(os.path.abspath(path)))
+    return store
@@ -1,19 +1,75 @@
 window.onload = function() {
   // チャットボックスを取得
   const chatBox = document.getElementById('chat-box');
-  
+
   // チャットボックスのスクロールを一番下に設定
   chatBox.scrollTop = chatBox.scrollHeight;
 
   // Ctrl + Enterでフォームを送信
   const form = document.getElementById('chat-form');
   const textarea = document.getElementById('user-input');
+  const submitButton = document.getElementById('submit-button');
+
+  // fetchに対応していないブラウザでは通常のフォーム送信を使う
+  const canFetch = !!window.fetch;
 
   textarea.addEventListener('keydown', function(event) {
       // Ctrl + Enterが押された場合
       if (event.ctrlKey && event.key === 'Enter') {
           event.preventDefault();  // デフォルトの動作（改行など）を防止
-          form.submit();  // フォームを送信
+          if (canFetch) {
+              sendMessage();  // 追加されたメッセージだけを受け取る
+          } else {
+              form.submit();  // フォームを送信
+          }
       }
   });
-}
\ No newline at end of file
+
+  if (canFetch) {
+      form.addEventListener('submit', function(event) {
+          event.preventDefault();  // ページの再読み込みを防止
+          sendMessage();
+      });
+  }
+
+  // 受け取ったメッセージをチャットボックスに追加
+  function appendMessages(data) {
+      if (data.reset) {
+          chatBox.innerHTML = '';
+      }
+      data.messages.forEach(function(item) {
+          const message = document.createElement('div');
+          message.className = item.class;
+          message.innerHTML = item.text;
+          chatBox.appendChild(message);
+      });
+      chatBox.dataset.cursor = data.cursor || '';
+      chatBox.scrollTop = chatBox.scrollHeight;
+  }
+
+  // メッセージを送信し、前回受け取ったメッセージより後に追加されたメッセージだけを表示
+  async function sendMessage() {
+      const userMessage = textarea.value.trim();
+      if (!userMessage || submitButton.disabled) {
+          return;
+      }
+      submitButton.disabled = true;
+
+      try {
+          const response = await fetch('/messages', {
+              method: 'POST',
+              body: new URLSearchParams({ user_message: userMessage, after: chatBox.dataset.cursor || '' }),
+          });
+          if (!response.ok) {
+              throw new Error(response.status);
+          }
+          appendMessages(await response.json());
+          textarea.value = '';
+      } catch (error) {
+          alert('エラーが発生しました: ' + error);
+      } finally {
+          submitButton.disabled = false;
+          textarea.focus();
+      }
+  }
+}
@@ -1,16 +1,29 @@
 import pytest
 from flask import session
-from original.app import app
-from original.graph import memory, get_messages_list
-import os
-import json
-from pathlib import Path
+from langgraph.checkpoint.base import empty_checkpoint
+from original.app import create_app
+from original.graph import memory, get_messages_list, get_chat_log_store
 
 USER_MESSAGE_1 = "1たす2は？"
 USER_MESSAGE_2 = "東京駅のイベントの検索結果を教えて"
 
+def put_checkpoint(thread_id):
+    """
+    スレッドのチェックポイントを作成し、その設定を返します（モデルは呼ばない）。
+    """
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    memory.put(config, empty_checkpoint(), {}, {})
+    return config
+
+@pytest.fixture(scope="module")
+def app():
+    """
+    Flaskアプリケーションを作成（起動時の準備も行う）。テストの収集時には作成しない。
+    """
+    return create_app()
+
 @pytest.fixture
-def client():
+def client(app):
     """
     Flaskテストクライアントを作成。
     """
@@ -23,12 +36,27 @@ def client():
 
 def test_index_get_request(client):
     """
-    GETリクエストで初期画面が正しく表示されるかをテスト。
+    GETリクエストで初期画面が正しく表示され、このセッションのスレッドだけがメモリから削除されるかをテスト。
     """
+    with client.session_transaction() as session:
+        session['thread_id'] = 'test-index-get'
+    own = put_checkpoint('test-index-get')
+    other = put_checkpoint('test-index-get-other')
+
     response = client.get('/')
     assert response.status_code == 200, "GETリクエストに対してステータスコード200を返すべきです。"
     assert b"<form" in response.data, "HTMLにフォーム要素が含まれている必要があります。"
-    assert memory.storage == {}, "GETリクエストでメモリが初期化されるべきです。"
+    assert memory.get_tuple(own) is None, "GETリクエストでこのセッションのスレッドが削除されるべきです。"
+    assert memory.get_tuple(other) is not None, "ほかのスレッドは削除されるべきではありません。"
+    memory.delete_thread('test-index-get-other')
+
+def test_ready_endpoint(client):
+    """
+    起動時の準備が完了し、/readyエンドポイントが200を返すかをテスト。
+    """
+    response = client.get('/ready')
+    assert response.status_code == 200, "ウォームアップ後は/readyが200を返すべきです。"
+    assert response.get_json()['ready'] is True, "ウォームアップ後はready=Trueであるべきです。"
 
 def test_index_post_request(client):
     """
@@ -64,6 +92,18 @@ def test_memory_persistence_with_session(client):
     assert any("1たす2" in msg['text'] for msg in messages if msg['class'] == 'user-message'), "メモリに最初のユーザーメッセージが保存されるべきです。"
     assert any("東京駅" in msg['text'] for msg in messages if msg['class'] == 'user-message'), "メモリに2番目のユーザーメッセージが保存されるべきです。"
 
+def test_messages_post_returns_only_new_messages(client):
+    """
+    /messagesエンドポイントへのPOSTが、応答後に追加されたメッセージだけをJSONで返すかをテスト。
+    """
+    first = client.post('/messages', data={'user_message': USER_MESSAGE_1}).get_json()
+    assert any("1たす2" in msg['text'] for msg in first['messages']), "ユーザーのメッセージを返すべきです。"
+    assert any(msg['class'] == 'bot-message' for msg in first['messages']), "ボットの応答を返すべきです。"
+
+    second = client.post('/messages', data={'user_message': USER_MESSAGE_2, 'after': first['cursor']}).get_json()
+    assert not any("1たす2" in msg['text'] for msg in second['messages']), "取得済みのメッセージは返さないべきです。"
+    assert any("東京駅" in msg['text'] for msg in second['messages']), "追加されたメッセージを返すべきです。"
+
 def test_clear_endpoint(client):
     """
     /clearエンドポイントがセッションとメモリを正しくリセットするかをテスト。
@@ -86,9 +126,9 @@ def test_clear_endpoint(client):
     cleared_messages = memory.get({"configurable": {"thread_id": thread_id}})
     assert cleared_messages is None, "メモリは/clearエンドポイント後にクリアされるべきです。"
 
-def test_save_chat_history_creates_json_file(client):
+def test_save_chat_history_to_store(client):
     """
-    /saveエンドポイントがチャット履歴をJSONファイルに保存できるかをテスト。
+    /saveエンドポイントがチャット履歴を保存し、保存済みスレッドの一覧に表示されるかをテスト。
     """
     # チャット1回
     client.post('/', data={'user_message': USER_MESSAGE_1})
@@ -102,18 +142,17 @@ def test_save_chat_history_creates_json_file(client):
     response = client.post('/save')
     assert response.status_code == 200, "/save エンドポイントはステータスコード200を返すべきです。"
 
-    # 保存されたファイルの存在を確認
-    save_path = Path(f'chat_logs/{thread_id}.json')
-    assert save_path.exists(), f"chat_logs/{thread_id}.json が保存されている必要があります。"
+    # 保存された内容を検証
+    saved = get_chat_log_store().load(thread_id)
+    assert saved is not None, "スレッドが保存されている必要があります。"
+    assert any("1たす2" in msg.content for msg in saved), "ユーザーの発言が保存されている必要があります。"
+    assert thread_id in response.data.decode('utf-8'), "保存したスレッドが一覧に表示されるべきです。"
 
-    # ファイル内容を検証
-    with open(save_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        assert isinstance(data, list), "保存されたデータはリスト形式である必要があります。"
-        assert any("1たす2" in msg.get("data", {}).get("content", "") for msg in data), "ユーザーの発言が保存ファイルに含まれている必要があります。"
+    # 2回目の保存では、増えたメッセージだけを追記する
+    assert get_chat_log_store().save(thread_id, saved) == 0, "変更のない履歴は追記しないべきです。"
 
     # テスト後の後始末
-    os.remove(save_path)
+    get_chat_log_store().delete(thread_id)
 
 def test_load_chat_history_restores_memory(client):
     """
@@ -127,11 +166,12 @@ def test_load_chat_history_restores_memory(client):
         thread_id = session.get('thread_id')
         assert thread_id is not None, "セッションにthread_idが存在する必要があります。"
 
+    saved_messages = get_messages_list(memory, thread_id)
+
     # 3. /save で履歴を保存
-    save_path = Path(f'chat_logs/{thread_id}.json')
     response = client.post('/save')
     assert response.status_code == 200
-    assert save_path.exists(), "保存ファイルが存在する必要があります。"
+    assert get_chat_log_store().load(thread_id) is not None, "履歴が保存されている必要があります。"
 
     # 4. メモリとセッションをリセット（履歴がなくなることを確認）
     client.post('/clear')
@@ -151,6 +191,7 @@ def test_load_chat_history_restores_memory(client):
     messages = get_messages_list(memory, thread_id)
     assert len(messages) >= 2, "読み込んだメッセージがメモリに復元されている必要があります。"
     assert any("1たす2" in msg['text'] for msg in messages if msg['class'] == 'user-message'), "元のユーザーメッセージが復元されている必要があります。"
+    assert messages == saved_messages, "モデルを再実行せず、保存時と同じ履歴が復元されている必要があります。"
 
-    # 8. 後始末：保存ファイルを削除
-    os.remove(save_path)
+    # 8. 後始末：保存した履歴を削除
+    get_chat_log_store().delete(thread_id)
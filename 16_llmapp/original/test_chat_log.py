@@ -0,0 +1,76 @@
+import os
+import json
+from langchain_core.messages import HumanMessage, AIMessage, messages_to_dict
+from original.chat_log import ChatLogStore
+
+def conversation(n):
+    """
+    テスト用の会話。n 往復のメッセージを作ります。
+    """
+    messages = []
+    for i in range(n):
+        messages += [HumanMessage(content=f"質問{i}\n詳細"), AIMessage(content=f"回答{i}")]
+    return messages
+
+def test_save_appends_only_new_messages(tmp_path):
+    """
+    保存のたびに増えたメッセージだけを追記し、読み込むと同じ履歴になるかをテスト。
+    """
+    store = ChatLogStore(str(tmp_path / "chat_logs.db"))
+    assert store.load("thread-1") is None, "保存していないスレッドは None を返すべきです。"
+
+    assert store.save("thread-1", conversation(1)) == 2
+    assert store.save("thread-1", conversation(2)) == 2, "増えた2件だけを追記するべきです。"
+    assert store.save("thread-1", conversation(2)) == 0
+    assert store.load("thread-1") == conversation(2)
+
+    # 途中のメッセージが変わった場合は書き直す
+    changed = [HumanMessage(content="別の質問")] + conversation(2)[1:]
+    assert store.save("thread-1", changed) == 4
+    assert store.load("thread-1") == changed
+
+    # 短くなった場合も書き直し、保存した履歴と同じになる
+    assert store.save("thread-1", changed[:1]) == 1
+    assert store.load("thread-1") == changed[:1]
+
+def test_list_threads_paginated(tmp_path):
+    """
+    保存済みのスレッドを新しい順に、ページ単位で取得できるかをテスト。
+    """
+    store = ChatLogStore(str(tmp_path / "chat_logs.db"))
+    for n in range(5):
+        store.save(f"thread-{n}", conversation(n + 1), updated_at=1000 + n)
+
+    assert store.count_threads() == 5
+    first = store.list_threads(page=1, page_size=2)
+    assert [t["thread_id"] for t in first] == ["thread-4", "thread-3"], "新しい順に並ぶべきです。"
+    assert first[0]["title"] == "質問0", "最初のユーザーの発言の1行目をタイトルにするべきです。"
+    assert first[0]["message_count"] == 10
+    assert [t["thread_id"] for t in store.list_threads(page=3, page_size=2)] == ["thread-0"]
+
+    store.delete("thread-4")
+    assert store.count_threads() == 4 and store.load("thread-4") is None
+
+def test_import_json_logs(tmp_path):
+    """
+    以前の形式（<thread_id>.json）の履歴を一度だけ取り込めるかをテスト。
+    """
+    directory = tmp_path / "chat_logs"
+    directory.mkdir()
+    with open(directory / "old-thread.json", "w", encoding="utf-8") as f:
+        json.dump(messages_to_dict(conversation(2)), f, ensure_ascii=False, indent=2)
+    (directory / "broken.json").write_text("{", encoding="utf-8")
+    os.utime(directory / "old-thread.json", (1234, 1234))
+
+    store = ChatLogStore(str(directory / "chat_logs.db"))
+    assert store.import_json_logs(str(directory)) == 1, "壊れたファイルは取り込まないべきです。"
+    assert store.load("old-thread") == conversation(2)
+    assert store.list_threads()[0]["updated_at"] == 1234, "ファイルの更新時刻を最終更新時刻にするべきです。"
+    assert store.import_json_logs(str(directory)) == 0, "取り込み済みの履歴は再び取り込まないべきです。"
+
+    # 取り込みは一度だけの移行。開き直しても、後から置いたファイルは読まない
+    with open(directory / "new-thread.json", "w", encoding="utf-8") as f:
+        json.dump(messages_to_dict(conversation(1)), f, ensure_ascii=False)
+    store = ChatLogStore(str(directory / "chat_logs.db"))
+    assert store.import_json_logs(str(directory)) == 0, "取り込みは一度だけ行うべきです。"
+    assert store.load("new-thread") is None
@@ -1,5 +1,4 @@
 import pytest
-from langchain_openai import OpenAIEmbeddings
 from chatbot.graph import (
     get_bot_response,
     get_messages_list,
@@ -7,6 +6,7 @@ from chatbot.graph import (
     build_graph,
     define_tools,
     create_index,
+    create_embedding_model,
 )
 
 # モック用のテストデータ
@@ -43,7 +43,7 @@ def test_create_index():
     create_index関数がインデックスを正しく構築するかをテスト。
     """
     persist_directory = "./test_chroma_db"
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+    embedding_model = create_embedding_model()
 
     try:
         index = create_index(persist_directory, embedding_model)
@@ -102,6 +102,43 @@ def test_build_graph(setup_memory):
     )
     assert response["messages"][-1].content, "グラフが有効な応答を生成する必要があります。"
 
+def test_build_graph_without_tools(setup_memory):
+    """
+    ツールがない場合（ツールセット none）も、ツールを渡さずにモデルを呼び出して応答できるかをテスト。
+    """
+    graph = build_graph("gpt-4o-mini", setup_memory, tools=[])
+    assert "tools" not in graph.nodes, "ツールがない場合はツールノードを作るべきではありません。"
+    response = graph.invoke(
+        {"messages": [("user", USER_MESSAGE_1)]},
+        {"configurable": {"thread_id": THREAD_ID}},
+        stream_mode="values"
+    )
+    assert "3" in response["messages"][-1].content, "1たす2の計算結果が正しく応答されるべきです。"
+
+def test_build_graph_routes_simple_turns(setup_memory):
+    """
+    ツールの要らない発言はツールなしの回答に、社内規程の質問はエージェントに振り分けられるかをテスト。
+    """
+    from common.metrics import metrics
+
+    graph = build_graph("gpt-4o-mini", setup_memory, route_simple_turns=True)
+    simple = metrics.routes.value(route="simple")
+    response = graph.invoke(
+        {"messages": [("user", USER_MESSAGE_1)]},
+        {"configurable": {"thread_id": THREAD_ID}},
+        stream_mode="values"
+    )
+    assert "3" in response["messages"][-1].content, "1たす2の計算結果が正しく応答されるべきです。"
+    assert metrics.routes.value(route="simple") == simple + 1, "計算の質問はツールなしの回答に振り分けるべきです。"
+
+    agent = metrics.routes.value(route="agent")
+    graph.invoke(
+        {"messages": [("user", USER_MESSAGE_3)]},
+        {"configurable": {"thread_id": THREAD_ID}},
+        stream_mode="values"
+    )
+    assert metrics.routes.value(route="agent") == agent + 1, "社内規程の質問はエージェントに振り分けるべきです。"
+
 def test_get_messages_list(setup_memory):
     """
     メモリ内のメッセージリストが正しく取得されるかをテスト。